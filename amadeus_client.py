@@ -1,28 +1,277 @@
+import copy
 import os
-from amadeus import Client
-from dotenv import load_dotenv
+import random
+import threading
+import time
+from collections import deque
 
-load_dotenv()
+import requests
+import urllib3
+
+from utils.ratelimit import TokenBucket
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except Exception:
+    pass
+
+# Amadeus Self-Service: 10 transactions/s on the test environment (no more than 1 per 100ms)
+BASE_URL = os.getenv("AMADEUS_BASE_URL", "https://test.api.amadeus.com")
+RATE = float(os.getenv("AMADEUS_RATE", "10"))
+BURST = float(os.getenv("AMADEUS_BURST", "1"))
+MAX_RETRIES = int(os.getenv("AMADEUS_MAX_RETRIES", "4"))
+TIMEOUT = float(os.getenv("AMADEUS_TIMEOUT", "20"))
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class AmadeusError(Exception):
+    def __init__(self, msg, status=None):
+        super().__init__(msg)
+        self.status = status
+
+
+class AmadeusClient:
+    """
+    Flight Offers Search over HTTP with:
+      - one requests.Session (keep-alive connection pool) per client
+      - the OAuth token reused until shortly before it expires (refreshed once on 401)
+      - a token bucket matching the API quota (rate requests/s, burst)
+      - exponential backoff with full jitter on 429 / 5xx / network errors
+        (Retry-After is honoured when present), for the token request too
+      - every failure surfaces as AmadeusError (transport errors included)
+      - per-call latency metrics (metrics())
+    """
+
+    def __init__(self, client_id=None, client_secret=None, base_url=BASE_URL, rate=RATE, burst=BURST,
+                 max_retries=MAX_RETRIES, backoff_base=0.5, backoff_max=8.0, timeout=TIMEOUT,
+                 session=None, pool_size=16):
+        self.client_id = client_id if client_id is not None else os.getenv("AMADEUS_API_KEY")
+        self.client_secret = client_secret if client_secret is not None else os.getenv("AMADEUS_API_SECRET")
+        self.base_url = base_url.rstrip("/")
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        self.session = session
+        self._token = None
+        self._token_expires = 0.0
+        self._token_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self.counters = {"calls": 0, "retries": 0, "errors": 0, "token_refreshes": 0, "throttled_s": 0.0}
+
+    # -------------------------
+    # OAuth
+    # -------------------------
+    def _access_token(self, force=False):
+        with self._token_lock:
+            if not force and self._token and time.time() < self._token_expires:
+                return self._token
+            if not self.client_id or not self.client_secret:
+                raise AmadeusError("AMADEUS_API_KEY / AMADEUS_API_SECRET not set")
+            resp = self._send(
+                "POST", f"{self.base_url}/v1/security/oauth2/token",
+                data={"grant_type": "client_credentials", "client_id": self.client_id,
+                      "client_secret": self.client_secret},
+            )
+            try:
+                if resp.status_code != 200:
+                    raise AmadeusError(f"token request failed: HTTP {resp.status_code}", resp.status_code)
+                body = resp.json()
+                token = body["access_token"]
+            except (ValueError, KeyError, TypeError, requests.RequestException) as e:
+                raise AmadeusError(f"token request failed: invalid response ({e})")
+            finally:
+                resp.close()
+            self._token = token
+            # refresh a minute early
+            self._token_expires = time.time() + max(float(body.get("expires_in", 1799)) - 60, 1)
+            self.counters["token_refreshes"] += 1
+            return self._token
+
+    # -------------------------
+    # HTTP
+    # -------------------------
+    def _backoff(self, attempt, resp=None):
+        retry_after = resp.headers.get("Retry-After") if resp is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _send(self, method, url, **kwargs):
+        """
+        One request under the quota and retry policy: token bucket, then up to
+        max_retries retries with backoff on network errors and RETRY_STATUS.
+        Returns the final response (the caller checks its status and closes
+        it); responses given up on are closed before the next attempt.
+        Raises AmadeusError when the network errors persist.
+        """
+        attempt = 0
+        while True:
+            waited = self.bucket.acquire()
+            with self._metrics_lock:
+                self.counters["throttled_s"] += waited
+            resp = None
+            try:
+                resp = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            except requests.RequestException as e:
+                if attempt >= self.max_retries:
+                    raise AmadeusError(f"network error: {e}")
+            else:
+                if resp.status_code not in RETRY_STATUS or attempt >= self.max_retries:
+                    return resp
+                # release the pooled connection (a streamed body is never read otherwise)
+                resp.close()
+            with self._metrics_lock:
+                self.counters["retries"] += 1
+            time.sleep(self._backoff(attempt, resp))
+            attempt += 1
+
+    def get(self, path, params=None, parse=None):
+        """
+        GET an API path; returns the decoded JSON body, or parse(response) when
+        given (the body is then streamed). Raises AmadeusError.
+        """
+        t0 = time.perf_counter()
+        refreshed = False
+        try:
+            while True:
+                headers = {"Authorization": f"Bearer {self._access_token()}"}
+                resp = self._send("GET", f"{self.base_url}{path}", params=params, headers=headers,
+                                  stream=parse is not None)
+                try:
+                    if resp.status_code == 401 and not refreshed:
+                        # token revoked / expired early: refresh once, not counted as a retry
+                        refreshed = True
+                        self._access_token(force=True)
+                        continue
+                    if resp.status_code >= 400:
+                        raise AmadeusError(f"HTTP {resp.status_code}: {resp.text[:200]}", resp.status_code)
+                    if parse is None:
+                        return resp.json()
+                    resp.raw.decode_content = True
+                    return parse(resp.raw)
+                except ValueError as e:
+                    # malformed JSON (requests' JSONDecodeError included)
+                    raise AmadeusError(f"invalid response: {e}", resp.status_code)
+                except (requests.RequestException, urllib3.exceptions.HTTPError) as e:
+                    # connection dropped while reading the body
+                    raise AmadeusError(f"network error: {e}")
+                finally:
+                    resp.close()
+        except AmadeusError:
+            with self._metrics_lock:
+                self.counters["errors"] += 1
+            raise
+        finally:
+            with self._metrics_lock:
+                self.counters["calls"] += 1
+                self._latencies.append(time.perf_counter() - t0)
+
+    @staticmethod
+    def _search_params(origin, destination, departure_date, return_date, adults, travel_class, currency,
+                       max_offers):
+        params = {
+            "originLocationCode": origin,
+            "destinationLocationCode": destination,
+            "departureDate": departure_date,
+            "adults": adults,
+            "currencyCode": currency,
+        }
+        if return_date:
+            params["returnDate"] = return_date
+        if travel_class:
+            params["travelClass"] = travel_class
+        if max_offers:
+            params["max"] = max_offers
+        return params
+
+    def search_flights(self, origin, destination, departure_date, return_date=None, adults=1,
+                       travel_class=None, currency="EUR", max_offers=None):
+        """Flight Offers Search: the list of offers (response 'data')."""
+        params = self._search_params(origin, destination, departure_date, return_date, adults, travel_class,
+                                     currency, max_offers)
+        return self.get("/v2/shopping/flight-offers", params).get("data", [])
+
+    def search_offers(self, origin, destination, departure_date, return_date=None, adults=1,
+                      travel_class=None, currency="EUR", max_offers=None):
+        """Flight Offers Search parsed while streaming into compact utils.offers.Offer records."""
+        from utils.offers import iter_offers_json
+        params = self._search_params(origin, destination, departure_date, return_date, adults, travel_class,
+                                     currency, max_offers)
+        return self.get("/v2/shopping/flight-offers", params, parse=lambda body: list(iter_offers_json(body)))
+
+    # -------------------------
+    # Metrics
+    # -------------------------
+    def metrics(self):
+        """Counters + latency of the last 1000 calls (seconds, retries and throttling included)."""
+        with self._metrics_lock:
+            lat = sorted(self._latencies)
+            out = dict(self.counters)
+        n = len(lat)
+        out.update({
+            "latency_mean": sum(lat) / n if n else None,
+            "latency_p50": lat[n // 2] if n else None,
+            "latency_p95": lat[min(n - 1, int(n * 0.95))] if n else None,
+            "latency_max": lat[-1] if n else None,
+        })
+        return out
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Process-wide client (created on first use, from the AMADEUS_* env vars)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = AmadeusClient()
+        return _client
 
-amadeus = Client(
-    client_id=os.getenv("AMADEUS_API_KEY"),
-    client_secret=os.getenv("AMADEUS_API_SECRET")
-)
 
 def search_flights(origin, destination, departure_date, return_date=None, adults=1):
     """
     Recherche simple d'un vol aller/retour via l'API Amadeus.
+    Retourne la liste des offres (champ "data" de la réponse, complet), ou
+    {"error": ...} après épuisement des tentatives.
+    Les réponses sont mises en cache (utils/search_cache.py) sous une clé à part
+    ("payload": "amadeus"), distincte des offres compactes d'AmadeusProvider ;
+    chaque appel renvoie une copie, l'appelant peut donc la modifier sans
+    toucher au cache.
     """
+    from utils.search_cache import cached_search
+    query = {
+        "origin": str(origin or "").strip().upper(),
+        "destination": str(destination or "").strip().upper(),
+        "departure": str(departure_date or "")[:10] or None,
+        "return": str(return_date or "")[:10] or None,
+        "adults": int(adults or 1),
+        "cabin": None,
+        "payload": "amadeus",
+    }
+
+    def fetch():
+        return get_client().search_flights(query["origin"], query["destination"], query["departure"],
+                                           query["return"], query["adults"])
+
     try:
-        response = amadeus.shopping.flight_offers_search.get(
-            originLocationCode=origin,
-            destinationLocationCode=destination,
-            departureDate=departure_date,
-            returnDate=return_date,
-            adults=adults,
-            currencyCode="EUR"
-        )
-        return response.data
+        return copy.deepcopy(cached_search(query, fetch))
     except Exception as e:
         return {"error": str(e)}
-          
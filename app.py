@@ -2,16 +2,22 @@
 import streamlit as st
 from datetime import datetime, date, timedelta
 import uuid
-import random
 import pandas as pd
 from utils.storage import (
     ensure_data_file, load_routes, save_routes,
     load_email_config, save_email_config,
-    append_log, count_updates_last_24h, ensure_route_fields, sanitize_dict
+    append_log, count_updates_last_24h, ensure_route_fields, sanitize_dict,
+    append_price, get_history_arrays, get_history_rollups, history_summary, data_version
 )
 from exporters import export_csv, export_pdf, export_xlsx
 from utils.plotting import plot_price_history
 from utils.email_utils import send_email
+from utils import git_push, wal
+from utils.events import last_event, tail_events, format_event
+from utils.flex import cheapest_matrix, load_state as load_flex_state
+from utils.providers import get_provider, PROVIDER
+from utils.search import grid_queries, run_search
+from utils.simulation import simulate_grid, simulate_price, simulate_prices
 import io
 import os
 
@@ -19,7 +25,13 @@ import os
 # INIT
 # -----------------------------
 ensure_data_file()
-routes = load_routes()
+# history stays in the store: summaries/charts/exports read it as arrays on demand.
+# Routes are kept across reruns and reloaded only when a save or a WAL record changed them.
+_routes_key = (data_version(), wal.size())
+if st.session_state.get("routes_key") != _routes_key or "routes" not in st.session_state:
+    st.session_state["routes"] = load_routes(with_history=False)
+    st.session_state["routes_key"] = _routes_key
+routes = st.session_state["routes"]
 email_cfg = load_email_config()
 global_notif_enabled = bool(email_cfg.get("enabled", False))
 
@@ -33,13 +45,11 @@ col_top_left, col_top_mid, col_top_right = st.columns([1,2,1])
 
 with col_top_left:
     if st.button("Mettre à jour tous (simu)"):
-        # simulate a single random price update for each route
+        # simulate a single price update for each route (history not loaded: last prices from the store)
         changed = False
-        for r in routes:
+        for r, price in zip(routes, simulate_prices(routes, last=[history_summary(r)["last"] for r in routes])):
             try:
-                price = random.randint(120, 1000)
-                r.setdefault("history", []).append({"date": datetime.now().isoformat(), "price": price})
-                r["last_tracked"] = datetime.now().isoformat()
+                append_price(r, int(price))
                 changed = True
             except Exception:
                 continue
@@ -98,8 +108,9 @@ if tab=="Dashboard":
         # Table recap
         df_rows = []
         for r in routes:
-            last_price = r.get("history")[-1]["price"] if r.get("history") else None
-            min_price = min((h["price"] for h in r.get("history", [])), default=None)
+            summary = history_summary(r)
+            last_price = summary["last"]
+            min_price = summary["min"]
             df_rows.append({
                 "id": r.get("id")[:8],
                 "origin": r.get("origin"),
@@ -117,6 +128,7 @@ if tab=="Dashboard":
         st.markdown("---")
             # app.py — PARTIE 2 (colle après PARTIE 1)
         # Details for each route
+        flex_state = load_flex_state()
         for idx, r in enumerate(routes):
             ensure_route_fields(r)
             st.subheader(f"{r['origin']} → {r['destination']}  (id: {r['id'][:8]})")
@@ -134,9 +146,8 @@ if tab=="Dashboard":
                 )
             with cols[1]:
                 if st.button("Update", key=f"dash_update_{idx}"):
-                    price = random.randint(120, 1000)
-                    r.setdefault("history", []).append({"date": datetime.now().isoformat(), "price": price})
-                    r["last_tracked"] = datetime.now().isoformat()
+                    price = simulate_price(r, last=history_summary(r)["last"])
+                    append_price(r, price)
                     save_routes(routes, commit_and_push=True)
                     append_log(f"{datetime.now().isoformat()} - Manual update {r['id']} price={price}")
                     st.rerun()
@@ -177,11 +188,19 @@ if tab=="Dashboard":
             with a3:
                 st.write(f"Updates(24h): {count_updates_last_24h(r)}")
 
-            if r.get("history"):
-                fig = plot_price_history(r["history"])
+            hist_arrays = get_history_arrays(r)
+            if len(hist_arrays[1]):
+                fig = plot_price_history(hist_arrays, rollups=get_history_rollups(r))
                 st.pyplot(fig)
             else:
                 st.info("Aucun historique encore pour ce vol.")
+
+            # Matrice des dates flexibles (remplie par track.py, voir utils/flex.py)
+            deps, rets, matrix = cheapest_matrix(r, flex_state)
+            if any(p is not None for row in matrix for p in row):
+                with st.expander("📅 Meilleurs prix par dates (départ × retour)"):
+                    st.dataframe(pd.DataFrame(matrix, index=deps, columns=[x or "—" for x in rets]),
+                                 use_container_width=True)
             
             # Edition
             with st.expander("✏️ Éditer ce suivi"):
@@ -318,20 +337,33 @@ elif tab=="Recherche/Simulation":
         if st.button("Lancer la recherche (simulation)"):
             origins = [o.strip().upper() for o in origins_input.split(",") if o.strip()]
             dests = [d.strip().upper() for d in destinations_input.split(",") if d.strip()]
-            results = [
-                {
-                    "origin": o,
-                    "destination": d,
-                    "departure": (start_date + timedelta(days=delta)).isoformat(),
-                    "return": (return_date_opt if return_date_opt else (start_date + timedelta(days=delta + int(stay_days)))).isoformat(),
-                    "stay_days": int(stay_days),
-                    "price": random.randint(120, 1200)
-                }
-                for o in origins for d in dests
-                for delta in range(-search_window_days, search_window_days + 1)
-                for _ in range(samples_per_option)
-            ]
-            df_res = pd.DataFrame(results)
+            if PROVIDER != "sim":
+                # real provider (amadeus / replay): one cheapest offer per date combination
+                queries = grid_queries(origins, dests, start_date, int(search_window_days), int(stay_days),
+                                       return_date_opt or None)
+                res = run_search(get_provider(), queries)
+                results = res["rows"]
+                if res["errors"]:
+                    st.warning(f"{res['errors']} recherche(s) en erreur sur {len(queries)}.")
+            else:
+                results = [
+                    {
+                        "origin": o,
+                        "destination": d,
+                        "departure": (start_date + timedelta(days=delta)).isoformat(),
+                        "return": (return_date_opt if return_date_opt else (start_date + timedelta(days=delta + int(stay_days)))).isoformat(),
+                        "stay_days": int(stay_days),
+                        "sample": i,
+                    }
+                    for o in origins for d in dests
+                    for delta in range(-search_window_days, search_window_days + 1)
+                    for i in range(samples_per_option)
+                ]
+                for row, price in zip(results, simulate_grid(results)):
+                    row["price"] = price
+                    del row["sample"]
+            df_res = pd.DataFrame(results, columns=["origin", "destination", "departure", "return",
+                                                    "stay_days", "price"] if not results else None)
             st.session_state["last_search"] = df_res
             st.success(f"Simulation terminée : {len(df_res)} résultats générés.")
 
@@ -414,71 +446,46 @@ elif tab=="Configuration":
     if st.button("Push routes.json vers GitHub maintenant"):
         try:
             save_routes(routes, commit_and_push=True)
-            st.success("Tentative de push initiée — voir le statut ci-dessous.")
+            git_push.push_now()
+            st.success("Push mis en file — voir le statut ci-dessous.")
         except Exception as e:
             st.error(f"Push non effectué : {e}")
 
-    # ---------- Log du dernier push (lecture from last_updates.log) ----------
+    # ---------- Dernier push (événement "push" du journal) ----------
     st.markdown("**État du dernier push**")
-    def _read_last_push_status(log_path="last_updates.log", lookback_lines=200):
-        """
-        Lis le fichier de log (last_updates.log) et retourne la dernière ligne
-        contenant 'save_routes commit_and_push'. Retourne (found:bool, text:str).
-        """
-        try:
-            if not os.path.exists(log_path):
-                return False, "Aucun fichier de log trouvé."
-            # lire les dernières lines du fichier
-            with open(log_path, "r", encoding="utf-8", errors="ignore") as f:
-                lines = f.read().splitlines()
-            # parcourir en sens inverse pour trouver la dernière entrée pertinente
-            for ln in reversed(lines[-lookback_lines:]):
-                if "save_routes commit_and_push" in ln or "git error" in ln or "pushed" in ln:
-                    return True, ln
-            # fallback: chercher une ligne qui ressemble à un log de push
-            for ln in reversed(lines[-lookback_lines:]):
-                if "git" in ln or "push" in ln:
-                    return True, ln
-            return False, "Aucune tentative de push trouvée dans les logs."
-        except Exception as e:
-            return False, f"Erreur lecture log: {e}"
-
-    found, last_push_line = _read_last_push_status()
-    if found:
-        # essayer de colorer selon ok/erreur
-        if "ok=True" in last_push_line or "pushed" in last_push_line.lower():
+    status = git_push.push_status()
+    if status.get("pending"):
+        st.info(f"Push en attente ({status['pending']} fichier(s) en file).")
+    # lecture à rebours depuis la fin du journal : coût indépendant de sa taille
+    ev = last_event("push")
+    if ev:
+        last_push_line = f"{ev.get('ts')} - ok={ev.get('ok')} msg={ev.get('msg')}"
+        if ev.get("detail") and not ev.get("ok"):
+            last_push_line += f" detail={ev['detail']}"
+        if ev.get("ok"):
             st.success(f"Dernière tentative de push : {last_push_line}")
         else:
             st.error(f"Dernière tentative de push : {last_push_line}")
     else:
-        st.info(last_push_line)
+        st.info("Aucune tentative de push trouvée dans les logs.")
 
     # ---------- Afficher les derniers logs (expander) ----------
     st.markdown("---")
     st.subheader("📝 Derniers logs")
-    log_path = "last_updates.log"
-    if os.path.exists(log_path):
-        try:
-            with open(log_path, "r", encoding="utf-8", errors="ignore") as f:
-                log_lines = f.read().splitlines()
-            # montre les 200 dernières lignes (ou moins)
-            N = 200
-            tail = "\n".join(log_lines[-N:])
-            with st.expander("Afficher les derniers logs (dérouler)"):
-                st.code(tail, language="text")
-        except Exception as e:
-            st.error(f"Impossible de lire les logs : {e}")
+    # montre les 200 derniers événements (ou moins)
+    log_events = tail_events(200)
+    if log_events:
+        with st.expander("Afficher les derniers logs (dérouler)"):
+            st.code("\n".join(format_event(e) for e in log_events), language="text")
     else:
         st.info("Aucun log enregistré pour le moment.")
 
 
-
-import os
-st.markdown("**DEBUG env (présence seulement)**")
-st.write("GIT_PUSH:", os.environ.get("GIT_PUSH"))
-st.write("GIT_PUSH_TOKEN present:", bool(os.environ.get("GIT_PUSH_TOKEN")))
-st.write("GITHUB_REPOSITORY:", os.environ.get("GITHUB_REPOSITORY"))
-
+    st.markdown("**DEBUG env (présence seulement)**")
+    st.write("GIT_PUSH:", os.environ.get("GIT_PUSH"))
+    st.write("GIT_PUSH_TOKEN present:", bool(os.environ.get("GIT_PUSH_TOKEN")))
+    st.write("GITHUB_REPOSITORY:", os.environ.get("GITHUB_REPOSITORY"))
+    st.write("ROUTE_STORE:", os.environ.get("ROUTE_STORE") or "json")
 
 
 # -----------------------------
@@ -0,0 +1,98 @@
+# benchmarks/bench_amadeus.py
+"""
+AmadeusClient against the local mock server (benchmarks/mock_amadeus.py).
+
+    python benchmarks/bench_amadeus.py
+    python benchmarks/bench_amadeus.py --calls 200 --threads 16 --rate 20 --error-rate 0.1 --throttle-rps 15
+
+Compares the pooled client (one session, token reused) with a naive one
+that opens a new connection and fetches a new token per call, then prints
+the client metrics (latency percentiles, retries, throttling wait). The last
+line replays the calls through utils.search_cache (in-memory only).
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from amadeus_client import AmadeusClient  # noqa: E402
+from mock_amadeus import serve  # noqa: E402
+from utils.search_cache import SearchCache  # noqa: E402
+
+
+def run_calls(client, calls, threads, cache=None):
+    def one(i):
+        query = {"origin": "PAR", "destination": ("NYC", "TYO", "OSA")[i % 3],
+                 "departure": "2026-12-01", "return": "2026-12-10"}
+        try:
+            fetch = lambda: client.search_flights(query["origin"], query["destination"],  # noqa: E731
+                                                  query["departure"], query["return"])
+            cache.get_or_fetch(query, fetch) if cache else fetch()
+            return True
+        except Exception:
+            return False
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(threads) as ex:
+        ok = sum(ex.map(one, range(calls)))
+    return time.perf_counter() - t0, ok
+
+
+def naive(base_url, calls, threads):
+    """New session + new token for every call (what a per-call client does)."""
+    def one(i):
+        c = AmadeusClient("k", "s", base_url=base_url, rate=0, max_retries=0, session=requests.Session())
+        try:
+            c.search_flights("PAR", ("NYC", "TYO", "OSA")[i % 3], "2026-12-01", "2026-12-10")
+            return True
+        except Exception:
+            return False
+        finally:
+            c.close()
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(threads) as ex:
+        ok = sum(ex.map(one, range(calls)))
+    return time.perf_counter() - t0, ok
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--calls", type=int, default=100)
+    ap.add_argument("--threads", type=int, default=8)
+    ap.add_argument("--latency", type=float, default=0.02)
+    ap.add_argument("--rate", type=float, default=0, help="client token bucket (req/s), 0 = unlimited")
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--throttle-rps", type=float, default=0.0)
+    args = ap.parse_args()
+
+    server = serve(latency=args.latency, error_rate=args.error_rate, throttle_rps=args.throttle_rps)
+    try:
+        t, ok = naive(server.url, args.calls, args.threads)
+        print(f"naive   : {t:6.2f}s  ok={ok}/{args.calls}  tokens={server.stats['token']}")
+        before = server.stats["token"]
+        client = AmadeusClient("k", "s", base_url=server.url, rate=args.rate, burst=max(args.rate / 10, 1),
+                               backoff_base=0.05, backoff_max=1.0)
+        t, ok = run_calls(client, args.calls, args.threads)
+        print(f"pooled  : {t:6.2f}s  ok={ok}/{args.calls}  tokens={server.stats['token'] - before}")
+        m = client.metrics()
+        print(f"metrics : p50={m['latency_p50'] * 1e3:.1f}ms p95={m['latency_p95'] * 1e3:.1f}ms "
+              f"retries={m['retries']} errors={m['errors']} throttled={m['throttled_s']:.2f}s")
+        print(f"server  : {server.stats}")
+        before = server.stats["search"]
+        cache = SearchCache(path=None)
+        t, ok = run_calls(client, args.calls, args.threads, cache)
+        s = cache.stats()
+        print(f"cached  : {t:6.2f}s  ok={ok}/{args.calls}  requests={server.stats['search'] - before}  "
+              f"hits={s['hits']} misses={s['misses']}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
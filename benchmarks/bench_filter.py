@@ -0,0 +1,70 @@
+# benchmarks/bench_filter.py
+"""
+Offer filter engine: vectorized (NumPy) vs per-route Python loop.
+
+    python benchmarks/bench_filter.py
+    python benchmarks/bench_filter.py --routes 1000 --offers 250
+
+One batch of random offers is matched against N routes with random
+constraints (avoid / preferred airlines, max_stops, direct_only, min_bags,
+cabin). Both engines must pick the same offer for every route.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.offer_filter import OfferBatch, best_offer  # noqa: E402
+from utils.offers import Offer  # noqa: E402
+
+AIRLINES = ("AF", "KL", "LH", "BA", "IB", "TK", "EK", "QR", "UA", "DL")
+CABINS = ("ECONOMY", "PREMIUM_ECONOMY", "BUSINESS", "FIRST")
+
+
+def make_offers(n, rnd):
+    return [Offer(str(i), round(rnd.uniform(200, 2000), 2), "EUR",
+                  tuple(sorted(set(rnd.sample(AIRLINES, rnd.randint(1, 2))))),
+                  rnd.randint(0, 2), rnd.randint(0, 2), rnd.choice(CABINS + (None,)))
+            for i in range(n)]
+
+
+def make_routes(n, rnd):
+    return [{"avoid_airlines": rnd.sample(AIRLINES, rnd.randint(0, 2)),
+             "preferred_airlines": rnd.sample(AIRLINES, rnd.randint(0, 2)),
+             "max_stops": rnd.choice(["any", 0, 1, 2]),
+             "direct_only": rnd.random() < 0.1,
+             "min_bags": rnd.randint(0, 1),
+             "cabin_class": rnd.choice(["Economy", "Premium", "Business", "First"])}
+            for _ in range(n)]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--routes", type=int, nargs="+", default=[10, 100, 1000])
+    ap.add_argument("--offers", type=int, default=250)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+    rnd = random.Random(42)
+    offers = make_offers(args.offers, rnd)
+
+    print(f"{args.offers} offers")
+    print(f"{'routes':>7} {'loop ms':>9} {'numpy ms':>9} {'speedup':>8}")
+    for n in args.routes:
+        routes = make_routes(n, rnd)
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            expected = [best_offer(r, offers) for r in routes]
+        loop = (time.perf_counter() - t0) / args.repeat
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            got = OfferBatch(offers).best(routes)
+        vec = (time.perf_counter() - t0) / args.repeat
+        assert [o and o.id for o in got] == [o and o.id for o in expected], "engines disagree"
+        print(f"{n:>7} {loop * 1e3:>9.2f} {vec * 1e3:>9.2f} {loop / vec:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# benchmarks/bench_notify.py
+"""
+Alert delivery: one email per route vs per-recipient digests.
+
+    python benchmarks/bench_notify.py
+    python benchmarks/bench_notify.py --routes 500 --recipients 10 --latency 0.2 --rate 10
+
+All routes are under their target price, spread over --recipients addresses.
+Emails go to the local SendGrid stand-in (benchmarks/mock_sendgrid.py) with
+--latency per request. Rows:
+  per-route  one blocking send per alert, new session each time (the old
+             behaviour of the tracking loop)
+  digest     utils.notify.Digest: one email per recipient, shared Mailer,
+             NOTIFY_WORKERS threads, --rate emails/s
+"""
+import argparse
+import os
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_sendgrid import serve  # noqa: E402
+from utils.email_utils import Mailer  # noqa: E402
+from utils.notify import Digest, NOTIFY_WORKERS, render_digest  # noqa: E402
+
+
+def make_routes(n, recipients):
+    return [{"id": f"r{i}", "origin": "PAR", "destination": ("NYC", "TYO", "OSA")[i % 3],
+             "departure": "2026-12-01", "return": "2026-12-10", "target_price": 500,
+             "notifications": True, "email": f"user{i % recipients}@example.com", "stats": {}}
+            for i in range(n)]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--routes", type=int, default=200)
+    ap.add_argument("--recipients", type=int, default=5)
+    ap.add_argument("--latency", type=float, default=0.05)
+    ap.add_argument("--workers", type=int, default=NOTIFY_WORKERS)
+    ap.add_argument("--rate", type=float, default=0, help="emails/s for digests, 0 = unlimited")
+    args = ap.parse_args()
+
+    server = serve(latency=args.latency)
+    routes = make_routes(args.routes, args.recipients)
+    try:
+        t0 = time.perf_counter()
+        for r in routes:
+            mailer = Mailer("x", base_url=server.url, session=requests.Session())
+            mailer.send(r["email"], *render_digest([(r, 400)]))
+            mailer.close()
+        per_route = time.perf_counter() - t0
+        sent = server.stats["accepted"]
+        print(f"per-route : {per_route:6.2f}s  emails={sent}")
+
+        mailer = Mailer("x", base_url=server.url)
+        digest = Digest()
+        for r in routes:
+            digest.add(r, 400)
+        t0 = time.perf_counter()
+        report = digest.send(mailer.send, workers=args.workers, rate=args.rate)
+        elapsed = time.perf_counter() - t0
+        print(f"digest    : {elapsed:6.2f}s  emails={server.stats['accepted'] - sent}  "
+              f"routes notified={report['notified']}  failed={report['failed']}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
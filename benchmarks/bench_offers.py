@@ -0,0 +1,110 @@
+# benchmarks/bench_offers.py
+"""
+Memory / time of handling a large flight-offers response.
+
+    python benchmarks/bench_offers.py                      # synthetic 250 and 2000 offers
+    python benchmarks/bench_offers.py --offers 5000
+    python benchmarks/bench_offers.py --file recorded.json # a recorded Amadeus response
+
+Synthetic payloads use utils.providers.simulated_offers padded with the
+fields a real Amadeus response carries (aircraft, operating carrier,
+durations, per-traveler price breakdown, fare basis...). Rows:
+  raw     json.load, keep the raw "data" list (what search_flights returns)
+  parsed  json.load, then project onto Offer records
+  stream  iter_offers_json over the file (one raw offer decoded at a time)
+Columns: elapsed (ms), peak (traced peak allocation, KB), kept (memory
+still held by the result, KB).
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.offers import iter_offers_json, parse_offers  # noqa: E402
+from utils.providers import simulated_offers  # noqa: E402
+
+
+def _pad(offer):
+    """Add the fields of a real Amadeus offer that we do not use."""
+    offer.update({
+        "type": "flight-offer", "source": "GDS", "instantTicketingRequired": False,
+        "nonHomogeneous": False, "oneWay": False, "lastTicketingDate": "2026-11-20",
+        "numberOfBookableSeats": 9,
+        "pricingOptions": {"fareType": ["PUBLISHED"], "includedCheckedBagsOnly": True},
+    })
+    total = offer["price"]["total"]
+    offer["price"].update({"base": total, "grandTotal": total,
+                           "fees": [{"amount": "0.00", "type": "SUPPLIER"}, {"amount": "0.00", "type": "TICKETING"}],
+                           "additionalServices": [{"amount": "45.00", "type": "CHECKED_BAGS"}]})
+    for it in offer["itineraries"]:
+        it["duration"] = "PT11H25M"
+        for n, seg in enumerate(it["segments"]):
+            seg["departure"].update({"iataCode": "CDG", "terminal": "2E"})
+            seg["arrival"].update({"iataCode": "JFK", "terminal": "1"})
+            seg.update({"aircraft": {"code": "77W"}, "operating": {"carrierCode": seg["carrierCode"]},
+                        "duration": "PT8H25M", "id": str(n + 1), "numberOfStops": 0,
+                        "blacklistedInEU": False})
+    fares = offer["travelerPricings"][0]["fareDetailsBySegment"]
+    offer["travelerPricings"] = [{
+        "travelerId": str(t + 1), "fareOption": "STANDARD", "travelerType": "ADULT",
+        "price": {"currency": "EUR", "total": total, "base": total},
+        "fareDetailsBySegment": [dict(fd, segmentId=str(s + 1), fareBasis="TNNR7DO", brandedFare="LIGHT",
+                                      **{"class": "T"}) for s, fd in enumerate(fares)],
+    } for t in range(2)]
+    return offer
+
+
+def synthetic(n):
+    query = {"origin": "PAR", "destination": "NYC", "departure": "2026-12-01", "return": "2026-12-10"}
+    data = [_pad(o) for o in simulated_offers(query, n)]
+    for i, o in enumerate(data):
+        o["id"] = str(i + 1)
+    doc = {"meta": {"count": n, "links": {"self": "https://test.api.amadeus.com/v2/shopping/flight-offers"}},
+           "data": data, "dictionaries": {"carriers": {"AF": "AIR FRANCE"}}}
+    return json.dumps(doc).encode("utf-8")
+
+
+def measure(fn):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - t0
+    kept, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, kept, result
+
+
+def bench(payload, label):
+    rows = [
+        ("raw", lambda: json.load(io.BytesIO(payload))["data"]),
+        ("parsed", lambda: list(parse_offers(json.load(io.BytesIO(payload))["data"]))),
+        ("stream", lambda: list(iter_offers_json(io.BytesIO(payload)))),
+    ]
+    print(f"{label}: {len(payload) / 1024:.0f} KB")
+    print(f"{'':>8} {'elapsed':>9} {'peak':>9} {'kept':>9} {'offers':>7}")
+    for name, fn in rows:
+        elapsed, peak, kept, result = measure(fn)
+        print(f"{name:>8} {elapsed * 1e3:>9.1f} {peak / 1024:>9.0f} {kept / 1024:>9.0f} {len(result):>7}")
+        del result
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--offers", type=int, nargs="+", default=[250, 2000])
+    ap.add_argument("--file", help="recorded flight-offers JSON response")
+    args = ap.parse_args()
+    if args.file:
+        with open(args.file, "rb") as f:
+            bench(f.read(), args.file)
+        return
+    for n in args.offers:
+        bench(synthetic(n), f"{n} synthetic offers")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# benchmarks/bench_replay.py
+"""
+Offline load test: record once, then replay the answers to measure the
+tracking pipeline (track.py) and the search tab grid without network.
+
+    python benchmarks/bench_replay.py
+    python benchmarks/bench_replay.py --routes 2000 --distinct 200 --latency 0.05 --error-rate 0.05 --throttle-rps 50
+    python benchmarks/bench_replay.py --recordings recordings.jsonl   # replay a real recording (track.py --record)
+
+Steps (in a temporary directory):
+  1. record  : the simulated provider answers every search key, wrapped in
+               RecordingProvider (skipped with --recordings)
+  2. replay  : ReplayProvider with --latency per call
+  3. http    : AmadeusProvider -> AmadeusClient -> mock_amadeus.py serving the
+               recordings with --latency, --error-rate and --throttle-rps
+               (the search cache is disabled so every call goes over HTTP)
+Each step runs one tracking pass over the routes and one search-tab grid
+(--origins x --destinations x ±--window days).
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+from datetime import date, timedelta
+
+os.environ["SEARCH_CACHE"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from amadeus_client import AmadeusClient  # noqa: E402
+from bench_storage import make_routes  # noqa: E402
+from mock_amadeus import serve  # noqa: E402
+from utils import history  # noqa: E402
+from utils.providers import AmadeusProvider, RecordingProvider, ReplayProvider, SimulatedProvider  # noqa: E402
+from utils.route_store import BACKENDS  # noqa: E402
+from utils.search import grid_queries, run_search  # noqa: E402
+from utils.tracking import run  # noqa: E402
+
+
+def fresh_routes(n, distinct):
+    routes = make_routes(n, 0)
+    for i, r in enumerate(routes):
+        r["departure"] = (date(2026, 3, 1) + timedelta(days=(i % distinct) // 4)).isoformat()
+    store = BACKENDS["json"]()
+    store.save_routes(routes)
+    return store.load_routes()
+
+
+def step(label, provider, args, queries):
+    # each step tracks fresh routes in its own directory
+    os.makedirs(label)
+    os.chdir(label)
+    history._persisted.clear()
+    try:
+        report = run(fresh_routes(args.routes, args.distinct), provider, concurrency=args.concurrency)
+    finally:
+        os.chdir("..")
+    search = run_search(provider, queries, concurrency=args.concurrency)
+    print(f"{label:>7} {report['elapsed']:>9.2f} {report['updated'] / report['elapsed']:>9.1f} "
+          f"{report['requests']:>9} {report['errors']:>7} {search['elapsed']:>9.2f} "
+          f"{len(queries) / search['elapsed']:>9.1f} {search['errors']:>7}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--routes", type=int, default=500)
+    ap.add_argument("--distinct", type=int, default=100, help="distinct search keys among the routes")
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--latency", type=float, default=0.02)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--throttle-rps", type=float, default=0.0)
+    ap.add_argument("--origins", default="PAR,LYS")
+    ap.add_argument("--destinations", default="NYC,TYO,OSA")
+    ap.add_argument("--window", type=int, default=7)
+    ap.add_argument("--recordings", help="existing recordings file (skips the record step)")
+    args = ap.parse_args()
+
+    queries = grid_queries(args.origins.split(","), args.destinations.split(","), date(2026, 3, 5),
+                           args.window, 7)
+    cwd = os.getcwd()
+    tmp = tempfile.mkdtemp()
+    recordings = os.path.abspath(args.recordings) if args.recordings else os.path.join(tmp, "recordings.jsonl")
+    os.chdir(tmp)
+    server = None
+    try:
+        print(f"{args.routes} routes ({args.distinct} keys), search grid {len(queries)} queries, "
+              f"latency={args.latency * 1e3:.0f}ms")
+        print(f"{'':>7} {'track s':>9} {'routes/s':>9} {'requests':>9} {'errors':>7} "
+              f"{'search s':>9} {'queries/s':>9} {'errors':>7}")
+        if not args.recordings:
+            step("record", RecordingProvider(SimulatedProvider(offers=6), recordings), args, queries)
+        step("replay", ReplayProvider(recordings, latency=args.latency), args, queries)
+        server = serve(latency=args.latency, error_rate=args.error_rate, throttle_rps=args.throttle_rps,
+                       replay=recordings)
+        client = AmadeusClient("k", "s", base_url=server.url, rate=0, backoff_base=0.05, backoff_max=1.0,
+                               pool_size=args.concurrency)
+        step("http", AmadeusProvider(client=client, threads=args.concurrency), args, queries)
+        print(f"mock server: {server.stats}")
+    finally:
+        if server:
+            server.shutdown()
+        os.chdir(cwd)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+# benchmarks/bench_simulation.py
+"""
+Batch price simulator vs one call per route.
+
+    python benchmarks/bench_simulation.py                  # 1k, 10k, 100k routes
+    python benchmarks/bench_simulation.py --sizes 1000000
+
+Columns (seconds):
+  per-route  simulate_price() called once per route
+  batch      simulate_prices() on the whole list (seed cache warm)
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_storage import make_routes  # noqa: E402
+from utils.simulation import simulate_price, simulate_prices  # noqa: E402
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    ap.add_argument("--per-route-max", type=int, default=100000,
+                    help="skip the per-route column above this size")
+    args = ap.parse_args()
+
+    ts = time.time()
+    print(f"{'routes':>8} {'per-route':>10} {'batch':>10}")
+    for n in args.sizes:
+        routes = make_routes(n, 1)
+        simulate_prices(routes, ts)
+        per_route = float("nan")
+        if n <= args.per_route_max:
+            t0 = time.perf_counter()
+            for r in routes:
+                simulate_price(r, ts)
+            per_route = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        simulate_prices(routes, ts)
+        batch = time.perf_counter() - t0
+        print(f"{n:>8} {per_route:>10.3f} {batch:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# benchmarks/bench_storage.py
+"""
+Compare load / save / append latency of the RouteStore backends.
+
+    python benchmarks/bench_storage.py                     # 100, 10k, 100k routes
+    python benchmarks/bench_storage.py --sizes 100 1000 --points 5
+
+Each backend runs in its own temporary directory. Columns (seconds):
+  save      first full save of N routes (with history)
+  load      load_routes() with history attached
+  resave_1  save_routes() after changing one route's notifications flag
+  append    mean latency of one append_price() call
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import history  # noqa: E402
+from utils.route_store import BACKENDS, SqliteRouteStore  # noqa: E402
+
+
+def make_routes(n: int, points: int):
+    start = datetime(2025, 1, 1)
+    routes = []
+    for i in range(n):
+        routes.append({
+            "id": str(uuid.UUID(int=i)),
+            "origin": "PAR",
+            "destination": ("TYO", "OSA", "PTP", "NYC")[i % 4],
+            "departure": "2026-03-01",
+            "return": "2026-03-12",
+            "target_price": 450.0,
+            "tracking_per_day": 2,
+            "notifications": False,
+            "email": "",
+            "history": [{"date": (start + timedelta(hours=12 * k)).isoformat(), "price": 300 + (i + k) % 500}
+                        for k in range(points)],
+            "last_tracked": None,
+            "stats": {},
+        })
+    return routes
+
+
+def bench_backend(name: str, n: int, points: int, appends: int):
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        history._persisted.clear()
+        try:
+            store = SqliteRouteStore(os.path.join(tmp, "data.db")) if name == "sqlite" else BACKENDS[name]()
+            routes = make_routes(n, points)
+
+            t0 = time.perf_counter()
+            store.save_routes(routes)
+            t_save = time.perf_counter() - t0
+
+            history._persisted.clear()
+            t0 = time.perf_counter()
+            routes = store.load_routes()
+            t_load = time.perf_counter() - t0
+
+            routes[n // 2]["notifications"] = True
+            t0 = time.perf_counter()
+            store.save_routes(routes)
+            t_resave = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            for k in range(appends):
+                store.append_price(routes[k % n], 400 + k)
+            t_append = (time.perf_counter() - t0) / max(appends, 1)
+        finally:
+            os.chdir(cwd)
+    return t_save, t_load, t_resave, t_append
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[100, 10_000, 100_000])
+    ap.add_argument("--points", type=int, default=3, help="history points per route")
+    ap.add_argument("--appends", type=int, default=200)
+    ap.add_argument("--backends", nargs="+", default=list(BACKENDS))
+    args = ap.parse_args()
+
+    print(f"{'backend':<9} {'routes':>8} {'save':>9} {'load':>9} {'resave_1':>9} {'append':>10}")
+    for n in args.sizes:
+        for name in args.backends:
+            t_save, t_load, t_resave, t_append = bench_backend(name, n, args.points, args.appends)
+            print(f"{name:<9} {n:>8} {t_save:>9.3f} {t_load:>9.3f} {t_resave:>9.3f} {t_append * 1e3:>8.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# benchmarks/bench_track.py
+"""
+Tracking pipeline throughput against a simulated provider with network-like latency.
+
+    python benchmarks/bench_track.py                              # 1000 routes, 50ms latency
+    python benchmarks/bench_track.py --routes 5000 --latency 0.2 --concurrency 1 16 64
+
+Each run uses a fresh temporary directory (json store). Columns:
+  concurrency  TRACK_CONCURRENCY used by the fetch stage
+  elapsed      wall time of one pass (s)
+  routes/s     updated routes per second
+  requests     provider calls (routes sharing a search key share one call;
+               --distinct sets how many different keys there are)
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_storage import make_routes  # noqa: E402
+from utils import history  # noqa: E402
+from utils.providers import SimulatedProvider  # noqa: E402
+from utils.route_store import BACKENDS  # noqa: E402
+from utils.tracking import run  # noqa: E402
+
+
+def bench(n: int, latency: float, jitter: float, concurrency: int, distinct: int):
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        history._persisted.clear()
+        try:
+            store = BACKENDS["json"]()
+            routes = make_routes(n, 0)
+            for i, r in enumerate(routes):
+                r["departure"] = (date(2026, 3, 1) + timedelta(days=(i % distinct) // 4)).isoformat()
+            store.save_routes(routes)
+            routes = store.load_routes()
+            provider = SimulatedProvider(latency=latency, jitter=jitter)
+            t0 = time.perf_counter()
+            report = run(routes, provider, concurrency=concurrency)
+            elapsed = time.perf_counter() - t0
+        finally:
+            os.chdir(cwd)
+    return elapsed, report
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--routes", type=int, default=1000)
+    ap.add_argument("--latency", type=float, default=0.05, help="seconds per provider call")
+    ap.add_argument("--jitter", type=float, default=0.0, help="extra random latency (s)")
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    ap.add_argument("--distinct", type=int, default=None, help="distinct search keys (default: one per route)")
+    args = ap.parse_args()
+    distinct = args.distinct or args.routes
+
+    print(f"{args.routes} routes, latency={args.latency * 1e3:.0f}ms (+{args.jitter * 1e3:.0f}ms jitter)")
+    print(f"{'concurrency':>11} {'elapsed':>9} {'routes/s':>9} {'updated':>8} {'requests':>9} {'dedup':>6}")
+    for c in args.concurrency:
+        elapsed, report = bench(args.routes, args.latency, args.jitter, c, distinct)
+        print(f"{c:>11} {elapsed:>9.2f} {report['updated'] / elapsed:>9.1f} {report['updated']:>8} "
+              f"{report['requests']:>9} {report['dedup_ratio']:>6.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+# benchmarks/gen_dataset.py
+"""
+Deterministic synthetic dataset for the scaling benchmarks.
+
+    python benchmarks/gen_dataset.py --preset medium --out /tmp/ds
+    python benchmarks/gen_dataset.py --routes 2000 --points 500 --format sqlite --seed 7 --out /tmp/ds
+    python benchmarks/gen_dataset.py --preset large --format all --out /tmp/ds
+
+Presets (routes x points per route): small 2 x 5 (10 points), medium
+100 x 100 (10k), large 10000 x 100 (1M).
+
+Routes look like real ones: weighted IATA pairs (Paris / province -> Japan,
+Americas, Antilles, Asia...), departure 2 weeks to 10 months after --end,
+flex days, stay range, cabin, stops / bags constraints, avoided and
+preferred airlines, notifications (per-route address, global address or
+off) and an alert mode. Histories come from utils.simulation, tracked
+tracking_per_day times a day up to --end, and target prices sit a little
+under the typical price so some routes are in alert.
+
+Everything derives from --seed and --end (never the clock or hash()), so
+the same arguments give the same files. Each format goes to its own
+directory under --out, written through the regular stores:
+
+  json-jsonl, json-bin         routes.json + history/ (HISTORY_FORMAT jsonl | bin)
+  sharded-jsonl, sharded-bin   routes/ + history/
+  sqlite                       data.db
+
+Point the app or a benchmark at one of them by running it from that
+directory (with ROUTE_STORE / HISTORY_FORMAT set to match).
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import db, history  # noqa: E402
+from utils.route_store import BACKENDS, SqliteRouteStore  # noqa: E402
+from utils.simulation import simulate_prices  # noqa: E402
+
+PRESETS = {"small": (2, 5), "medium": (100, 100), "large": (10000, 100)}
+FORMATS = ("json-jsonl", "json-bin", "sharded-jsonl", "sharded-bin", "sqlite")
+
+ORIGINS = [("PAR", 40), ("CDG", 15), ("ORY", 10), ("LYS", 8), ("NCE", 7), ("MRS", 6), ("TLS", 5),
+           ("BOD", 4), ("NTE", 3), ("BRU", 2)]
+# destination -> airlines flying it from France
+DESTINATIONS = {
+    "TYO": ["AF", "JL", "NH", "KL", "LH", "TK", "EK", "QR"],
+    "HND": ["AF", "JL", "NH"],
+    "NRT": ["AF", "JL", "NH", "KL", "LH", "CX"],
+    "OSA": ["AF", "JL", "NH", "KL", "LH", "TK", "EK", "QR"],
+    "CTS": ["JL", "NH", "KL", "LH"],
+    "NYC": ["AF", "DL", "UA", "AA", "BA", "LH", "KL"],
+    "JFK": ["AF", "DL", "AA", "B6"],
+    "LAX": ["AF", "DL", "UA", "AA", "BA"],
+    "YUL": ["AC", "AF", "TS"],
+    "PTP": ["AF", "TX", "SS", "BF"],
+    "FDF": ["AF", "TX", "SS", "BF"],
+    "RUN": ["AF", "UU", "SS", "BF"],
+    "BKK": ["TG", "AF", "EK", "QR", "TK"],
+    "DXB": ["EK", "AF"],
+    "SIN": ["SQ", "AF", "EK", "QR"],
+    "HKG": ["CX", "AF"],
+}
+DEST_WEIGHTS = {"TYO": 14, "HND": 4, "NRT": 4, "OSA": 10, "CTS": 4, "NYC": 10, "JFK": 4, "LAX": 4,
+                "YUL": 5, "PTP": 12, "FDF": 6, "RUN": 6, "BKK": 5, "DXB": 3, "SIN": 3, "HKG": 2}
+CABINS = [("Economy", 80), ("Premium Economy", 10), ("Business", 8), ("First", 2)]
+MAX_STOPS = [("any", 50), ("0", 10), ("1", 30), ("2", 10)]
+ALERT_MODES = [(None, 70), ("rearm", 10), ("new_low", 15), ("always", 5)]
+
+
+def _pick(rnd, weighted):
+    items, weights = zip(*weighted)
+    return rnd.choices(items, weights)[0]
+
+
+def make_route(i, seed, end):
+    """Configuration of route i (no history), deterministic from (seed, i)."""
+    rnd = random.Random(f"{seed}:{i}")
+    dest = _pick(rnd, DEST_WEIGHTS.items())
+    airlines = DESTINATIONS[dest]
+    departure = end.date() + timedelta(days=rnd.randint(14, 300))
+    stay_min = rnd.choice([3, 5, 7, 10, 14, 21])
+    stay_max = stay_min + rnd.choice([0, 2, 4, 7])
+    direct = rnd.random() < 0.1
+    notify = rnd.random()
+    route = {
+        "id": str(uuid.UUID(int=rnd.getrandbits(128), version=4)),
+        "origin": _pick(rnd, ORIGINS),
+        "destination": dest,
+        "departure": departure.isoformat(),
+        "departure_flex_days": rnd.choice([0, 0, 1, 2, 3]),
+        "return": (departure + timedelta(days=rnd.randint(stay_min, stay_max))).isoformat(),
+        "return_airport": rnd.choice([None] * 9 + [_pick(rnd, ORIGINS)]),
+        "stay_min": stay_min,
+        "stay_max": stay_max,
+        "return_flex_days": rnd.choice([0, 0, 1, 2]),
+        "target_price": None,
+        "tracking_per_day": rnd.choice([1, 2, 2, 4]),
+        "notifications": notify < 0.6,
+        "email": f"user{rnd.randint(1, 50)}@example.com" if notify < 0.4 else "",
+        "cabin_class": _pick(rnd, CABINS),
+        "min_bags": rnd.choice([0, 0, 1, 1, 2]),
+        "direct_only": direct,
+        "max_stops": "0" if direct else _pick(rnd, MAX_STOPS),
+        "avoid_airlines": rnd.sample(airlines, rnd.choice([0, 0, 0, 1])),
+        "preferred_airlines": rnd.sample(airlines, rnd.choice([0, 1, 1, 2])),
+        "history": [],
+        "last_tracked": None,
+        "stats": {},
+    }
+    mode = _pick(rnd, ALERT_MODES)
+    if mode:
+        route["alert_mode"] = mode
+    return route
+
+
+def fill_history(routes, points, end):
+    """points simulated observations per route, the last one at end."""
+    if not points:
+        return routes
+    by_rate = {}
+    for r in routes:
+        by_rate.setdefault(r["tracking_per_day"], []).append(r)
+    for per_day, group in by_rate.items():
+        step = timedelta(hours=24 / per_day)
+        for k in range(points):
+            ts = end - step * (points - 1 - k)
+            stamp = ts.isoformat()
+            for r, price in zip(group, simulate_prices(group, ts)):
+                r["history"].append({"date": stamp, "price": int(price)})
+    for r in routes:
+        prices = sorted(p["price"] for p in r["history"])
+        # a bit under the median: the cheaper observations are alerts
+        r["target_price"] = float(round(prices[len(prices) // 2] * 0.92))
+        r["last_tracked"] = r["history"][-1]["date"]
+        r["stats"] = {"updates_total": points, "updates_today": min(points, r["tracking_per_day"])}
+    return routes
+
+
+def generate(n, points, seed=0, end=datetime(2026, 1, 1), chunk=1000):
+    """Yield lists of at most ``chunk`` complete routes (configuration + history)."""
+    for start in range(0, n, chunk):
+        yield fill_history([make_route(i, seed, end) for i in range(start, min(n, start + chunk))], points, end)
+
+
+def write(fmt, out, n, points, seed, end):
+    """Write the dataset in one format under out/fmt; returns (seconds, bytes)."""
+    target = os.path.join(out, fmt)
+    os.makedirs(target, exist_ok=True)
+    cwd, old_format = os.getcwd(), history.HISTORY_FORMAT
+    t0 = time.perf_counter()
+    os.chdir(target)
+    history._persisted.clear()
+    try:
+        backend, _, hist_format = fmt.partition("-")
+        history.HISTORY_FORMAT = hist_format or old_format
+        if backend == "sqlite":
+            # a fresh database would import the legacy JSON files of the launch directory and
+            # stamp meta.migrated with the clock: flag it migrated at --end instead
+            db.mark_migrated(end.isoformat(), os.path.abspath("data.db"))
+            store = SqliteRouteStore(os.path.abspath("data.db"))
+        else:
+            store = BACKENDS[backend]()
+        configs = []
+        for routes in generate(n, points, seed, end):
+            if backend == "sqlite":
+                for r in routes:
+                    store.replace_history(r["id"], r["history"])
+            else:
+                for r in routes:
+                    history.write_history(r["id"], r["history"])
+            configs.extend(history.strip_history(r) for r in routes)
+        # routes without a "history" key: the stores keep the points written above
+        store.save_routes(configs)
+    finally:
+        history.HISTORY_FORMAT = old_format
+        os.chdir(cwd)
+    size = sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(target) for f in files)
+    return time.perf_counter() - t0, size
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--preset", choices=sorted(PRESETS), help="taille prédéfinie (remplace --routes/--points)")
+    ap.add_argument("--routes", type=int, default=100)
+    ap.add_argument("--points", type=int, default=100, help="points d'historique par trajet")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--end", default="2026-01-01T00:00:00", help="date du dernier point (ISO)")
+    ap.add_argument("--format", nargs="+", default=["json-jsonl"], help=f"{' | '.join(FORMATS)} | all")
+    ap.add_argument("--out", required=True, help="répertoire de sortie")
+    args = ap.parse_args()
+
+    n, points = PRESETS[args.preset] if args.preset else (args.routes, args.points)
+    formats = list(FORMATS) if "all" in args.format else args.format
+    unknown = [f for f in formats if f not in FORMATS]
+    if unknown:
+        ap.error(f"format inconnu : {', '.join(unknown)} (attendu : {', '.join(FORMATS)} ou all)")
+    end = datetime.fromisoformat(args.end)
+    print(f"{n} trajets x {points} points = {n * points} points (seed={args.seed})")
+    for fmt in formats:
+        elapsed, size = write(fmt, args.out, n, points, args.seed, end)
+        print(f"{fmt:>14} {elapsed:8.2f}s {size / 1e6:10.1f} MB  {os.path.join(args.out, fmt)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+# benchmarks/mock_amadeus.py
+"""
+Local stand-in for the Amadeus endpoints used by amadeus_client.py:
+
+    POST /v1/security/oauth2/token      -> {"access_token", "expires_in"}
+    GET  /v2/shopping/flight-offers     -> {"data": [offers]}
+
+Offers are generated with utils.providers.simulated_offers, or replayed from
+a recordings file (track.py --record, utils.providers.RecordingProvider):
+unknown queries then get an empty "data" list. Behaviour knobs: latency (s
+per request), error_rate (share of 500s), throttle_rps (429 + Retry-After
+above that many requests/s) and token_ttl.
+
+    python benchmarks/mock_amadeus.py --port 8765 --latency 0.05 --error-rate 0.05
+    python benchmarks/mock_amadeus.py --replay recordings.jsonl --throttle-rps 10
+    AMADEUS_BASE_URL=http://127.0.0.1:8765 AMADEUS_API_KEY=x AMADEUS_API_SECRET=y python track.py --provider amadeus
+
+In-process use (benchmarks): ``server = serve(port=0, latency=...)`` then
+``server.url`` / ``server.stats`` / ``server.shutdown()``.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.offers import Offer  # noqa: E402
+from utils.providers import load_recordings, search_key, simulated_offers  # noqa: E402
+
+
+class MockAmadeus(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, addr, latency=0.0, error_rate=0.0, throttle_rps=0.0, token_ttl=1799, offers=6,
+                 replay=None):
+        super().__init__(addr, Handler)
+        self.recordings = load_recordings(replay) if replay else None
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rps = throttle_rps
+        self.token_ttl = token_ttl
+        self.offers = offers
+        self.tokens = {}
+        self.lock = threading.Lock()
+        self.window = []
+        self.stats = {"token": 0, "search": 0, "ok": 0, "429": 0, "500": 0, "401": 0, "replay_miss": 0}
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def handle_error(self, request, client_address):
+        # clients dropping keep-alive connections are expected, not worth a traceback
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def throttled(self):
+        if self.throttle_rps <= 0:
+            return False
+        now = time.monotonic()
+        with self.lock:
+            self.window = [t for t in self.window if now - t < 1.0]
+            if len(self.window) >= self.throttle_rps:
+                return True
+            self.window.append(now)
+        return False
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so the client's pooling is exercised
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, code, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        srv = self.server
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        if urlparse(self.path).path != "/v1/security/oauth2/token":
+            return self._send(404, {"errors": [{"detail": "not found"}]})
+        srv.count("token")
+        token = f"tok-{random.getrandbits(64):x}"
+        with srv.lock:
+            srv.tokens[token] = time.time() + srv.token_ttl
+        self._send(200, {"access_token": token, "expires_in": srv.token_ttl, "token_type": "Bearer"})
+
+    def do_GET(self):
+        srv = self.server
+        url = urlparse(self.path)
+        if url.path != "/v2/shopping/flight-offers":
+            return self._send(404, {"errors": [{"detail": "not found"}]})
+        srv.count("search")
+        token = (self.headers.get("Authorization") or "").replace("Bearer ", "")
+        with srv.lock:
+            valid = srv.tokens.get(token, 0) > time.time()
+        if not valid:
+            srv.count("401")
+            return self._send(401, {"errors": [{"code": 38192, "detail": "Access token expired"}]})
+        if srv.throttled():
+            srv.count("429")
+            return self._send(429, {"errors": [{"code": 38194, "detail": "Too many requests"}]},
+                              {"Retry-After": "1"})
+        if srv.latency:
+            time.sleep(srv.latency)
+        if srv.error_rate and random.random() < srv.error_rate:
+            srv.count("500")
+            return self._send(500, {"errors": [{"code": 141, "detail": "SYSTEM ERROR HAS OCCURRED"}]})
+        q = {k: v[0] for k, v in parse_qs(url.query).items()}
+        query = {"origin": q.get("originLocationCode"), "destination": q.get("destinationLocationCode"),
+                 "departure": q.get("departureDate"), "return": q.get("returnDate"),
+                 "adults": int(q.get("adults") or 1), "cabin": q.get("travelClass")}
+        if srv.recordings is None:
+            offers = simulated_offers(query, srv.offers)
+        else:
+            recorded = srv.recordings.get(json.dumps(search_key(query), separators=(",", ":")))
+            if recorded is None:
+                srv.count("replay_miss")
+            offers = [Offer.from_dict(d).to_amadeus() for d in recorded or []]
+        srv.count("ok")
+        self._send(200, {"meta": {"count": len(offers)}, "data": offers})
+
+
+def serve(host="127.0.0.1", port=0, **kwargs):
+    """Start the mock in a background thread and return the server."""
+    server = MockAmadeus((host, port), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency", type=float, default=0.05)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--throttle-rps", type=float, default=0.0, help="answer 429 above this rate (0 = never)")
+    ap.add_argument("--token-ttl", type=int, default=1799)
+    ap.add_argument("--replay", metavar="FILE", help="serve the answers of a recordings file")
+    args = ap.parse_args()
+    server = MockAmadeus((args.host, args.port), latency=args.latency, error_rate=args.error_rate,
+                         throttle_rps=args.throttle_rps, token_ttl=args.token_ttl, replay=args.replay)
+    print(f"mock Amadeus on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
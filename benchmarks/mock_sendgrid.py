@@ -0,0 +1,131 @@
+# benchmarks/mock_sendgrid.py
+"""
+Local stand-in for the SendGrid v3 mail endpoint used by utils/email_utils.py:
+
+    POST /v3/mail/send   -> 202 (empty body), messages kept in memory
+
+Behaviour knobs: latency (s per request), error_rate (share of 500s) and
+throttle_rps (429 + Retry-After above that many requests/s).
+
+    python benchmarks/mock_sendgrid.py --port 8766 --latency 0.1
+    SENDGRID_BASE_URL=http://127.0.0.1:8766 SENDGRID_KEY=x python track.py
+
+In-process use: ``server = serve(latency=...)`` then ``server.url`` /
+``server.messages`` / ``server.stats`` / ``server.shutdown()``.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockSendGrid(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, addr, latency=0.0, error_rate=0.0, throttle_rps=0.0):
+        super().__init__(addr, Handler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rps = throttle_rps
+        self.lock = threading.Lock()
+        self.window = []
+        self.messages = []
+        self.stats = {"requests": 0, "accepted": 0, "429": 0, "500": 0, "401": 0}
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def throttled(self):
+        if self.throttle_rps <= 0:
+            return False
+        now = time.monotonic()
+        with self.lock:
+            self.window = [t for t in self.window if now - t < 1.0]
+            if len(self.window) >= self.throttle_rps:
+                return True
+            self.window.append(now)
+        return False
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, code, body=None, headers=None):
+        data = json.dumps(body).encode("utf-8") if body is not None else b""
+        self.send_response(code)
+        self.send_header("Content-Length", str(len(data)))
+        if data:
+            self.send_header("Content-Type", "application/json")
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        srv = self.server
+        payload = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.path != "/v3/mail/send":
+            return self._send(404, {"errors": [{"message": "not found"}]})
+        srv.count("requests")
+        if not (self.headers.get("Authorization") or "").startswith("Bearer "):
+            srv.count("401")
+            return self._send(401, {"errors": [{"message": "authorization required"}]})
+        if srv.throttled():
+            srv.count("429")
+            return self._send(429, {"errors": [{"message": "too many requests"}]}, {"Retry-After": "1"})
+        if srv.latency:
+            time.sleep(srv.latency)
+        if srv.error_rate and random.random() < srv.error_rate:
+            srv.count("500")
+            return self._send(500, {"errors": [{"message": "internal error"}]})
+        msg = json.loads(payload or b"{}")
+        with srv.lock:
+            srv.messages.append(msg)
+        srv.count("accepted")
+        self._send(202)
+
+
+def serve(host="127.0.0.1", port=0, **kwargs):
+    """Start the mock in a background thread and return the server."""
+    server = MockSendGrid((host, port), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8766)
+    ap.add_argument("--latency", type=float, default=0.1)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--throttle-rps", type=float, default=0.0)
+    args = ap.parse_args()
+    server = MockSendGrid((args.host, args.port), latency=args.latency, error_rate=args.error_rate,
+                          throttle_rps=args.throttle_rps)
+    print(f"mock SendGrid on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"{server.stats['accepted']} message(s) accepted")
+
+
+if __name__ == "__main__":
+    main()
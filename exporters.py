@@ -6,6 +6,9 @@ from fpdf import FPDF
 from datetime import datetime
 import tempfile
 import os
+import numpy as np
+from utils.storage import get_history, get_history_arrays, get_history_rollups
+from utils.history import to_datetime64
 
 # -----------------------------
 # EXPORT CSV -> retourne (bytes, filename)
@@ -14,22 +17,31 @@ def export_csv(routes, filename=None):
     if filename is None:
         filename = f"export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
 
-    rows = []
+    # built column-wise from the history arrays: no per-point dicts
+    frames = []
     for r in routes:
-        for h in r.get("history", []):
-            rows.append({
-                "ID": r.get("id"),
-                "Origin": r.get("origin"),
-                "Destination": r.get("destination"),
-                "Departure": r.get("departure"),
-                "Return": r.get("return"),
-                "Cabin": r.get("cabin_class"),
-                "DirectOnly": r.get("direct_only"),
-                "MinBags": r.get("min_bags"),
-                "Price": h.get("price"),
-                "DateTracked": h.get("date")
-            })
-    df = pd.DataFrame(rows)
+        ts, prices = get_history_arrays(r)
+        if len(prices) == 0:
+            continue
+        # roll-up points come first in the arrays (utils/history.py); raw points have no min/max/agg
+        rollups = get_history_rollups(r)
+        pad = [None] * (len(prices) - len(rollups))
+        frames.append(pd.DataFrame({
+            "ID": r.get("id"),
+            "Origin": r.get("origin"),
+            "Destination": r.get("destination"),
+            "Departure": r.get("departure"),
+            "Return": r.get("return"),
+            "Cabin": r.get("cabin_class"),
+            "DirectOnly": r.get("direct_only"),
+            "MinBags": r.get("min_bags"),
+            "Price": np.asarray(prices),
+            "Min": pd.array([p.get("min") for p in rollups] + pad, dtype="Int64"),
+            "Max": pd.array([p.get("max") for p in rollups] + pad, dtype="Int64"),
+            "Agg": [p.get("agg") for p in rollups] + pad,
+            "DateTracked": np.datetime_as_string(to_datetime64(ts)),
+        }))
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
     csv_bytes = df.to_csv(index=False).encode("utf-8")
     return csv_bytes, filename
 
@@ -47,7 +59,7 @@ def export_xlsx(routes, filename=None):
         for r in routes:
             sheet_name = f"{r.get('origin','X')}-{r.get('destination','Y')}"
             sheet_name = sheet_name[:31]  # sheet name limit
-            hist = pd.DataFrame(r.get("history", []))
+            hist = pd.DataFrame(get_history(r))
             if hist.empty:
                 hist = pd.DataFrame(columns=["date", "price"])
             hist.to_excel(writer, sheet_name=sheet_name, index=False)
@@ -129,7 +141,7 @@ def export_pdf(routes, filename=None):
         pdf.ln(4)
 
         # Graphique historique
-        hist = r.get("history", [])
+        hist = get_history(r)
         if hist:
             dates = []
             prices = []
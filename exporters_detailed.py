@@ -2,7 +2,7 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_pdf import PdfPages
-from utils.storage import json_safe
+from utils.storage import json_safe, get_history
 from io import BytesIO
 
 # -----------------------------
@@ -16,7 +16,7 @@ def export_detailed_xlsx(routes, path="export_detailed.xlsx", single_route_id=No
 
         for r in selected_routes:
             sheet_name = f"{r['origin']}-{r['destination']}"[:31]
-            history = r.get("history", [])
+            history = get_history(r)
             df_hist = pd.DataFrame(history) if history else pd.DataFrame(columns=["date","price"])
 
             info_dict = {
@@ -80,7 +80,7 @@ def export_detailed_pdf(routes, path="export_detailed.pdf", single_route_id=None
         }.items()])
         plt.text(0,1, info_text, fontsize=10, va='top', ha='left', wrap=True)
 
-        history = r.get("history", [])
+        history = get_history(r)
         if history:
             dates = [d['date'] for d in history]
             prices = [d['price'] for d in history]
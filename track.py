@@ -1,53 +1,128 @@
-import random
+import argparse
+import os
+import time
 from datetime import datetime
-from utils.storage import (
-    load_routes, save_routes, load_email_config, append_log, 
-    count_updates_last_24h, ensure_route_fields, increment_route_stat
-)
+from utils.storage import load_routes, load_email_config, append_log, checkpoint_if_due
 from utils.email_utils import send_email
+from utils.retention import compact_routes
+from utils.providers import get_provider, PROVIDER, RecordingProvider, RECORDINGS_FILE
+from utils.tracking import run, CONCURRENCY
+from utils.scheduler import Scheduler
+from utils.sharding import ShardWorker, LeaseError, parse_shard
+from utils.flex import expand_grid, run as run_flex, FLEX_BUDGET
+from utils import search_cache
+from utils.outbox import Outbox, OutboxWorker, DRAIN_SECONDS
 
-routes = load_routes()
-email_cfg = load_email_config()
-GLOBAL_EMAIL = email_cfg.get("email", "")
-GLOBAL_ENABLED = email_cfg.get("enabled", False)
-
-run_ts = datetime.now().isoformat()
-append_log(f"{run_ts} - track.py start")
-
-changed = False
-
-for r in routes:
-    ensure_route_fields(r)
-    per_day = int(r.get("tracking_per_day", 1))
-    already_today = count_updates_last_24h(r)
-    if already_today >= per_day:
-        append_log(f"{datetime.now().isoformat()} - SKIP {r.get('id','?')} already_today={already_today} per_day={per_day}")
-        continue
-
-    # simulate price fetch
-    price = random.randint(120, 1000)
-    now = datetime.now().isoformat()
-    r.setdefault("history", []).append({"date": now, "price": price})
-    r["last_tracked"] = now
-    increment_route_stat(r, "updates_total")
-    increment_route_stat(r, "updates_today")
-    changed = True
-    append_log(f"{datetime.now().isoformat()} - UPDATED {r.get('id','?')} price={price}")
-
-    # Notification
-    recipient = r.get("email") or GLOBAL_EMAIL
-    if r.get("notifications") and recipient and (r.get("email") or GLOBAL_ENABLED):
-        target = r.get("target_price")
-        if target is not None and price <= target:
-            subject = f"[ALERTE] {r['origin']}→{r['destination']}: {price}€"
-            body = f"Prix actuel: {price}€\nSeuil: {target}€\nDates: {r.get('departure')} → {r.get('return')}"
-            ok, status = send_email(recipient, subject, body)
-            append_log(f"{datetime.now().isoformat()} - NOTIFY to={recipient} ok={ok} status={status}")
-            if ok:
-                increment_route_stat(r, "notifications_sent")
-
-if changed:
-    save_routes(routes)
-    append_log(f"{datetime.now().isoformat()} - track.py done: saved")
-else:
-    append_log(f"{datetime.now().isoformat()} - track.py done: no changes")
+
+def track_once(routes, provider, concurrency=CONCURRENCY, checkpoint=checkpoint_if_due, flex_budget=0,
+               outbox=None):
+    """
+    One tracking pass over the routes: fetch due prices, persist, queue the
+    alerts in the outbox, then (flex_budget > 0) search up to flex_budget
+    cells of the flexible-date windows, drain the outbox for at most
+    OUTBOX_DRAIN_SECONDS, save its snapshot, then checkpoint.
+    """
+    email_cfg = load_email_config()
+    outbox = outbox or Outbox()
+    run_ts = datetime.now().isoformat()
+    append_log(f"{run_ts} - track.py start provider={provider.name} concurrency={concurrency}")
+    # deliveries made since the last run (e.g. by python -m utils.outbox)
+    outbox.apply_deliveries(routes)
+
+    report = run(routes, provider, concurrency=concurrency, email_cfg=email_cfg, outbox=outbox)
+    append_log(f"{datetime.now().isoformat()} - track.py run: due={report['due']} requests={report['requests']} "
+               f"dedup={report['dedup_ratio']:.2f} updated={report['updated']} "
+               f"skipped={report['skipped']} no_offer={report['no_offer']} errors={report['errors']} "
+               f"digests={report['digests']} queued={report['queued']} elapsed={report['elapsed']:.2f}s")
+
+    flexible = [r for r in routes if len(expand_grid(r)) > 1]
+    if flex_budget > 0 and flexible:
+        frep = run_flex(flexible, provider, budget=flex_budget, concurrency=concurrency)
+        append_log(f"{datetime.now().isoformat()} - track.py flex: cells={frep['cells']} "
+                   f"requests={frep['requests']} updated={frep['updated']} errors={frep['errors']}")
+
+    cache = search_cache.stats()
+    if cache:
+        append_log(f"{datetime.now().isoformat()} - track.py cache: hits={cache['hits'] + cache['disk_hits']} "
+                   f"stale={cache['stale_hits']} misses={cache['misses']} refreshes={cache['refreshes']}")
+
+    drained = OutboxWorker(send_email, outbox).drain(deadline=time.time() + DRAIN_SECONDS)
+    delivered = outbox.apply_deliveries(routes)
+    # the queue outlives this run only through the committed snapshot (CI starts from a fresh checkout)
+    outbox.save_snapshot()
+    append_log(f"{datetime.now().isoformat()} - track.py outbox: sent={drained['sent']} retry={drained['pending']} "
+               f"dead={drained['dead']} deferred={drained['deferred']} notified={delivered} "
+               f"queue={outbox.stats()}")
+
+    if os.environ.get("HISTORY_COMPACT", "").strip().lower() in ("1", "true", "yes"):
+        # roll old points up into hourly/daily aggregates (logs a COMPACT line)
+        compact_routes(routes)
+
+    if report["updated"]:
+        # updates are already in the history store + WAL; the snapshot is only rewritten periodically
+        if checkpoint(routes):
+            append_log(f"{datetime.now().isoformat()} - track.py done: saved (checkpoint)")
+        else:
+            append_log(f"{datetime.now().isoformat()} - track.py done: logged (WAL)")
+    else:
+        append_log(f"{datetime.now().isoformat()} - track.py done: no changes")
+    return report
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Suivi des prix des routes enregistrées.")
+    ap.add_argument("--provider", default=PROVIDER, help="sim | amadeus | replay (env PRICE_PROVIDER)")
+    ap.add_argument("--record", nargs="?", const=RECORDINGS_FILE, metavar="FICHIER",
+                    help="enregistre les réponses du fournisseur (rejouables avec --provider replay, "
+                         f"env PROVIDER_RECORDINGS, défaut {RECORDINGS_FILE})")
+    ap.add_argument("--concurrency", type=int, default=CONCURRENCY,
+                    help="requêtes fournisseur simultanées (env TRACK_CONCURRENCY)")
+    ap.add_argument("--daemon", action="store_true",
+                    help="reste actif et suit chaque route selon tracking_per_day (voir utils/scheduler.py)")
+    ap.add_argument("--shard", metavar="i/N",
+                    help="ne suit que la partition i sur N (voir utils/sharding.py)")
+    ap.add_argument("--flex-budget", type=int, default=FLEX_BUDGET,
+                    help="cellules de dates flexibles cherchées par passage, une requête API chacune ; "
+                         "0 = aucune, par défaut (env FLEX_BUDGET) ; ignoré avec --shard et --daemon")
+    args = ap.parse_args()
+
+    provider = get_provider(args.provider)
+    if args.record:
+        provider = RecordingProvider(provider, args.record)
+    worker = None
+    if args.shard:
+        worker = ShardWorker(*parse_shard(args.shard))
+        try:
+            worker.start()
+        except LeaseError as e:
+            append_log(f"{datetime.now().isoformat()} - track.py shard {args.shard}: {e}")
+            raise SystemExit(f"shard {args.shard} déjà pris : {e}")
+    checkpoint = worker.checkpoint if worker else checkpoint_if_due
+    try:
+        if args.daemon:
+            loader = None
+            if worker:
+                loader = lambda: worker.select(load_routes(with_history=False))  # noqa: E731
+            outbox = Outbox()
+            sender = OutboxWorker(send_email, outbox)
+            sender.start()
+            try:
+                Scheduler(provider, concurrency=args.concurrency, email_cfg=load_email_config(),
+                          outbox=outbox, loader=loader, checkpoint=checkpoint,
+                          heartbeat=worker.heartbeat if worker else None).run_forever()
+            finally:
+                sender.stop()
+        else:
+            routes = load_routes()
+            if worker:
+                routes = worker.select(routes)
+            # flex_matrix.json is a single file: only a non-sharded run updates it
+            track_once(routes, provider, concurrency=args.concurrency, checkpoint=checkpoint,
+                       flex_budget=0 if worker else args.flex_budget)
+    finally:
+        if worker:
+            worker.stop()
+
+
+if __name__ == "__main__":
+    main()
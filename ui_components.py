@@ -3,12 +3,12 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime, date, timedelta
 import uuid
-import random
 from utils.storage import (
     load_routes, save_routes, ensure_route_fields, sanitize_dict,
     load_email_config, save_email_config, append_log, count_updates_last_24h
 )
 from utils.plotting import plot_price_history
+from utils.simulation import simulate_grid, simulate_price
 from exporters import export_csv, export_pdf, export_xlsx
 from email_utils import send_email
 
@@ -87,7 +87,7 @@ def render_dashboard(routes):
         # Actions
         with cols[1]:
             if st.button("Update", key=f"dash_update_{idx}"):
-                price = random.randint(120, 1000)
+                price = simulate_price(r)
                 r.setdefault("history", []).append({"date": datetime.now().isoformat(), "price": price})
                 r["last_tracked"] = datetime.now().isoformat()
                 save_routes(routes)
@@ -124,12 +124,12 @@ def render_dashboard(routes):
                     st.warning("Email non configuré ou notifications désactivées.")
                 else:
                     ok, info = send_email(rcpt, f"Test alerte {r['origin']}→{r['destination']}", "<p>Test</p>")
-if ok:
-    st.success("Email accepté par l'API SendGrid (voir détails).")
-    st.json(info)
-else:
-    st.error("Échec envoi. Voir détails ci-dessous.")
-    st.json(info)
+                    if ok:
+                        st.success("Email accepté par l'API SendGrid (voir détails).")
+                        st.json(info)
+                    else:
+                        st.error("Échec envoi. Voir détails ci-dessous.")
+                        st.json(info)
 
         with a2:
             st.write(f"Last tracked: {r.get('last_tracked') or 'Never'}")
@@ -272,7 +272,7 @@ def render_search_tab(routes):
         for o in origins:
             for d in dests:
                 for delta in range(-search_window, search_window+1):
-                    for _ in range(samples):
+                    for i in range(samples):
                         dep = start_date + timedelta(days=delta)
                         ret = dep + timedelta(days=stay_days)
                         results.append({
@@ -280,8 +280,11 @@ def render_search_tab(routes):
                             "departure": dep.isoformat(),
                             "return": ret.isoformat(),
                             "stay_days": stay_days,
-                            "price": random.randint(120,1200)
+                            "sample": i,
                         })
+        for row, price in zip(results, simulate_grid(results)):
+            row["price"] = price
+            del row["sample"]
         df_res = pd.DataFrame(results)
         st.session_state["last_search"] = df_res
         st.success(f"{len(df_res)} résultats générés")
@@ -1,7 +1,8 @@
 # utils/actions.py
 import uuid
 from datetime import datetime
-import random
+
+from .simulation import simulate_prices
 
 try:
     from ..email_utils import send_email
@@ -38,10 +39,10 @@ def add_route_from_dict(d: dict) -> dict:
     return new
 
 def bulk_update_sim(routes):
-    for r in routes:
-        price = random.randint(120, 1000)
-        r.setdefault("history", []).append({"date": datetime.now().isoformat(), "price": price})
-        r["last_tracked"] = datetime.now().isoformat()
+    now = datetime.now()
+    for r, price in zip(routes, simulate_prices(routes, now)):
+        r.setdefault("history", []).append({"date": now.isoformat(), "price": int(price)})
+        r["last_tracked"] = now.isoformat()
     return routes
 
 def send_test_email_for_route(route):
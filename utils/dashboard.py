@@ -1,9 +1,10 @@
 import pandas as pd
+from .storage import history_summary
 
 def create_flight_table(routes):
     rows = []
     for r in routes:
-        last_price = r.get("history")[-1]["price"] if r.get("history") else None
+        last_price = history_summary(r)["last"]
         gap = None
         if last_price is not None and r.get("target_price") is not None:
             gap = round(last_price - r["target_price"], 2)
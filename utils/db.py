@@ -1,48 +1,381 @@
 # utils/db.py
+"""
+SQLite backend for routes and price history.
+
+- ``routes``  : one row per route (configuration stored as JSON, ordered by position)
+- ``history`` : one row per price point, indexed on (route_id, ts)
+- ``rollups`` : hourly/daily aggregates written by the retention pass (utils/retention.py)
+- ``meta``    : extra top-level keys of the legacy data.json document + migration flag
+
+The database runs in WAL mode so the Streamlit app can read while track.py writes.
+``load_db`` / ``save_db`` keep the old data.json surface; ``append_price``,
+``get_history`` and ``update_route`` avoid touching the whole dataset.
+Each thread keeps one connection per database file (``close()`` releases it).
+"""
 import json
 import os
-from typing import Dict, Any
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional
 
 DATA_FILE = os.path.join(os.getcwd(), "data.json")
+DB_FILE = os.environ.get("ROUTES_DB", os.path.join(os.getcwd(), "data.db"))
+ROUTES_FILE = os.path.join(os.getcwd(), "routes.json")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS routes (
+    id       TEXT PRIMARY KEY,
+    position INTEGER NOT NULL DEFAULT 0,
+    data     TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS history (
+    route_id TEXT NOT NULL,
+    ts       TEXT NOT NULL,
+    price    INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_history_route_ts ON history(route_id, ts);
+CREATE TABLE IF NOT EXISTS rollups (
+    route_id  TEXT NOT NULL,
+    ts        TEXT NOT NULL,
+    price     INTEGER NOT NULL,
+    min_price INTEGER,
+    max_price INTEGER,
+    n         INTEGER,
+    agg       TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_rollups_route_ts ON rollups(route_id, ts);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_checked_migration = set()
+_schema_ready = set()
+_local = threading.local()
+
+
+# -------------------------
+# Connection
+# -------------------------
+def _connect(path: Optional[str] = None) -> sqlite3.Connection:
+    """
+    Connection of the calling thread for ``path``, opened on first use and then reused.
+    The schema and WAL mode are applied once per process and database file; a file
+    removed behind our back (or a forked child) gets a fresh connection.
+    """
+    path = path or DB_FILE
+    conns = getattr(_local, "conns", None)
+    if conns is None or _local.pid != os.getpid():
+        conns = _local.conns = {}
+        _local.pid = os.getpid()
+    conn = conns.get(path)
+    if conn is not None and not os.path.exists(path):
+        conns.pop(path).close()
+        conn = None
+    if conn is None:
+        if not os.path.exists(path):
+            _schema_ready.discard(path)
+        conn = conns[path] = sqlite3.connect(path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+    if path not in _schema_ready:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        _schema_ready.add(path)
+    return conn
 
 
-def _ensure_file():
-    """Create data.json if missing."""
-    if not os.path.exists(DATA_FILE):
-        initial = {"routes": []}
-        with open(DATA_FILE, "w", encoding="utf-8") as f:
-            json.dump(initial, f, indent=2, ensure_ascii=False)
+def close(path: Optional[str] = None) -> None:
+    """Close the calling thread's connection to ``path`` (all of them when None)."""
+    conns = getattr(_local, "conns", None) or {}
+    for p in [path] if path else list(conns):
+        conn = conns.pop(p, None)
+        if conn is not None:
+            conn.close()
 
 
-def load_db() -> Dict[str, Any]:
-    """Loads the DB and auto-converts old formats."""
-    _ensure_file()
+def _ensure_file(path: Optional[str] = None):
+    """Create the database (and migrate legacy JSON files once) if missing."""
+    path = path or DB_FILE
+    if path in _checked_migration and os.path.exists(path):
+        return
+    conn = _connect(path)
+    done = conn.execute("SELECT value FROM meta WHERE key='migrated'").fetchone()
+    if not done:
+        migrate_from_json(path=path)
+    _checked_migration.add(path)
 
-    with open(DATA_FILE, "r", encoding="utf-8") as f:
+
+def _route_row(r: Dict[str, Any], position: int):
+    cfg = {k: v for k, v in r.items() if k != "history"}
+    return (str(r.get("id")), position, json.dumps(cfg, ensure_ascii=False))
+
+
+def _insert_points(conn: sqlite3.Connection, route_id: str, points: List[Dict[str, Any]]):
+    rows, agg_rows = [], []
+    for h in points:
         try:
-            doc = json.load(f)
-        except json.JSONDecodeError:
-            # Corrupted JSON → reset
-            return {"routes": []}
+            if h.get("agg"):
+                agg_rows.append((route_id, str(h.get("date")), int(h.get("price")),
+                                 h.get("min"), h.get("max"), h.get("n"), h.get("agg")))
+            else:
+                rows.append((route_id, str(h.get("date")), int(h.get("price"))))
+        except Exception:
+            continue
+    conn.executemany("INSERT INTO history(route_id, ts, price) VALUES (?, ?, ?)", rows)
+    if agg_rows:
+        conn.executemany(
+            "INSERT INTO rollups(route_id, ts, price, min_price, max_price, n, agg) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            agg_rows,
+        )
 
-    # --- AUTO-CORRECT OLD FORMATS ---
-    # Case 1 : file is a list => convert
-    if isinstance(doc, list):
-        return {"routes": doc}
 
-    # Case 2 : file is not a dict => reset
-    if not isinstance(doc, dict):
-        return {"routes": []}
+def _rollup_point(ts, price, lo, hi, n, agg) -> Dict[str, Any]:
+    return {"date": ts, "price": price, "min": lo, "max": hi, "n": n, "agg": agg}
+
 
-    # Case 3 : dict missing "routes"
-    if "routes" not in doc or not isinstance(doc["routes"], list):
-        doc["routes"] = []
+def _count_points(conn: sqlite3.Connection) -> Dict[str, int]:
+    """Stored points (raw + roll-ups) per route, in one grouped scan of each (route_id, ts) index."""
+    counts: Dict[str, int] = {}
+    for table in ("history", "rollups"):
+        for rid, n in conn.execute(f"SELECT route_id, COUNT(*) FROM {table} GROUP BY route_id"):
+            counts[rid] = counts.get(rid, 0) + n
+    return counts
 
+
+def _replace_points(conn: sqlite3.Connection, route_id: str, points: List[Dict[str, Any]]):
+    conn.execute("DELETE FROM history WHERE route_id=?", (route_id,))
+    conn.execute("DELETE FROM rollups WHERE route_id=?", (route_id,))
+    _insert_points(conn, route_id, points)
+
+
+# -------------------------
+# Legacy document surface
+# -------------------------
+def load_db(with_history: bool = True, path: Optional[str] = None) -> Dict[str, Any]:
+    """Loads the DB as the legacy {"routes": [...], ...} document."""
+    _ensure_file(path)
+    conn = _connect(path)
+    doc: Dict[str, Any] = {}
+    for key, value in conn.execute("SELECT key, value FROM meta WHERE key != 'migrated'"):
+        try:
+            doc[key] = json.loads(value)
+        except Exception:
+            doc[key] = value
+    routes = []
+    for (data,) in conn.execute("SELECT data FROM routes ORDER BY position"):
+        try:
+            r = json.loads(data)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(r, dict):
+            routes.append(r)
+    if with_history:
+        by_id = {r.get("id"): r for r in routes}
+        for r in routes:
+            r["history"] = []
+        # roll-ups are always older than raw points: they come first
+        for rid, ts, price, lo, hi, n, agg in conn.execute(
+            "SELECT route_id, ts, price, min_price, max_price, n, agg FROM rollups ORDER BY route_id, ts"
+        ):
+            if rid in by_id:
+                by_id[rid]["history"].append(_rollup_point(ts, price, lo, hi, n, agg))
+        for rid, ts, price in conn.execute("SELECT route_id, ts, price FROM history ORDER BY route_id, ts"):
+            if rid in by_id:
+                by_id[rid]["history"].append({"date": ts, "price": price})
+    doc["routes"] = routes
     return doc
 
 
-def save_db(db: Dict[str, Any]) -> None:
-    """Overwrite data.json with db dict."""
-    _ensure_file()
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(db, f, indent=2, ensure_ascii=False)
+def save_db(db: Dict[str, Any], path: Optional[str] = None) -> None:
+    """
+    Persist a {"routes": [...]} document in one transaction.
+    Only history points beyond what the database already holds are inserted.
+    """
+    _ensure_file(path)
+    routes = db.get("routes", []) if isinstance(db, dict) else list(db or [])
+    conn = _connect(path)
+    with conn:
+        ids = []
+        counts = _count_points(conn) if any(isinstance(r.get("history"), list) for r in routes) else {}
+        for pos, r in enumerate(routes):
+            row = _route_row(r, pos)
+            ids.append(row[0])
+            conn.execute(
+                "INSERT INTO routes(id, position, data) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET position=excluded.position, data=excluded.data",
+                row,
+            )
+            hist = r.get("history")
+            if not isinstance(hist, list):
+                continue
+            # a shorter list (history not loaded, or already stored through
+            # append_price) adds nothing: only replace_history rewrites points
+            count = counts.get(row[0], 0)
+            if len(hist) > count:
+                _insert_points(conn, row[0], hist[count:])
+        # drop routes that are no longer in the document (temp table: no bound-variable limit)
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep_ids (id TEXT PRIMARY KEY)")
+        conn.execute("DELETE FROM keep_ids")
+        conn.executemany("INSERT OR IGNORE INTO keep_ids(id) VALUES (?)", [(i,) for i in ids])
+        conn.execute("DELETE FROM history WHERE route_id NOT IN (SELECT id FROM keep_ids)")
+        conn.execute("DELETE FROM rollups WHERE route_id NOT IN (SELECT id FROM keep_ids)")
+        conn.execute("DELETE FROM routes WHERE id NOT IN (SELECT id FROM keep_ids)")
+        if isinstance(db, dict):
+            for key, value in db.items():
+                if key != "routes":
+                    conn.execute(
+                        "INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)",
+                        (key, json.dumps(value, ensure_ascii=False)),
+                    )
+
+
+# -------------------------
+# Fine-grained calls
+# -------------------------
+def append_price(route_id: str, price: int, ts: Optional[str] = None, path: Optional[str] = None) -> Dict[str, Any]:
+    """Insert one price point (single-row write) and bump the route's last_tracked."""
+    ts = ts or datetime.now().isoformat()
+    conn = _connect(path)
+    with conn:
+        conn.execute("INSERT INTO history(route_id, ts, price) VALUES (?, ?, ?)", (route_id, ts, int(price)))
+        row = conn.execute("SELECT data FROM routes WHERE id=?", (route_id,)).fetchone()
+        if row:
+            cfg = json.loads(row[0])
+            cfg["last_tracked"] = ts
+            conn.execute("UPDATE routes SET data=? WHERE id=?", (json.dumps(cfg, ensure_ascii=False), route_id))
+    return {"date": ts, "price": int(price)}
+
+
+def get_history(route_id: str, since: Optional[str] = None, path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """History points of one route (optionally only those with ts >= since), served by the (route_id, ts) index."""
+    since = str(since) if since else ""
+    conn = _connect(path)
+    out = [
+        _rollup_point(*row) for row in conn.execute(
+            "SELECT ts, price, min_price, max_price, n, agg FROM rollups WHERE route_id=? AND ts >= ? ORDER BY ts",
+            (route_id, since),
+        )
+    ]
+    cur = conn.execute("SELECT ts, price FROM history WHERE route_id=? AND ts >= ? ORDER BY ts", (route_id, since))
+    out.extend({"date": ts, "price": price} for ts, price in cur)
+    return out
+
+
+def get_rollups(route_id: str, path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Roll-up points (with min/max) of one route, oldest first."""
+    conn = _connect(path)
+    return [_rollup_point(*row) for row in conn.execute(
+        "SELECT ts, price, min_price, max_price, n, agg FROM rollups WHERE route_id=? ORDER BY ts", (route_id,))]
+
+
+def used_bytes(path: Optional[str] = None) -> int:
+    """
+    Bytes held by live pages of the database ((page_count - freelist_count) *
+    page_size). Deleted rows only count once their page is freed.
+    """
+    conn = _connect(path)
+    (pages,) = conn.execute("PRAGMA page_count").fetchone()
+    (free,) = conn.execute("PRAGMA freelist_count").fetchone()
+    (size,) = conn.execute("PRAGMA page_size").fetchone()
+    return (pages - free) * size
+
+
+def replace_history(route_id: str, points: List[Dict[str, Any]], path: Optional[str] = None) -> None:
+    """Atomically replace all points (raw + roll-ups) of a route (used by compaction)."""
+    conn = _connect(path)
+    with conn:
+        _replace_points(conn, route_id, points)
+
+
+def update_route(route: Dict[str, Any], path: Optional[str] = None) -> None:
+    """Insert or update the configuration of a single route (history untouched)."""
+    conn = _connect(path)
+    with conn:
+        existing = conn.execute("SELECT position FROM routes WHERE id=?", (str(route.get("id")),)).fetchone()
+        if existing:
+            position = existing[0]
+        else:
+            (position,) = conn.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM routes").fetchone()
+        conn.execute(
+            "INSERT INTO routes(id, position, data) VALUES (?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET data=excluded.data",
+            _route_row(route, position),
+        )
+
+
+def delete_route(route_id: str, path: Optional[str] = None) -> None:
+    conn = _connect(path)
+    with conn:
+        conn.execute("DELETE FROM history WHERE route_id=?", (route_id,))
+        conn.execute("DELETE FROM rollups WHERE route_id=?", (route_id,))
+        conn.execute("DELETE FROM routes WHERE id=?", (route_id,))
+
+
+# -------------------------
+# Migration
+# -------------------------
+def _read_json(path: str):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def mark_migrated(value: str, path: Optional[str] = None) -> None:
+    """Flag the database as migrated without importing the legacy JSON files (value stored as is)."""
+    conn = _connect(path)
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('migrated', ?)", (value,))
+
+
+def migrate_from_json(routes_path: str = ROUTES_FILE, data_path: str = DATA_FILE, path: Optional[str] = None) -> int:
+    """
+    One-shot import of routes.json (+ history store) and data.json into the database.
+    routes.json wins when both files define the same route id. Returns the number of routes imported.
+    """
+    from .history import read_history
+
+    routes: List[Dict[str, Any]] = []
+    meta: Dict[str, Any] = {}
+    seen = set()
+
+    doc = _read_json(routes_path)
+    for r in doc if isinstance(doc, list) else []:
+        if isinstance(r, dict) and r.get("id") and r["id"] not in seen:
+            if not r.get("history"):
+                r["history"] = read_history(r["id"])
+            routes.append(r)
+            seen.add(r["id"])
+
+    doc = _read_json(data_path)
+    if isinstance(doc, list):
+        doc = {"routes": doc}
+    if isinstance(doc, dict):
+        for r in doc.get("routes", []) if isinstance(doc.get("routes"), list) else []:
+            if isinstance(r, dict) and r.get("id") and r["id"] not in seen:
+                routes.append(r)
+                seen.add(r["id"])
+        meta = {k: v for k, v in doc.items() if k != "routes"}
+
+    conn = _connect(path)
+    with conn:
+        if conn.execute("SELECT value FROM meta WHERE key='migrated'").fetchone():
+            return 0
+        for pos, r in enumerate(routes):
+            conn.execute("INSERT OR REPLACE INTO routes(id, position, data) VALUES (?, ?, ?)", _route_row(r, pos))
+            _insert_points(conn, str(r["id"]), r.get("history") or [])
+        for key, value in meta.items():
+            conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)",
+                         (key, json.dumps(value, ensure_ascii=False)))
+        conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('migrated', ?)",
+                     (datetime.now().isoformat(),))
+    return len(routes)
+
+
+if __name__ == "__main__":
+    n = migrate_from_json()
+    print(f"migrated {n} route(s) into {DB_FILE}")
@@ -1,8 +1,22 @@
 # utils/email_utils.py
+"""
+SendGrid mail sending.
+
+``Mailer`` posts to the SendGrid v3 API (/v3/mail/send) through one
+requests.Session (keep-alive), with the API key and sender resolved once
+(Streamlit secrets, then env vars). SENDGRID_BASE_URL points it at a local
+stand-in (benchmarks/mock_sendgrid.py). ``send_email`` uses a process-wide
+Mailer; its (ok, info) contract is unchanged.
+"""
 import os
 import logging
+import threading
+
+import requests
 
 DEFAULT_FROM = os.getenv("SENDGRID_FROM", "zendugan95@gmail.com")
+SENDGRID_BASE_URL = os.getenv("SENDGRID_BASE_URL", "https://api.sendgrid.com")
+SENDGRID_TIMEOUT = float(os.getenv("SENDGRID_TIMEOUT", "15"))
 
 # attempt to import Streamlit secrets (optional)
 try:
@@ -11,14 +25,6 @@ try:
 except Exception:
     _ST_AVAILABLE = False
 
-# attempt to import sendgrid
-try:
-    from sendgrid import SendGridAPIClient
-    from sendgrid.helpers.mail import Mail
-    _HAS_SENDGRID = True
-except Exception:
-    _HAS_SENDGRID = False
-
 logger = logging.getLogger("email_utils")
 
 
@@ -49,48 +55,73 @@ def _get_default_from():
     return os.environ.get("SENDGRID_FROM") or os.environ.get("EMAIL_FROM")
 
 
+class Mailer:
+    """Reusable SendGrid client: key / sender resolved once, pooled HTTP session."""
+
+    def __init__(self, api_key: str = None, from_email: str = None, base_url: str = None,
+                 timeout: float = SENDGRID_TIMEOUT, session=None):
+        self.api_key = api_key if api_key is not None else _get_sendgrid_key()
+        self.from_email = from_email or _get_default_from() or "no-reply@example.com"
+        self.base_url = (base_url or SENDGRID_BASE_URL).rstrip("/")
+        self.timeout = timeout
+        self.session = session or requests.Session()
+
+    def send(self, to: str, subject: str, body: str, from_email: str = None):
+        """
+        Send one email. Returns (ok: bool, info: dict)
+        info contains keys: msg, status_code (if any), response_body (if any), exc (if any)
+        """
+        info = {"msg": None, "status_code": None, "response_body": None, "exc": None}
+        if not self.api_key:
+            info["msg"] = "No SENDGRID key found (set in Streamlit secrets or env var)"
+            logger.warning(info["msg"])
+            return False, info
+        payload = {
+            "personalizations": [{"to": [{"email": to}]}],
+            "from": {"email": from_email or self.from_email},
+            "subject": subject,
+            "content": [{"type": "text/html", "value": body}],
+        }
+        try:
+            resp = self.session.post(f"{self.base_url}/v3/mail/send", json=payload, timeout=self.timeout,
+                                     headers={"Authorization": f"Bearer {self.api_key}"})
+        except Exception as e:
+            logger.exception("SendGrid send failed")
+            info["exc"] = str(e)
+            info["msg"] = "exception"
+            return False, info
+        status = resp.status_code
+        info["status_code"] = status
+        info["response_body"] = resp.text or None
+        info["retry_after"] = resp.headers.get("Retry-After")
+        # 202 = accepted by SendGrid
+        ok = status in (200, 202)
+        info["msg"] = "sent" if ok else f"HTTP {status}"
+        logger.info(f"SendGrid response: status={status} body={info['response_body']}")
+        return ok, info
+
+    def close(self):
+        self.session.close()
+
+
+_mailer = None
+_mailer_lock = threading.Lock()
+
+
+def get_mailer() -> Mailer:
+    """Process-wide Mailer (created on first use)."""
+    global _mailer
+    with _mailer_lock:
+        if _mailer is None:
+            _mailer = Mailer()
+        return _mailer
+
+
 def send_email(to: str, subject: str, body: str, from_email: str = None):
     """
-    Send email via SendGrid.
+    Send email via SendGrid (shared Mailer).
     Returns (ok: bool, info: dict)
     info contains keys: msg, status_code (if any), response_body (if any), exc (if any)
     """
-    info = {"msg": None, "status_code": None, "response_body": None, "exc": None}
-    key = _get_sendgrid_key()
-    if not key:
-        info["msg"] = "No SENDGRID key found (set in Streamlit secrets or env var)"
-        logger.warning(info["msg"])
-        return False, info
-
-    if not _HAS_SENDGRID:
-        info["msg"] = "sendgrid package not installed in environment"
-        logger.warning(info["msg"])
-        return False, info
-
-    if not from_email:
-        from_email = _get_default_from() or "no-reply@example.com"
-
-    try:
-        message = Mail(from_email=from_email, to_emails=to, subject=subject, html_content=body)
-        client = SendGridAPIClient(key)
-        response = client.send(message)
-        status = getattr(response, "status_code", None)
-        # try to get response body if present
-        resp_body = None
-        try:
-            resp_body = getattr(response, "body", None) or getattr(response, "text", None)
-        except Exception:
-            resp_body = None
-
-        info["msg"] = "sent" if status and int(status) in (200, 202) else "accepted" if status else "unknown"
-        info["status_code"] = status
-        info["response_body"] = resp_body
-        logger.info(f"SendGrid response: status={status} body={resp_body}")
-        # 202 = accepted by SendGrid
-        return (True, info) if status and int(status) in (200, 202) else (False, info)
-    except Exception as e:
-        logger.exception("SendGrid send failed")
-        info["exc"] = str(e)
-        info["msg"] = "exception"
-        return False, info
+    return get_mailer().send(to, subject, body, from_email)
             
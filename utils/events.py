@@ -0,0 +1,198 @@
+# utils/events.py
+"""
+Structured event log: one JSON object per line in ``events.jsonl``.
+
+    {"ts": "...", "type": "update", "route": "...", "price": 412}
+
+Types: update, skip, notify, push, log (free text from append_log).
+
+Events are buffered in memory and written in batches (EVENTS_BUFFER events
+or EVENTS_FLUSH_SECONDS after the first buffered one, and at exit) through a
+single open handle. When the file would exceed EVENTS_MAX_BYTES it is rotated
+to ``events.jsonl.1`` ... ``.EVENTS_BACKUPS``.
+
+``last_event(type)`` and ``tail_events(n)`` read the file backwards from the
+end block by block, so their cost depends on how far back the event is, not
+on the size of the log.
+"""
+import atexit
+import json
+import os
+import threading
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Iterator
+
+EVENTS_FILE = os.path.join(".", "events.jsonl")
+MAX_BYTES = int(os.environ.get("EVENTS_MAX_BYTES", str(1024 * 1024)))
+BACKUPS = int(os.environ.get("EVENTS_BACKUPS", "3"))
+BUFFER_EVENTS = int(os.environ.get("EVENTS_BUFFER", "64"))
+FLUSH_SECONDS = float(os.environ.get("EVENTS_FLUSH_SECONDS", "2"))
+
+EVENT_TYPES = ("update", "skip", "notify", "push", "log")
+
+_BLOCK = 8192
+
+
+def _reverse_lines(path: str) -> Iterator[bytes]:
+    """Lines of a file, last one first, reading fixed-size blocks from the end."""
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return
+    with f:
+        pos = f.seek(0, os.SEEK_END)
+        rest = b""
+        while pos > 0:
+            step = min(_BLOCK, pos)
+            pos -= step
+            f.seek(pos)
+            chunk = f.read(step) + rest
+            lines = chunk.split(b"\n")
+            # the first piece may be the end of a line that starts in an earlier block
+            rest = lines.pop(0)
+            for line in reversed(lines):
+                if line.strip():
+                    yield line
+        if rest.strip():
+            yield rest
+
+
+def _decode(line: bytes) -> Optional[Dict[str, Any]]:
+    try:
+        ev = json.loads(line)
+    except Exception:
+        # torn last line after a crash
+        return None
+    return ev if isinstance(ev, dict) else None
+
+
+class EventLog:
+    def __init__(self, path: str = EVENTS_FILE, max_bytes: int = MAX_BYTES, backups: int = BACKUPS,
+                 buffer_events: int = BUFFER_EVENTS, flush_seconds: float = FLUSH_SECONDS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.buffer_events = buffer_events
+        self.flush_seconds = flush_seconds
+        self._buf: List[Dict[str, Any]] = []
+        self._fh = None
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.RLock()
+
+    # -------------------------
+    # Writing
+    # -------------------------
+    def emit(self, type: str, **fields) -> Dict[str, Any]:
+        if type not in EVENT_TYPES:
+            raise ValueError(f"unknown event type: {type!r}")
+        ev = {"ts": datetime.now().isoformat(), "type": type}
+        ev.update(fields)
+        with self._lock:
+            self._buf.append(ev)
+            if len(self._buf) >= self.buffer_events:
+                self.flush()
+            elif self._timer is None and self.flush_seconds > 0:
+                self._timer = threading.Timer(self.flush_seconds, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        return ev
+
+    def flush(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._buf:
+                return
+            data = "".join(json.dumps(ev, ensure_ascii=False, separators=(",", ":"), default=str) + "\n"
+                           for ev in self._buf).encode("utf-8")
+            self._buf.clear()
+            try:
+                fh = self._open()
+                if fh.tell() and fh.tell() + len(data) > self.max_bytes:
+                    fh = self._rotate()
+                fh.write(data)
+                fh.flush()
+            except Exception:
+                # avoid raising from logging
+                pass
+
+    def _open(self):
+        if self._fh is None or self._fh.closed:
+            self._fh = open(self.path, "ab")
+        return self._fh
+
+    def _rotate(self):
+        self._fh.close()
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._fh = None
+        return self._open()
+
+    # -------------------------
+    # Reading
+    # -------------------------
+    def _files(self) -> List[str]:
+        return [self.path] + [f"{self.path}.{i}" for i in range(1, self.backups + 1)]
+
+    def iter_reverse(self, type: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Events newest first (buffered ones included), optionally of one type."""
+        with self._lock:
+            pending = list(self._buf)
+        for ev in reversed(pending):
+            if type is None or ev.get("type") == type:
+                yield ev
+        for path in self._files():
+            for line in _reverse_lines(path):
+                if type is not None and f'"type":"{type}"'.encode() not in line:
+                    continue
+                ev = _decode(line)
+                if ev is not None and (type is None or ev.get("type") == type):
+                    yield ev
+
+    def last(self, type: str) -> Optional[Dict[str, Any]]:
+        return next(self.iter_reverse(type), None)
+
+    def tail(self, n: int = 200, type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Last n events, oldest first."""
+        out = []
+        for ev in self.iter_reverse(type):
+            if len(out) >= n:
+                break
+            out.append(ev)
+        return out[::-1]
+
+
+_log = EventLog()
+atexit.register(_log.flush)
+
+
+def emit(type: str, **fields) -> Dict[str, Any]:
+    return _log.emit(type, **fields)
+
+
+def flush():
+    _log.flush()
+
+
+def last_event(type: str) -> Optional[Dict[str, Any]]:
+    """Most recent event of the given type, or None."""
+    return _log.last(type)
+
+
+def tail_events(n: int = 200, type: Optional[str] = None) -> List[Dict[str, Any]]:
+    return _log.tail(n, type)
+
+
+def format_event(ev: Dict[str, Any]) -> str:
+    """One human-readable line per event (log events keep their original text)."""
+    if ev.get("type") == "log":
+        return str(ev.get("msg", ""))
+    fields = " ".join(f"{k}={v}" for k, v in ev.items() if k not in ("ts", "type"))
+    return f"{ev.get('ts')} - {str(ev.get('type')).upper()} {fields}"
@@ -0,0 +1,16 @@
+# utils/fileio.py
+import os
+
+
+def atomic_write(path: str, data_bytes: bytes):
+    """Write bytes to a temp file and atomically replace target."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data_bytes)
+        f.flush()
+        try:
+            os.fsync(f.fileno())
+        except Exception:
+            # os.fsync may not be available in some environments, ignore if it fails
+            pass
+    os.replace(tmp, path)
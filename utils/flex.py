@@ -0,0 +1,223 @@
+# utils/flex.py
+"""
+Flexible-dates planner: cheapest (departure, return) matrix per route.
+
+Each route expands into a grid of date pairs:
+
+- departures : departure ± departure_flex_days (not in the past)
+- returns    : return ± return_flex_days, or departure + stay_min..stay_max
+               when the route has no return date
+- a cell is kept if return > departure and, when stay_max > 1, the stay is
+  within stay_min..stay_max
+
+Cells are deduped across routes by provider search key (utils.providers),
+so overlapping grids cost one request per distinct cell. A run searches at
+most FLEX_BUDGET cells: never-searched cells first, then the cells that have
+been cheapest so far, least recently searched first. Every cell is one
+provider search on top of the regular tracking, so the budget defaults to 0
+(off): set FLEX_BUDGET or ``track.py --flex-budget`` to opt in, e.g. 50
+cells per cron run costs 50 extra API calls per run.
+
+The best eligible fare per route and cell is kept in ``flex_matrix.json``:
+
+    {"cells":  {"<search key>": {"best": 412, "last": 430, "ts": "..."}},
+     "routes": {"<route id>": {"<dep>|<ret>": {"price": 412, "ts": "..."}}}}
+
+``cheapest_matrix(route)`` turns it into a departure x return table.
+"""
+import asyncio
+import json
+import os
+from datetime import date, datetime, timedelta
+from typing import List, Dict, Any, Optional, Tuple
+
+from .fileio import atomic_write
+from .providers import PriceProvider, search_query, search_key
+from .tracking import best_offers, offer_price, CONCURRENCY
+from .events import emit
+
+FLEX_FILE = os.path.join(".", "flex_matrix.json")
+FLEX_BUDGET = int(os.environ.get("FLEX_BUDGET", "0"))
+
+
+def _day(d: Any) -> Optional[date]:
+    if not d:
+        return None
+    try:
+        return datetime.fromisoformat(str(d)[:10]).date()
+    except Exception:
+        return None
+
+
+def _int(v: Any, default: int = 0) -> int:
+    try:
+        return max(int(v), 0)
+    except (TypeError, ValueError):
+        return default
+
+
+def expand_grid(route: Dict[str, Any], today: Optional[date] = None) -> List[Tuple[str, Optional[str]]]:
+    """(departure, return) ISO date pairs of a route's flexible window."""
+    today = today or date.today()
+    dep0 = _day(route.get("departure"))
+    if dep0 is None:
+        return []
+    dflex = _int(route.get("departure_flex_days"))
+    rflex = _int(route.get("return_flex_days"))
+    stay_min = _int(route.get("stay_min"), 1)
+    stay_max = max(_int(route.get("stay_max"), stay_min), stay_min)
+    ret0 = _day(route.get("return"))
+
+    cells = []
+    for i in range(-dflex, dflex + 1):
+        dep = dep0 + timedelta(days=i)
+        if dep < today:
+            continue
+        if ret0 is not None:
+            rets = [ret0 + timedelta(days=j) for j in range(-rflex, rflex + 1)]
+        elif stay_max > 0:
+            rets = [dep + timedelta(days=s) for s in range(max(stay_min, 1), stay_max + 1)]
+        else:
+            cells.append((dep.isoformat(), None))
+            continue
+        for ret in rets:
+            stay = (ret - dep).days
+            if stay <= 0:
+                continue
+            if ret0 is not None and stay_max > 1 and not stay_min <= stay <= stay_max:
+                continue
+            cells.append((dep.isoformat(), ret.isoformat()))
+    return cells
+
+
+def _cell_id(dep: str, ret: Optional[str]) -> str:
+    return f"{dep}|{ret or ''}"
+
+
+def _key_str(key: tuple) -> str:
+    return json.dumps(key, separators=(",", ":"))
+
+
+# -------------------------
+# State
+# -------------------------
+def load_state(path: str = FLEX_FILE) -> Dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except Exception:
+        state = {}
+    if not isinstance(state, dict):
+        state = {}
+    state.setdefault("cells", {})
+    state.setdefault("routes", {})
+    return state
+
+
+def save_state(state: Dict[str, Any], routes: Optional[List[Dict[str, Any]]] = None, path: str = FLEX_FILE):
+    if routes is not None:
+        # forget deleted routes
+        ids = {r.get("id") for r in routes}
+        state["routes"] = {k: v for k, v in state["routes"].items() if k in ids}
+    atomic_write(path, json.dumps(state, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+# -------------------------
+# Planning
+# -------------------------
+def plan(routes: List[Dict[str, Any]], state: Dict[str, Any], budget: int = FLEX_BUDGET,
+         today: Optional[date] = None) -> Tuple[List[Tuple[Dict[str, Any], List[Tuple[Dict[str, Any], str]]]], int]:
+    """
+    Pick the cells to search this run.
+    Returns ([(query, [(route, cell id), ...]), ...] limited to budget, number of distinct cells).
+    """
+    cells: Dict[tuple, Tuple[Dict[str, Any], List[Tuple[Dict[str, Any], str]]]] = {}
+    for r in routes:
+        base = search_query(r)
+        for dep, ret in expand_grid(r, today):
+            query = dict(base, departure=dep, **{"return": ret})
+            cells.setdefault(search_key(query), (query, []))[1].append((r, _cell_id(dep, ret)))
+
+    def priority(key: tuple):
+        known = state["cells"].get(_key_str(key))
+        if not known:
+            return (0, 0, "")
+        return (1, known.get("best", float("inf")), known.get("ts", ""))
+
+    order = sorted(cells, key=priority)
+    return [cells[k] for k in order[:max(budget, 0)]], len(cells)
+
+
+async def run_flex(routes: List[Dict[str, Any]], provider: PriceProvider, budget: int = FLEX_BUDGET,
+                   concurrency: int = CONCURRENCY, state: Optional[Dict[str, Any]] = None,
+                   today: Optional[date] = None) -> Dict[str, Any]:
+    """Search the planned cells and update the matrix. Returns a report."""
+    own_state = state is None
+    state = state if state is not None else load_state()
+    selected, total = plan(routes, state, budget, today)
+    report = {"cells": total, "requests": len(selected), "errors": 0, "updated": 0}
+    sem = asyncio.Semaphore(max(concurrency, 1))
+    now = datetime.now().isoformat()
+
+    async def one(query, members):
+        async with sem:
+            try:
+                offers = await provider.search(query)
+            except Exception as e:
+                report["errors"] += 1
+                emit("skip", reason="flex_provider_error", departure=query["departure"],
+                     error=str(e), routes=len(members))
+                return
+        prices = [offer_price(o) for o in offers if offer_price(o) is not None]
+        cell = state["cells"].setdefault(_key_str(search_key(query)), {})
+        if prices:
+            cheapest = int(round(min(prices)))
+            cell["last"] = cheapest
+            cell["best"] = min(cell.get("best", cheapest), cheapest)
+        cell["ts"] = now
+        for (r, cid), offer in zip(members, best_offers([r for r, _ in members], offers)):
+            if offer is None:
+                continue
+            price = int(round(offer_price(offer)))
+            per_route = state["routes"].setdefault(r["id"], {})
+            prev = per_route.get(cid)
+            per_route[cid] = {"price": price, "ts": now,
+                              "best": min(price, prev.get("best", price)) if prev else price}
+            report["updated"] += 1
+
+    await asyncio.gather(*(one(q, m) for q, m in selected))
+    if own_state:
+        save_state(state, routes)
+    return report
+
+
+def run(routes: List[Dict[str, Any]], provider: PriceProvider, **kwargs) -> Dict[str, Any]:
+    return asyncio.run(run_flex(routes, provider, **kwargs))
+
+
+# -------------------------
+# Reading
+# -------------------------
+def cheapest_matrix(route: Dict[str, Any], state: Optional[Dict[str, Any]] = None):
+    """
+    (departures, returns, matrix) for a route: matrix[i][j] is the latest
+    price found for departures[i] / returns[j], None if not searched yet.
+    """
+    state = state if state is not None else load_state()
+    cells = state["routes"].get(route.get("id"), {})
+    grid = expand_grid(route, today=date.min)
+    deps = sorted({d for d, _ in grid})
+    rets = sorted({r or "" for _, r in grid})
+    matrix = [[(cells.get(_cell_id(d, r or None)) or {}).get("price") for r in rets] for d in deps]
+    return deps, rets, matrix
+
+
+def cheapest_cell(route: Dict[str, Any], state: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """Cheapest known (departure, return, price) of the route's window."""
+    state = state if state is not None else load_state()
+    best = None
+    for cid, v in state["routes"].get(route.get("id"), {}).items():
+        if best is None or v["price"] < best["price"]:
+            dep, _, ret = cid.partition("|")
+            best = {"departure": dep, "return": ret or None, "price": v["price"], "ts": v.get("ts")}
+    return best
@@ -0,0 +1,265 @@
+# utils/git_push.py
+"""
+Background git commit + push, coalesced.
+
+save_routes(commit_and_push=True) only queues the paths to commit; a daemon
+thread waits until no new request arrived for GIT_PUSH_DEBOUNCE seconds
+(default 10, at most GIT_PUSH_MAX_DELAY = 60s after the first one) and then
+runs a single ``git add / commit / push`` for everything queued meanwhile.
+The Streamlit request never waits for the network.
+
+Config (env):
+  GIT_PUSH=true                  enable
+  GIT_PUSH_TOKEN / GITHUB_TOKEN  token for the GitHub remote
+  GITHUB_REPOSITORY              "owner/repo" (else derived from origin)
+  GIT_PUSH_REMOTE_URL            explicit remote URL (e.g. a local bare repo), no token needed
+  GIT_PUSH_REMOTE                name of the persistent remote (default "autopush")
+
+The remote is created once and only updated when its URL changes.
+``push_status()`` returns the outcome of the last attempt of this process;
+each attempt is also recorded as a "push" event (utils/events.py).
+"""
+import atexit
+import os
+import subprocess
+import threading
+import time
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+from . import events
+
+DEBOUNCE_SECONDS = float(os.environ.get("GIT_PUSH_DEBOUNCE", "10"))
+MAX_DELAY_SECONDS = float(os.environ.get("GIT_PUSH_MAX_DELAY", "60"))
+REMOTE_NAME = os.environ.get("GIT_PUSH_REMOTE", "autopush")
+
+_cond = threading.Condition()
+_pending_paths: List[str] = []
+_pending_msgs: List[str] = []
+_first_request: Optional[float] = None
+_last_request: Optional[float] = None
+_immediate = False
+_in_flight = False
+_running = False
+_worker: Optional[threading.Thread] = None
+_status: Dict[str, Any] = {"ok": None, "msg": "no push yet", "detail": None, "ts": None,
+                           "pending": 0, "pushes": 0}
+
+
+def _enabled() -> bool:
+    return os.environ.get("GIT_PUSH", "").lower() in ("1", "true", "yes")
+
+
+def _git(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(["git", *args], check=True, capture_output=True, text=True)
+
+
+def _out(e: subprocess.CalledProcessError) -> str:
+    return ((e.stdout or "") + (e.stderr or "")).strip() or str(e)
+
+
+def remote_url() -> Optional[str]:
+    """URL the worker pushes to, or None if it cannot be determined."""
+    url = os.environ.get("GIT_PUSH_REMOTE_URL")
+    if url:
+        return url
+    token = os.environ.get("GIT_PUSH_TOKEN") or os.environ.get("GITHUB_TOKEN")
+    if not token:
+        return None
+    repo = os.environ.get("GITHUB_REPOSITORY")  # expected "owner/repo"
+    if not repo:
+        try:
+            url = _git("remote", "get-url", "origin").stdout.strip()
+        except Exception:
+            url = ""
+        if url.startswith("git@"):
+            # git@github.com:owner/repo.git
+            repo = url.split(":", 1)[1]
+        elif url:
+            # https://github.com/owner/repo.git
+            parts = url.split("/")
+            if len(parts) >= 2:
+                repo = parts[-2] + "/" + parts[-1]
+        if repo and repo.endswith(".git"):
+            repo = repo[:-4]
+    if not repo:
+        return None
+    return f"https://{token}@github.com/{repo}.git"
+
+
+def _ensure_remote(url: str):
+    """Create the persistent push remote, or update it if the URL changed."""
+    try:
+        current = _git("remote", "get-url", REMOTE_NAME).stdout.strip()
+    except subprocess.CalledProcessError:
+        _git("remote", "add", REMOTE_NAME, url)
+        return
+    if current != url:
+        _git("remote", "set-url", REMOTE_NAME, url)
+
+
+def commit_and_push(paths: List[str], commit_msg: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Synchronous commit + push of the given paths (those that exist).
+    Returns a dict with keys: ok (bool), msg (str), detail (optional).
+    """
+    if not _enabled():
+        return {"ok": False, "msg": "git push not enabled", "detail": None}
+    url = remote_url()
+    if not url:
+        return {"ok": False, "msg": "no remote: set GIT_PUSH_TOKEN + GITHUB_REPOSITORY or GIT_PUSH_REMOTE_URL",
+                "detail": None}
+    try:
+        _ensure_remote(url)
+    except subprocess.CalledProcessError as e:
+        return {"ok": False, "msg": "git remote setup failed", "detail": _out(e)}
+    except Exception as e:
+        return {"ok": False, "msg": "git not available", "detail": str(e)}
+
+    paths = list(dict.fromkeys(paths))
+    try:
+        # paths removed since the last commit (e.g. a rotated routes.wal) are staged as deletions
+        to_add = [p for p in paths if os.path.exists(p) or _git("ls-files", "--", p).stdout.strip()]
+    except subprocess.CalledProcessError as e:
+        return {"ok": False, "msg": "git ls-files failed", "detail": _out(e)}
+    if to_add:
+        try:
+            _git("add", "-A", "--", *to_add)
+        except subprocess.CalledProcessError as e:
+            return {"ok": False, "msg": "git add failed", "detail": _out(e)}
+        if not commit_msg:
+            commit_msg = f"Auto update {os.path.basename(to_add[0])} via app at {datetime.now().isoformat()}"
+        try:
+            _git("commit", "-m", commit_msg)
+        except subprocess.CalledProcessError as e:
+            if "nothing to commit" not in _out(e).lower():
+                return {"ok": False, "msg": "git commit failed", "detail": _out(e)}
+    # push even without a new commit: a previous push may have failed
+    try:
+        p = _git("push", REMOTE_NAME, "HEAD")
+        return {"ok": True, "msg": "pushed", "detail": (p.stdout or p.stderr or "").strip()}
+    except subprocess.CalledProcessError as e:
+        return {"ok": False, "msg": "git push failed", "detail": _out(e).replace(url, REMOTE_NAME)}
+
+
+# -------------------------
+# Worker
+# -------------------------
+def _due(now: float) -> bool:
+    if _immediate:
+        return True
+    return now - _last_request >= DEBOUNCE_SECONDS or now - _first_request >= MAX_DELAY_SECONDS
+
+
+def _take() -> Optional[tuple]:
+    """Wait for a batch to be due. Returns (paths, msgs) or None when the worker should stop."""
+    global _first_request, _last_request, _immediate, _in_flight
+    with _cond:
+        while True:
+            if _pending_paths:
+                now = time.time()
+                if _due(now):
+                    batch = (list(_pending_paths), list(_pending_msgs))
+                    _pending_paths.clear()
+                    _pending_msgs.clear()
+                    _first_request = _last_request = None
+                    _immediate = False
+                    _in_flight = True
+                    return batch
+                wait = min(_last_request + DEBOUNCE_SECONDS, _first_request + MAX_DELAY_SECONDS) - now
+                _cond.wait(max(wait, 0.01))
+            elif not _running:
+                return None
+            else:
+                _cond.wait()
+
+
+def _run():
+    while True:
+        batch = _take()
+        if batch is None:
+            return
+        _push_batch(*batch)
+
+
+def _push_batch(paths: List[str], msgs: List[str]):
+    global _in_flight
+    msgs = list(dict.fromkeys(m for m in msgs if m))
+    if len(msgs) == 1:
+        commit_msg = msgs[0]
+    else:
+        commit_msg = f"Auto update via app at {datetime.now().isoformat()}"
+    try:
+        res = commit_and_push(paths, commit_msg)
+    except Exception as e:
+        res = {"ok": False, "msg": "exception", "detail": str(e)}
+    ts = datetime.now().isoformat()
+    with _cond:
+        _status.update(res, ts=ts, pending=len(set(_pending_paths)))
+        if res.get("ok"):
+            _status["pushes"] += 1
+        _in_flight = False
+        _cond.notify_all()
+    events.emit("push", ok=res.get("ok"), msg=res.get("msg"), detail=res.get("detail"), files=len(set(paths)))
+
+
+def _ensure_worker():
+    global _worker, _running
+    if _worker is None or not _worker.is_alive():
+        _running = True
+        _worker = threading.Thread(target=_run, name="git-push", daemon=True)
+        _worker.start()
+
+
+def request_push(paths: List[str], commit_msg: Optional[str] = None, immediate: bool = False):
+    """Queue paths for the next coalesced commit + push (returns immediately)."""
+    global _first_request, _last_request, _immediate
+    if not _enabled():
+        events.emit("push", ok=False, msg="git push not enabled", detail=None, files=0)
+        return
+    with _cond:
+        now = time.time()
+        _pending_paths.extend(paths)
+        if commit_msg:
+            _pending_msgs.append(commit_msg)
+        _first_request = _first_request or now
+        _last_request = now
+        _immediate = _immediate or immediate
+        _status["pending"] = len(set(_pending_paths))
+        _ensure_worker()
+        _cond.notify_all()
+
+
+def push_now():
+    """Do not wait for the debounce delay for what is queued (non-blocking)."""
+    global _immediate
+    with _cond:
+        if _pending_paths:
+            _immediate = True
+            _cond.notify_all()
+
+
+def flush(timeout: Optional[float] = None) -> bool:
+    """Push whatever is queued now and wait for it, and for a push already running. Returns False on timeout."""
+    global _immediate
+    deadline = None if timeout is None else time.time() + timeout
+    with _cond:
+        while _pending_paths or _in_flight:
+            if _pending_paths and not _immediate:
+                _immediate = True
+                _cond.notify_all()
+            left = None if deadline is None else deadline - time.time()
+            if left is not None and left <= 0:
+                return False
+            _cond.wait(left)
+    return True
+
+
+def push_status() -> Dict[str, Any]:
+    """Outcome of the last push attempt of this process: ok, msg, detail, ts, pending, pushes."""
+    with _cond:
+        return dict(_status)
+
+
+# scripts (track.py) exit right after saving: push what is still queued
+atexit.register(flush, 120)
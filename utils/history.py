@@ -0,0 +1,320 @@
+# utils/history.py
+"""
+Append-only price-history store.
+
+Each route owns one segment file in ``history/``. New observations are
+appended to the end of the segment, so recording a price costs O(1) I/O
+whatever the size of the history; ``routes.json`` only keeps the route
+configuration.
+
+Two segment encodings are supported (HISTORY_FORMAT env var):
+
+- ``jsonl`` (default): ``<id>.jsonl``, one ``{"date": ..., "price": ...}`` per line
+- ``bin``            : ``<id>.bin``, packed little-endian records
+  (int64 epoch seconds, int32 price) = 12 bytes per point, memory-mapped
+  with NumPy by ``read_history_arrays``. Existing ``.jsonl`` segments are
+  converted on first access.
+
+Roll-up points produced by the retention pass (utils/retention.py) carry an
+``agg`` key plus ``min``/``max``/``n``; they are kept in a small
+``<id>.rollup.jsonl`` next to the raw segment and returned first (they are
+always older than the raw points) by every reader.
+"""
+import json
+import os
+import struct
+from datetime import datetime
+from typing import List, Dict, Any, Iterable, Tuple
+
+from .fileio import atomic_write
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+HISTORY_DIR = os.path.join(".", "history")
+HISTORY_FORMAT = os.environ.get("HISTORY_FORMAT", "jsonl").strip().lower()
+
+_BIN_RECORD = struct.Struct("<qi")
+BIN_DTYPE = np.dtype([("ts", "<i8"), ("price", "<i4")]) if np is not None else None
+
+# route id -> number of leading points of the route's in-memory history list
+# that are already in the store (set when the list is attached or replaced)
+_persisted: Dict[str, int] = {}
+
+
+# -------------------------
+# Paths / encoding
+# -------------------------
+def _safe(route_id: str) -> str:
+    return str(route_id).replace(os.sep, "_").replace("/", "_")
+
+
+def _jsonl_path(route_id: str) -> str:
+    return os.path.join(HISTORY_DIR, f"{_safe(route_id)}.jsonl")
+
+
+def _bin_path(route_id: str) -> str:
+    return os.path.join(HISTORY_DIR, f"{_safe(route_id)}.bin")
+
+
+def _rollup_path(route_id: str) -> str:
+    return os.path.join(HISTORY_DIR, f"{_safe(route_id)}.rollup.jsonl")
+
+
+def _segment_path(route_id: str) -> str:
+    if HISTORY_FORMAT == "bin":
+        _convert_to_bin(route_id)
+        return _bin_path(route_id)
+    return _jsonl_path(route_id)
+
+
+def _encode_point(point: Dict[str, Any]) -> str:
+    return json.dumps(point, ensure_ascii=False, separators=(",", ":"))
+
+
+def to_epoch(d: Any) -> int:
+    """ISO string / datetime / number -> epoch seconds (naive dates are local time)."""
+    if isinstance(d, (int, float)):
+        return int(d)
+    if isinstance(d, datetime):
+        return int(d.timestamp())
+    return int(datetime.fromisoformat(str(d)).timestamp())
+
+
+def to_datetime64(ts: Any):
+    """Epoch seconds array -> naive local datetime64[s] array (same wall-clock as the ISO dates)."""
+    offset = int(datetime.now().astimezone().utcoffset().total_seconds())
+    return (np.asarray(ts, dtype="<i8") + offset).astype("datetime64[s]")
+
+
+def _pack(points: Iterable[Dict[str, Any]]) -> bytes:
+    out = []
+    for p in points:
+        try:
+            out.append(_BIN_RECORD.pack(to_epoch(p.get("date")), int(p.get("price"))))
+        except Exception:
+            continue
+    return b"".join(out)
+
+
+def _read_jsonl(path: str) -> List[Dict[str, Any]]:
+    points: List[Dict[str, Any]] = []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    p = json.loads(line)
+                except Exception:
+                    continue
+                if isinstance(p, dict):
+                    points.append(p)
+    except FileNotFoundError:
+        pass
+    return points
+
+
+def _convert_to_bin(route_id: str):
+    """One-time conversion of a legacy .jsonl segment into the binary encoding."""
+    src = _jsonl_path(route_id)
+    if os.path.exists(src) and not os.path.exists(_bin_path(route_id)):
+        atomic_write(_bin_path(route_id), _pack(_read_jsonl(src)))
+        os.remove(src)
+
+
+# -------------------------
+# Segment I/O
+# -------------------------
+def read_rollups(route_id: str) -> List[Dict[str, Any]]:
+    return _read_jsonl(_rollup_path(route_id))
+
+
+def read_history_arrays(route_id: str) -> Tuple[Any, Any]:
+    """
+    (timestamps, prices) of a route: epoch seconds and integer prices (the
+    last price of the bucket for roll-up points).
+    With the bin encoding and NumPy available the raw part is a read-only
+    memory-mapped view, no per-point Python objects are built.
+    """
+    rollups = read_rollups(route_id)
+    ts, prices = _read_raw_arrays(route_id)
+    if not rollups:
+        return ts, prices
+    rts, rprices = points_to_arrays(rollups)
+    if np is not None:
+        return np.concatenate([rts, np.asarray(ts, dtype="<i8")]), np.concatenate([rprices, np.asarray(prices, dtype="<i4")])
+    return list(rts) + list(ts), list(rprices) + list(prices)
+
+
+def _read_raw_arrays(route_id: str) -> Tuple[Any, Any]:
+    path = _segment_path(route_id)
+    if HISTORY_FORMAT == "bin":
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        n = size // _BIN_RECORD.size
+        if np is not None:
+            if n == 0:
+                return np.empty(0, dtype="<i8"), np.empty(0, dtype="<i4")
+            rec = np.memmap(path, dtype=BIN_DTYPE, mode="r", shape=(n,))
+            return rec["ts"], rec["price"]
+        with open(path, "rb") as f:
+            data = f.read(n * _BIN_RECORD.size)
+        pairs = list(_BIN_RECORD.iter_unpack(data))
+        return [t for t, _ in pairs], [p for _, p in pairs]
+    return points_to_arrays(_read_jsonl(path))
+
+
+def read_history(route_id: str) -> List[Dict[str, Any]]:
+    """Read all points of a route as dicts. Malformed lines (e.g. a torn last write) are skipped."""
+    if HISTORY_FORMAT == "bin":
+        ts, prices = _read_raw_arrays(route_id)
+        points = [{"date": datetime.fromtimestamp(int(t)).isoformat(), "price": int(p)} for t, p in zip(ts, prices)]
+    else:
+        points = _read_jsonl(_segment_path(route_id))
+    return read_rollups(route_id) + points
+
+
+def append_points(route_id: str, points: Iterable[Dict[str, Any]]):
+    """Append points at the end of the route segment (one small write, no rewrite)."""
+    points = list(points)
+    if not points:
+        return
+    os.makedirs(HISTORY_DIR, exist_ok=True)
+    if HISTORY_FORMAT == "bin":
+        data = _pack(points)
+        with open(_segment_path(route_id), "ab") as f:
+            torn = f.tell() % _BIN_RECORD.size
+            if torn:
+                # drop a partial record left by an interrupted write
+                f.truncate(f.tell() - torn)
+            f.write(data)
+            f.flush()
+    else:
+        lines = [_encode_point(p) for p in points]
+        with open(_segment_path(route_id), "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+
+
+def append_point(route_id: str, point: Dict[str, Any]):
+    append_points(route_id, [point])
+
+
+def write_history(route_id: str, points: List[Dict[str, Any]]):
+    """Atomically replace the whole history (used for migrations and compaction)."""
+    os.makedirs(HISTORY_DIR, exist_ok=True)
+    rollups = [p for p in points if p.get("agg")]
+    raw = [p for p in points if not p.get("agg")]
+    if HISTORY_FORMAT == "bin":
+        data = _pack(raw)
+    else:
+        data = "".join(_encode_point(p) + "\n" for p in raw).encode("utf-8")
+    atomic_write(_segment_path(route_id), data)
+    if rollups:
+        atomic_write(_rollup_path(route_id), "".join(_encode_point(p) + "\n" for p in rollups).encode("utf-8"))
+    elif os.path.exists(_rollup_path(route_id)):
+        os.remove(_rollup_path(route_id))
+    _persisted[route_id] = len(points)
+
+
+def delete_history(route_id: str):
+    for path in (_jsonl_path(route_id), _bin_path(route_id), _rollup_path(route_id)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    _persisted.pop(route_id, None)
+
+
+def has_segment(route_id: str) -> bool:
+    return os.path.exists(_jsonl_path(route_id)) or os.path.exists(_bin_path(route_id))
+
+
+def segment_bytes(route_id: str) -> int:
+    """On-disk size of a route's history (raw segment + roll-ups)."""
+    total = 0
+    for path in (_jsonl_path(route_id), _bin_path(route_id), _rollup_path(route_id)):
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            pass
+    return total
+
+
+def points_to_arrays(points: Iterable[Dict[str, Any]]) -> Tuple[Any, Any]:
+    """Convert [{"date", "price"}, ...] into (epoch seconds, prices) arrays."""
+    ts, prices = [], []
+    for p in points:
+        try:
+            ts.append(to_epoch(p.get("date")))
+            prices.append(int(p.get("price")))
+        except Exception:
+            continue
+    if np is not None:
+        return np.asarray(ts, dtype="<i8"), np.asarray(prices, dtype="<i4")
+    return ts, prices
+
+
+# -------------------------
+# Route-level helpers
+# -------------------------
+def attach_history(routes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Fill route['history'] from the store.
+    Legacy routes that still carry an inline history and have no segment yet are migrated.
+    """
+    for r in routes:
+        rid = r.get("id")
+        if not rid:
+            r.setdefault("history", [])
+            continue
+        inline = r.get("history") or []
+        if inline and not has_segment(rid):
+            write_history(rid, inline)
+            r["history"] = list(inline)
+        else:
+            r["history"] = read_history(rid)
+            _persisted[rid] = len(r["history"])
+    return routes
+
+
+def note_appended(route: Dict[str, Any]):
+    """The last point of route['history'] was just written to the store."""
+    hist = route.get("history")
+    rid = route.get("id")
+    if rid and isinstance(hist, list) and _persisted.get(rid, 0) == len(hist) - 1:
+        _persisted[rid] = len(hist)
+
+
+def persist_new_points(routes: List[Dict[str, Any]]):
+    """
+    Append to the store the points added to an attached history list since
+    it was attached (or last saved). Routes without a history list (loaded
+    with with_history=False) are skipped; their points go through
+    append_price. A list shorter than what is known to be stored is never
+    written back: only replace_history / compaction rewrites a segment.
+    Segments of routes known to this process but no longer present are removed.
+    """
+    seen = set()
+    for r in routes:
+        rid = r.get("id")
+        if not rid:
+            continue
+        seen.add(rid)
+        hist = r.get("history")
+        if not isinstance(hist, list):
+            continue
+        done = _persisted.get(rid, 0)
+        if len(hist) > done:
+            append_points(rid, hist[done:])
+        _persisted[rid] = len(hist)
+    for rid in [k for k in _persisted if k not in seen]:
+        delete_history(rid)
+
+
+def strip_history(route: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of the route without its history (what goes into routes.json)."""
+    return {k: v for k, v in route.items() if k != "history"}
@@ -0,0 +1,198 @@
+# utils/notify.py
+"""
+Per-recipient alert digests for the tracking pipeline.
+
+During a run, every route whose new price is at or under its target_price
+is added to a ``Digest`` (recipient resolution as before: route email, else
+the global address when notifications are enabled). At the end of the run
+each recipient gets one email listing all their alerts, cheapest first,
+instead of one email per route.
+
+Alert hysteresis: a route that stays under its target is not alerted on
+every run. Its last alert is kept in route["alert"] = {"price", "ts",
+"armed", "target"} (a WAL "set" record, O(1) to check) and a new alert
+needs, depending on route["alert_mode"] (default ALERT_MODE):
+
+- ``rearm``   (default) the price went back above target * (1 + ALERT_REARM)
+              since the last alert, or fell ALERT_REARM below the last
+              alerted price;
+- ``new_low`` the price is under the last alerted price;
+- ``always``  every observation under the target (previous behaviour).
+
+Except in ``always`` mode, alerts for a route are at least
+ALERT_MIN_INTERVAL seconds apart (default 6 h). Changing the target price
+resets the state.
+
+The new state of an alert is only saved once the email is delivered
+(``Digest.send`` on success, ``Outbox.apply_deliveries`` for queued
+digests), so an alert whose message fails or goes dead does not silence
+the following ones. Re-arming (price back above the band) is saved at once.
+
+track.py queues the digests in the durable outbox (``Digest.enqueue``,
+utils/outbox.py) and lets its worker deliver them. ``Digest.send`` sends
+directly: a small thread pool (NOTIFY_WORKERS, default 4) calls a shared
+send function (utils.email_utils.send_email reuses one SendGrid session),
+paced by a token bucket (NOTIFY_RATE emails/s, default 5). The outbox
+worker uses the same pool size and rate.
+"""
+import html
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .events import emit
+from .ratelimit import TokenBucket
+from .storage import increment_route_stat, set_route_fields
+
+NOTIFY_WORKERS = int(os.environ.get("NOTIFY_WORKERS", "4"))
+NOTIFY_RATE = float(os.environ.get("NOTIFY_RATE", "5"))
+ALERT_MODE = os.environ.get("ALERT_MODE", "rearm")
+ALERT_REARM = float(os.environ.get("ALERT_REARM", "0.05"))
+ALERT_MIN_INTERVAL = float(os.environ.get("ALERT_MIN_INTERVAL", str(6 * 3600)))
+ALERT_MODES = ("rearm", "new_low", "always")
+
+
+def recipient_of(route: Dict[str, Any], email_cfg: Dict[str, Any]) -> Optional[str]:
+    recipient = route.get("email") or email_cfg.get("email", "")
+    if route.get("notifications") and recipient and (route.get("email") or email_cfg.get("enabled", False)):
+        return recipient
+    return None
+
+
+def alert_decision(route: Dict[str, Any], price: int, now: Optional[float] = None
+                   ) -> Tuple[bool, Optional[Dict[str, Any]]]:
+    """
+    (alert?, new alert state or None if unchanged) for a price observed on
+    a route.
+    """
+    target = route.get("target_price")
+    if target is None:
+        return False, None
+    now = time.time() if now is None else now
+    state = route.get("alert") or {}
+    if state.get("target") != target:
+        state = {}
+    if price > target:
+        if state and not state.get("armed") and price > target * (1 + ALERT_REARM):
+            return False, dict(state, armed=True)
+        return False, None
+    mode = route.get("alert_mode") or ALERT_MODE
+    if mode not in ALERT_MODES:
+        mode = "rearm"
+    if mode == "always" or not state:
+        ok = True
+    elif now - state.get("ts", 0) < ALERT_MIN_INTERVAL:
+        ok = False
+    elif mode == "new_low":
+        ok = price < state.get("price", price + 1)
+    else:
+        ok = bool(state.get("armed")) or price <= state.get("price", price) * (1 - ALERT_REARM)
+    if not ok:
+        return False, None
+    return True, {"price": price, "ts": int(now), "armed": False, "target": target}
+
+
+def save_alert_state(route: Dict[str, Any], state: Optional[Dict[str, Any]]):
+    """Save the state of a delivered alert, unless the route already holds a newer one."""
+    if not state:
+        return
+    current = route.get("alert") or {}
+    if current.get("target") == state.get("target") and current.get("ts", 0) > state.get("ts", 0):
+        return
+    set_route_fields(route, alert=state)
+
+
+def render_digest(alerts: List[Tuple[Dict[str, Any], int]]) -> Tuple[str, str]:
+    """(subject, html body) of a recipient's alerts."""
+    alerts = sorted(alerts, key=lambda a: a[1])
+    if len(alerts) == 1:
+        r, price = alerts[0]
+        subject = f"[ALERTE] {r['origin']}→{r['destination']}: {price}€"
+    else:
+        subject = f"[ALERTE] {len(alerts)} vols sous votre seuil (dès {alerts[0][1]}€)"
+    rows = "".join(
+        f"<tr><td>{html.escape(str(r.get('origin')))}→{html.escape(str(r.get('destination')))}</td>"
+        f"<td>{html.escape(str(r.get('departure')))} → {html.escape(str(r.get('return')))}</td>"
+        f"<td><b>{price}€</b></td><td>{r.get('target_price')}€</td></tr>"
+        for r, price in alerts)
+    body = ("<p>Prix sous votre seuil :</p><table>"
+            "<tr><th>Trajet</th><th>Dates</th><th>Prix actuel</th><th>Seuil</th></tr>"
+            f"{rows}</table>")
+    return subject, body
+
+
+class Digest:
+    """Alerts collected during one run, grouped by recipient."""
+
+    def __init__(self, email_cfg: Optional[Dict[str, Any]] = None):
+        self.email_cfg = email_cfg or {}
+        self.alerts: Dict[str, List[Tuple[Dict[str, Any], int]]] = {}
+        # route id -> alert state to save once the alert is delivered
+        self.states: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, route: Dict[str, Any], price: int, now: Optional[float] = None) -> bool:
+        """Queue an alert if the route wants one for this price (see alert_decision)."""
+        recipient = recipient_of(route, self.email_cfg)
+        ok, state = alert_decision(route, price, now)
+        if ok and not recipient:
+            return False
+        if not ok:
+            if state is not None:
+                # re-armed: not tied to a delivery
+                set_route_fields(route, alert=state)
+            if route.get("target_price") is not None and price <= route["target_price"]:
+                emit("skip", route=route.get("id"), reason="alert_hysteresis", price=price)
+            return False
+        self.alerts.setdefault(recipient, []).append((route, price))
+        self.states[route.get("id")] = state
+        return True
+
+    def __len__(self):
+        return sum(len(v) for v in self.alerts.values())
+
+    def enqueue(self, outbox) -> Dict[str, int]:
+        """Queue one digest per recipient in an Outbox. Returns {"digests", "queued"}."""
+        report = {"digests": len(self.alerts), "queued": 0}
+        for recipient, alerts in self.alerts.items():
+            subject, body = render_digest(alerts)
+            # the alert state travels with the message: saved by apply_deliveries once sent
+            items = [{"id": r.get("id"), "price": price, "alert": self.states.get(r.get("id"))}
+                     for r, price in alerts]
+            if outbox.enqueue(recipient, subject, body, items):
+                report["queued"] += 1
+        return report
+
+    def send(self, send_email: Callable, workers: int = NOTIFY_WORKERS, rate: float = NOTIFY_RATE) -> Dict[str, int]:
+        """
+        Send one digest per recipient. Returns {"digests", "sent", "failed",
+        "notified"} (notified = routes covered by a delivered digest).
+        """
+        report = {"digests": len(self.alerts), "sent": 0, "failed": 0, "notified": 0}
+        if not self.alerts:
+            return report
+        bucket = TokenBucket(rate, capacity=1)
+
+        def one(recipient):
+            subject, body = render_digest(self.alerts[recipient])
+            bucket.acquire()
+            try:
+                ok, info = send_email(recipient, subject, body)
+            except Exception as e:
+                ok, info = False, {"msg": "exception", "exc": str(e)}
+            return recipient, bool(ok), info
+
+        with ThreadPoolExecutor(max(1, min(workers, len(self.alerts)))) as pool:
+            results = list(pool.map(one, list(self.alerts)))
+        for recipient, ok, info in results:
+            alerts = self.alerts[recipient]
+            status = info.get("status_code") if isinstance(info, dict) else info
+            report["sent" if ok else "failed"] += 1
+            for r, price in alerts:
+                emit("notify", route=r.get("id"), to=recipient, price=price, ok=ok, status=status,
+                     digest=len(alerts))
+                if ok:
+                    increment_route_stat(r, "notifications_sent")
+                    save_alert_state(r, self.states.get(r.get("id")))
+                    report["notified"] += 1
+        return report
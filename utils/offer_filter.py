@@ -0,0 +1,162 @@
+# utils/offer_filter.py
+"""
+Offer filter / rank engine: cheapest eligible offer per route.
+
+One coalesced search (utils/tracking.py, utils/flex.py) answers many routes
+with the same offers; each route then applies its own constraints:
+
+- avoid_airlines      : no validating / marketing carrier in the list
+- max_stops           : at most N connections per itinerary ("any" = no limit)
+- direct_only         : same as max_stops = 0
+- min_bags            : at least N included checked bags
+- cabin_class         : offer cabin equal to the route cabin (offers without
+                        a cabin are accepted)
+- preferred_airlines  : ranking, not filtering. The cheapest eligible offer
+                        of a preferred airline wins if it costs at most
+                        OFFER_PREFERRED_MARGIN (default 10%) more than the
+                        cheapest eligible offer overall
+
+With NumPy, offers are laid out as columns (price, stops, bags, cabin, a
+carrier membership matrix) and routes as constraint vectors, so a batch is
+evaluated with a handful of (routes x offers) masks and one argmin per row.
+Without NumPy the same rules run in plain Python.
+"""
+import os
+from typing import Any, Dict, List, Optional
+
+from .offers import Offer
+from .providers import CABINS
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+PREFERRED_MARGIN = float(os.environ.get("OFFER_PREFERRED_MARGIN", "0.10"))
+
+CABIN_CODES = {"ECONOMY": 0, "PREMIUM_ECONOMY": 1, "BUSINESS": 2, "FIRST": 3}
+_ANY_STOPS = 99
+_NO_CABIN, _UNKNOWN_CABIN = -1, -2
+
+
+def _airlines(route: Dict[str, Any], key: str) -> set:
+    return {str(a).strip().upper() for a in route.get(key) or [] if str(a).strip()}
+
+
+def max_stops_of(route: Dict[str, Any]) -> Optional[int]:
+    if route.get("direct_only"):
+        return 0
+    try:
+        return int(route.get("max_stops"))
+    except (TypeError, ValueError):
+        # "any"
+        return None
+
+
+def cabin_of(route: Dict[str, Any]) -> str:
+    return CABINS.get(str(route.get("cabin_class") or "economy").strip().lower(), "ECONOMY")
+
+
+def eligible(route: Dict[str, Any], offer: Offer) -> bool:
+    """Does the offer satisfy the route constraints?"""
+    if offer.price is None:
+        return False
+    avoid = _airlines(route, "avoid_airlines")
+    if avoid and avoid.intersection(offer.carriers):
+        return False
+    max_stops = max_stops_of(route)
+    if max_stops is not None and offer.stops > max_stops:
+        return False
+    if int(route.get("min_bags") or 0) > offer.bags:
+        return False
+    return offer.cabin is None or offer.cabin == cabin_of(route)
+
+
+def _pick(route: Dict[str, Any], offers: List[Offer], margin: float) -> Optional[Offer]:
+    best = best_pref = None
+    preferred = _airlines(route, "preferred_airlines")
+    for o in offers:
+        if not eligible(route, o):
+            continue
+        if best is None or o.price < best.price:
+            best = o
+        if preferred and preferred.intersection(o.carriers) and (best_pref is None or o.price < best_pref.price):
+            best_pref = o
+    if best_pref is not None and best_pref.price <= best.price * (1 + margin):
+        return best_pref
+    return best
+
+
+class OfferBatch:
+    """Columnar view of a list of offers (NumPy arrays)."""
+
+    def __init__(self, offers: List[Offer]):
+        self.offers = list(offers)
+        n = len(self.offers)
+        self.price = np.fromiter((o.price if o.price is not None else np.inf for o in self.offers), float, n)
+        self.stops = np.fromiter((o.stops for o in self.offers), np.int16, n)
+        self.bags = np.fromiter((o.bags for o in self.offers), np.int16, n)
+        # -1: no cabin given (any route accepts it), -2: a cabin no route can ask for (rejected),
+        # matching eligible()
+        self.cabin = np.fromiter((_NO_CABIN if o.cabin is None else CABIN_CODES.get(o.cabin, _UNKNOWN_CABIN)
+                                  for o in self.offers), np.int8, n)
+        self.carrier_index: Dict[str, int] = {}
+        cells = [(i, self.carrier_index.setdefault(c, len(self.carrier_index)))
+                 for i, o in enumerate(self.offers) for c in o.carriers]
+        self.carriers = np.zeros((n, max(len(self.carrier_index), 1)), dtype=bool)
+        if cells:
+            rows, cols = zip(*cells)
+            self.carriers[list(rows), list(cols)] = True
+
+    def airline_matrix(self, routes: List[Dict[str, Any]], key: str):
+        """(routes x carriers) membership of each route's airline list."""
+        m = np.zeros((len(routes), self.carriers.shape[1]), dtype=bool)
+        for i, r in enumerate(routes):
+            for a in _airlines(r, key):
+                j = self.carrier_index.get(a)
+                if j is not None:
+                    m[i, j] = True
+        return m
+
+    def eligible_mask(self, routes: List[Dict[str, Any]]):
+        """(routes x offers) boolean mask of the offers each route accepts."""
+        limits = [max_stops_of(r) for r in routes]
+        max_stops = np.array([_ANY_STOPS if s is None else s for s in limits], np.int16)
+        min_bags = np.array([int(r.get("min_bags") or 0) for r in routes], np.int16)
+        cabin = np.array([CABIN_CODES[cabin_of(r)] for r in routes], np.int8)
+        mask = (self.stops[None, :] <= max_stops[:, None]) & (self.bags[None, :] >= min_bags[:, None])
+        mask &= (self.cabin[None, :] == _NO_CABIN) | (self.cabin[None, :] == cabin[:, None])
+        mask &= np.isfinite(self.price)[None, :]
+        avoid = self.airline_matrix(routes, "avoid_airlines")
+        if avoid.any():
+            mask &= ~(avoid @ self.carriers.T)
+        return mask
+
+    def best(self, routes: List[Dict[str, Any]], margin: float = PREFERRED_MARGIN) -> List[Optional[Offer]]:
+        if not self.offers or not routes:
+            return [None] * len(routes)
+        mask = self.eligible_mask(routes)
+        rows = np.arange(len(routes))
+        priced = np.where(mask, self.price[None, :], np.inf)
+        choice = priced.argmin(axis=1)
+        best_price = priced[rows, choice]
+        preferred = self.airline_matrix(routes, "preferred_airlines")
+        if preferred.any():
+            pref_priced = np.where(mask & (preferred @ self.carriers.T), self.price[None, :], np.inf)
+            pref_choice = pref_priced.argmin(axis=1)
+            use_pref = pref_priced[rows, pref_choice] <= best_price * (1 + margin)
+            choice = np.where(use_pref, pref_choice, choice)
+        return [self.offers[c] if np.isfinite(p) else None for c, p in zip(choice.tolist(), best_price.tolist())]
+
+
+def best_offers(routes: List[Dict[str, Any]], offers: List[Offer],
+                margin: float = PREFERRED_MARGIN) -> List[Optional[Offer]]:
+    """Cheapest eligible offer (preferred airlines first, see module doc) for each route, or None."""
+    if np is None:
+        return [_pick(r, offers, margin) for r in routes]
+    return OfferBatch(offers).best(routes, margin)
+
+
+def best_offer(route: Dict[str, Any], offers: List[Offer]) -> Optional[Offer]:
+    """Cheapest eligible offer for one route, or None."""
+    return _pick(route, offers, PREFERRED_MARGIN)
@@ -0,0 +1,221 @@
+# utils/offers.py
+"""
+Compact offer model.
+
+Amadeus flight-offers are deeply nested dicts (itineraries, segments,
+pricing per traveler, fare details per segment...). We only keep:
+
+    Offer(id, price, currency, carriers, stops, bags, cabin,
+          departure, arrival, return_departure, return_arrival)
+
+- carriers : validating + marketing carriers, sorted tuple
+- stops    : max connections over the itineraries
+- bags     : min included checked bags over the fare details
+- cabin    : cabin of the first fare detail (ECONOMY, BUSINESS...)
+- times    : ISO datetimes of the outbound / return first departure and
+             last arrival (None when unknown)
+
+``Offer`` uses __slots__, so a parsed offer costs a few hundred bytes
+instead of several KB for the raw dict.
+
+Parsers:
+  parse_offer(d)        one raw offer -> Offer (None without a price)
+  parse_offers(items)   generator over raw offers
+  iter_offers_json(fp)  streams the "data" array of a flight-offers response
+                        (file or HTTP body): only one raw offer is decoded
+                        at a time (ijson when installed, else a small
+                        incremental reader over json.JSONDecoder.raw_decode)
+"""
+import codecs
+import json
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+try:
+    import ijson
+except Exception:
+    ijson = None
+
+
+class Offer:
+    __slots__ = ("id", "price", "currency", "carriers", "stops", "bags", "cabin",
+                 "departure", "arrival", "return_departure", "return_arrival")
+
+    def __init__(self, id: str, price: float, currency: str = "EUR", carriers: Tuple[str, ...] = (),
+                 stops: int = 0, bags: int = 0, cabin: Optional[str] = None,
+                 departure: Optional[str] = None, arrival: Optional[str] = None,
+                 return_departure: Optional[str] = None, return_arrival: Optional[str] = None):
+        self.id = id
+        self.price = price
+        self.currency = currency
+        self.carriers = carriers
+        self.stops = stops
+        self.bags = bags
+        self.cabin = cabin
+        self.departure = departure
+        self.arrival = arrival
+        self.return_departure = return_departure
+        self.return_arrival = return_arrival
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = {k: getattr(self, k) for k in self.__slots__}
+        d["carriers"] = list(self.carriers)
+        return d
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Offer":
+        return cls(**dict(d, carriers=tuple(d.get("carriers") or ())))
+
+    def to_amadeus(self) -> Dict[str, Any]:
+        """Minimal raw Amadeus offer that parses back to this Offer (mock server replay)."""
+        carriers = list(self.carriers) or [None]
+        itineraries = []
+        for dep, arr in ((self.departure, self.arrival), (self.return_departure, self.return_arrival)):
+            if not itineraries or dep or arr:
+                segs = [{"carrierCode": carriers[i % len(carriers)], "departure": {}, "arrival": {}}
+                        for i in range(self.stops + 1)]
+                if dep:
+                    segs[0]["departure"]["at"] = dep
+                if arr:
+                    segs[-1]["arrival"]["at"] = arr
+                itineraries.append({"segments": segs})
+        fare = {"includedCheckedBags": {"quantity": self.bags}}
+        if self.cabin:
+            fare["cabin"] = self.cabin
+        return {"id": self.id, "price": {"total": f"{self.price:.2f}", "currency": self.currency},
+                "validatingAirlineCodes": list(self.carriers[:1]), "itineraries": itineraries,
+                "travelerPricings": [{"fareDetailsBySegment": [fare]}]}
+
+    def __eq__(self, other):
+        return isinstance(other, Offer) and all(getattr(self, k) == getattr(other, k) for k in self.__slots__)
+
+    def __repr__(self):
+        return (f"Offer({self.id!r}, {self.price:.2f} {self.currency}, {'/'.join(self.carriers)}, "
+                f"stops={self.stops}, bags={self.bags}, cabin={self.cabin})")
+
+
+def _at(point: Any) -> Optional[str]:
+    return point.get("at") if isinstance(point, dict) else None
+
+
+def parse_offer(d: Dict[str, Any]) -> Optional[Offer]:
+    """Project one raw Amadeus offer onto an Offer (None if it has no usable price)."""
+    try:
+        price = float(d["price"]["total"])
+    except Exception:
+        return None
+    carriers = set(d.get("validatingAirlineCodes") or [])
+    stops = 0
+    times = []
+    for it in d.get("itineraries") or []:
+        segs = it.get("segments") or []
+        stops = max(stops, len(segs) - 1)
+        for seg in segs:
+            if seg.get("carrierCode"):
+                carriers.add(seg["carrierCode"])
+        times.append((_at(segs[0].get("departure")), _at(segs[-1].get("arrival"))) if segs else (None, None))
+    bags = None
+    cabin = None
+    for tp in d.get("travelerPricings") or []:
+        for fd in tp.get("fareDetailsBySegment") or []:
+            qty = int((fd.get("includedCheckedBags") or {}).get("quantity", 0) or 0)
+            bags = qty if bags is None else min(bags, qty)
+            cabin = cabin or fd.get("cabin")
+    out_times = times[0] if times else (None, None)
+    ret_times = times[1] if len(times) > 1 else (None, None)
+    return Offer(str(d.get("id", "")), price, (d.get("price") or {}).get("currency", "EUR"),
+                 tuple(sorted(carriers)), stops, bags or 0, cabin,
+                 out_times[0], out_times[1], ret_times[0], ret_times[1])
+
+
+def parse_offers(items: Iterable[Dict[str, Any]]) -> Iterator[Offer]:
+    for d in items:
+        o = parse_offer(d)
+        if o is not None:
+            yield o
+
+
+class _Reader:
+    """Text buffer over a binary stream, refilled on demand."""
+
+    def __init__(self, fp, chunk: int):
+        self.fp = fp
+        self.chunk = chunk
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        if self.eof:
+            return False
+        data = self.fp.read(self.chunk)
+        if not data:
+            self.eof = True
+            self.buf += self.decoder.decode(b"", final=True)
+            return False
+        # drop what has been consumed
+        self.buf = self.buf[self.pos:] + self.decoder.decode(data)
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Next non-blank character (not consumed), '' at the end."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, chars: str) -> str:
+        c = self.peek()
+        if not c or c not in chars:
+            raise ValueError(f"invalid flight-offers JSON: expected {chars!r}, got {c!r}")
+        self.pos += 1
+        return c
+
+    def value(self, _decoder=json.JSONDecoder()):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # a number may continue in the next chunk
+            if end == len(self.buf) and not self.eof and isinstance(value, (int, float)) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def _iter_data(fp, chunk: int = 1 << 16) -> Iterator[Dict[str, Any]]:
+    """Items of the top-level "data" array; the keys before it (meta) are decoded and skipped."""
+    r = _Reader(fp, chunk)
+    r.expect("{")
+    while True:
+        if r.peek() == "}":
+            return
+        key = r.value()
+        r.expect(":")
+        if key == "data":
+            break
+        r.value()
+        if r.peek() == ",":
+            r.pos += 1
+    r.expect("[")
+    if r.peek() == "]":
+        return
+    while True:
+        yield r.value()
+        if r.expect(",]") == "]":
+            return
+
+
+def iter_offers_json(fp) -> Iterator[Offer]:
+    """Offers of a flight-offers JSON document read from a binary file object."""
+    if ijson is not None:
+        return parse_offers(ijson.items(fp, "data.item"))
+    return parse_offers(_iter_data(fp))
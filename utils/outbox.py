@@ -0,0 +1,399 @@
+# utils/outbox.py
+"""
+Durable email outbox (SQLite, OUTBOX_DB default ./outbox.db).
+
+The tracking pipeline only enqueues digests (utils/notify.py); a worker
+drains the outbox, so a slow or failing mail service never slows tracking
+down and an alert is not lost when a send fails.
+
+- idempotency : a message id is a hash of recipient, alerts (route, price)
+                and day; enqueuing the same digest twice is a no-op
+- claiming    : a worker takes a message by moving it to "sending" with a
+                lease (OUTBOX_LEASE_SECONDS); a crashed worker's messages
+                become due again when the lease expires
+- backoff     : failed sends are retried after base * 2^attempts seconds
+                (OUTBOX_BACKOFF_BASE 30s, capped at OUTBOX_BACKOFF_MAX 1h,
+                jittered; Retry-After wins when given) up to
+                OUTBOX_MAX_ATTEMPTS (8), then the message is "dead".
+                Client errors other than 401/408/429 are dead at once
+- breaker     : after OUTBOX_BREAKER_FAILURES (5) consecutive failures no
+                send is tried for OUTBOX_BREAKER_SECONDS (60s), then one
+                probe decides whether it closes again
+
+Persistence: outbox.db lives next to the data, but a CI runner (the GitHub
+workflow) starts from a fresh checkout every time. ``save_snapshot()``
+writes the rows still needed (undelivered, dead, or sent in the last
+SNAPSHOT_KEEP_DAYS so a re-run does not queue them again) to OUTBOX_SNAPSHOT
+(default ./outbox.jsonl), which is committed with the data; ``Outbox()``
+merges it back into the database (rows already in the database win).
+track.py saves it after each pass; set OUTBOX_SNAPSHOT= to disable.
+
+Delivered messages keep their route ids until ``apply_deliveries(routes)``
+adds them to stats.notifications_sent in the process that owns the routes
+(track.py, the scheduler), so the counter only reflects real deliveries.
+
+CLI: python -m utils.outbox [--loop] [--stats]
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from .events import emit
+from .fileio import atomic_write
+from .ratelimit import TokenBucket
+
+OUTBOX_DB = os.environ.get("OUTBOX_DB", os.path.join(".", "outbox.db"))
+MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "8"))
+BACKOFF_BASE = float(os.environ.get("OUTBOX_BACKOFF_BASE", "30"))
+BACKOFF_MAX = float(os.environ.get("OUTBOX_BACKOFF_MAX", "3600"))
+LEASE_SECONDS = float(os.environ.get("OUTBOX_LEASE_SECONDS", "300"))
+BREAKER_FAILURES = int(os.environ.get("OUTBOX_BREAKER_FAILURES", "5"))
+BREAKER_SECONDS = float(os.environ.get("OUTBOX_BREAKER_SECONDS", "60"))
+POLL_SECONDS = float(os.environ.get("OUTBOX_POLL_SECONDS", "5"))
+# how long a one-shot track.py run keeps draining before it exits
+DRAIN_SECONDS = float(os.environ.get("OUTBOX_DRAIN_SECONDS", "30"))
+OUTBOX_SNAPSHOT = os.environ.get("OUTBOX_SNAPSHOT", os.path.join(".", "outbox.jsonl"))
+SNAPSHOT_KEEP_DAYS = float(os.environ.get("OUTBOX_SNAPSHOT_KEEP_DAYS", "2"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id           TEXT PRIMARY KEY,
+    recipient    TEXT NOT NULL,
+    subject      TEXT NOT NULL,
+    body         TEXT NOT NULL,
+    routes       TEXT NOT NULL,
+    status       TEXT NOT NULL DEFAULT 'pending',
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    created      REAL NOT NULL,
+    sent_at      REAL,
+    applied      INTEGER NOT NULL DEFAULT 0,
+    last_error   TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, next_attempt);
+"""
+
+# client errors worth retrying (credentials fixed, timeout, throttling)
+_RETRYABLE_4XX = (401, 408, 429)
+_COLUMNS = ("id", "recipient", "subject", "body", "routes", "status", "attempts", "next_attempt", "created",
+            "sent_at", "applied", "last_error")
+
+
+def message_id(recipient: str, alerts: List[Dict[str, Any]], day: Optional[str] = None) -> str:
+    """Idempotency key of a digest: recipient + (route, price) pairs + day."""
+    day = day or time.strftime("%Y-%m-%d")
+    items = sorted(f"{a['id']}:{a['price']}" for a in alerts)
+    return hashlib.blake2b("|".join([recipient, day] + items).encode("utf-8"), digest_size=16).hexdigest()
+
+
+class CircuitBreaker:
+    """Opens after ``failures`` consecutive failures, half-opens after ``reset`` seconds."""
+
+    def __init__(self, failures: int = BREAKER_FAILURES, reset: float = BREAKER_SECONDS):
+        self.failures = failures
+        self.reset = reset
+        self.count = 0
+        self.opened = None
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.opened is None:
+                return True
+            if time.monotonic() - self.opened >= self.reset:
+                # half-open: let this one through, re-open on failure
+                self.opened = None
+                self.count = self.failures - 1
+                return True
+            return False
+
+    def record(self, ok: bool):
+        with self.lock:
+            if ok:
+                self.count = 0
+                self.opened = None
+            else:
+                self.count += 1
+                if self.count >= self.failures and self.opened is None:
+                    self.opened = time.monotonic()
+
+    @property
+    def state(self) -> str:
+        return "open" if self.opened is not None else "closed"
+
+
+class Outbox:
+    def __init__(self, path: str = OUTBOX_DB, snapshot: Optional[str] = OUTBOX_SNAPSHOT):
+        self.path = path
+        self.snapshot = snapshot
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+        self.load_snapshot()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _run(self, sql: str, params=()) -> int:
+        conn = self._connect()
+        try:
+            with conn:
+                return conn.execute(sql, params).rowcount
+        finally:
+            conn.close()
+
+    def _query(self, sql: str, params=()) -> List[sqlite3.Row]:
+        conn = self._connect()
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    # -------------------------
+    # Producer
+    # -------------------------
+    def enqueue(self, recipient: str, subject: str, body: str, alerts: List[Dict[str, Any]],
+                key: Optional[str] = None) -> bool:
+        """Queue a message; alerts = [{"id": route id, "price": ...}]. False if already queued."""
+        now = time.time()
+        return self._run(
+            "INSERT OR IGNORE INTO outbox (id, recipient, subject, body, routes, next_attempt, created) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key or message_id(recipient, alerts), recipient, subject, body, json.dumps(alerts), now, now)) == 1
+
+    # -------------------------
+    # Consumer
+    # -------------------------
+    def claim(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Due messages, moved to 'sending' with a lease so other workers skip them."""
+        now = time.time()
+        out = []
+        for row in self._query("SELECT * FROM outbox WHERE status IN ('pending', 'sending') AND next_attempt <= ? "
+                               "ORDER BY next_attempt LIMIT ?", (now, limit)):
+            if self._run("UPDATE outbox SET status = 'sending', next_attempt = ? "
+                         "WHERE id = ? AND status = ? AND next_attempt = ?",
+                         (now + LEASE_SECONDS, row["id"], row["status"], row["next_attempt"])) == 1:
+                out.append(dict(row))
+        return out
+
+    def mark_sent(self, msg_id: str):
+        self._run("UPDATE outbox SET status = 'sent', sent_at = ?, attempts = attempts + 1, last_error = NULL "
+                  "WHERE id = ?", (time.time(), msg_id))
+
+    def mark_failed(self, msg: Dict[str, Any], error: str, retry_after: Optional[float] = None,
+                    permanent: bool = False) -> str:
+        attempts = msg["attempts"] + 1
+        if permanent or attempts >= MAX_ATTEMPTS:
+            status, delay = "dead", 0.0
+        else:
+            status = "pending"
+            delay = retry_after if retry_after is not None else \
+                random.uniform(0.5, 1.0) * min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+        self._run("UPDATE outbox SET status = ?, attempts = ?, next_attempt = ?, last_error = ? WHERE id = ?",
+                  (status, attempts, time.time() + delay, error[:500], msg["id"]))
+        return status
+
+    def release(self, msg: Dict[str, Any]):
+        """Give a claimed message back untouched (breaker open)."""
+        self._run("UPDATE outbox SET status = 'pending', next_attempt = ? WHERE id = ?",
+                  (time.time() + 1, msg["id"]))
+
+    # -------------------------
+    # Deliveries -> route stats
+    # -------------------------
+    def apply_deliveries(self, routes: List[Dict[str, Any]]) -> int:
+        """
+        Add delivered, not yet counted alerts to stats.notifications_sent and
+        save their alert state (utils/notify.py). Returns alerts applied.
+        """
+        from .notify import save_alert_state
+        from .storage import increment_route_stat
+        by_id = {r.get("id"): r for r in routes}
+        applied = 0
+        for row in self._query("SELECT id, routes FROM outbox WHERE status = 'sent' AND applied = 0"):
+            left = []
+            for a in json.loads(row["routes"]):
+                r = by_id.get(a.get("id"))
+                if r is None:
+                    # another shard's route: left for its owner
+                    left.append(a)
+                    continue
+                increment_route_stat(r, "notifications_sent")
+                save_alert_state(r, a.get("alert"))
+                applied += 1
+            if left:
+                self._run("UPDATE outbox SET routes = ? WHERE id = ?", (json.dumps(left), row["id"]))
+            else:
+                self._run("UPDATE outbox SET applied = 1 WHERE id = ?", (row["id"],))
+        return applied
+
+    # -------------------------
+    # Snapshot (state kept across CI runs)
+    # -------------------------
+    def load_snapshot(self) -> int:
+        """Merge OUTBOX_SNAPSHOT into the database; rows already there are kept. Returns rows added."""
+        if not self.snapshot or not os.path.exists(self.snapshot):
+            return 0
+        rows = []
+        with open(self.snapshot, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(row, dict) and row.get("id"):
+                    rows.append(tuple(row.get(c) for c in _COLUMNS))
+        conn = self._connect()
+        try:
+            with conn:
+                before = conn.total_changes
+                conn.executemany(f"INSERT OR IGNORE INTO outbox ({', '.join(_COLUMNS)}) "
+                                 f"VALUES ({', '.join('?' * len(_COLUMNS))})", rows)
+                return conn.total_changes - before
+        finally:
+            conn.close()
+
+    def save_snapshot(self) -> int:
+        """Write the rows a later run still needs to OUTBOX_SNAPSHOT (atomic). Returns rows written."""
+        if not self.snapshot:
+            return 0
+        limit = time.time() - SNAPSHOT_KEEP_DAYS * 86400
+        rows = self._query(f"SELECT {', '.join(_COLUMNS)} FROM outbox "
+                           "WHERE NOT (status = 'sent' AND applied = 1 AND created < ?) ORDER BY created, id",
+                           (limit,))
+        lines = [json.dumps(dict(row), ensure_ascii=False, sort_keys=True) + "\n" for row in rows]
+        atomic_write(self.snapshot, "".join(lines).encode("utf-8"))
+        return len(rows)
+
+    def stats(self) -> Dict[str, int]:
+        out = {"pending": 0, "sending": 0, "sent": 0, "dead": 0}
+        for row in self._query("SELECT status, COUNT(*) AS n FROM outbox GROUP BY status"):
+            out[row["status"]] = row["n"]
+        return out
+
+    def purge(self, older_than_days: float = 30) -> int:
+        """Delete sent/dead messages older than N days (sent ones only once applied)."""
+        limit = time.time() - older_than_days * 86400
+        return self._run("DELETE FROM outbox WHERE created < ? AND (status = 'dead' OR (status = 'sent' AND applied = 1))",
+                         (limit,))
+
+
+def _retry_after(info: Any) -> Optional[float]:
+    try:
+        return float(info.get("retry_after"))
+    except Exception:
+        return None
+
+
+class OutboxWorker:
+    """Drains an Outbox with send_email(to, subject, body) -> (ok, info)."""
+
+    def __init__(self, send_email: Callable, outbox: Optional[Outbox] = None, workers: Optional[int] = None,
+                 rate: Optional[float] = None, breaker: Optional[CircuitBreaker] = None):
+        from .notify import NOTIFY_WORKERS, NOTIFY_RATE
+        self.send_email = send_email
+        self.outbox = outbox or Outbox()
+        self.workers = workers or NOTIFY_WORKERS
+        self.bucket = TokenBucket(NOTIFY_RATE if rate is None else rate, capacity=1)
+        self.breaker = breaker or CircuitBreaker()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _deliver(self, msg: Dict[str, Any]) -> str:
+        if not self.breaker.allow():
+            self.outbox.release(msg)
+            return "deferred"
+        self.bucket.acquire()
+        try:
+            ok, info = self.send_email(msg["recipient"], msg["subject"], msg["body"])
+        except Exception as e:
+            ok, info = False, {"msg": "exception", "exc": str(e)}
+        self.breaker.record(bool(ok))
+        alerts = json.loads(msg["routes"])
+        status_code = info.get("status_code") if isinstance(info, dict) else info
+        if ok:
+            self.outbox.mark_sent(msg["id"])
+            state = "sent"
+        else:
+            permanent = (isinstance(status_code, int) and 400 <= status_code < 500
+                         and status_code not in _RETRYABLE_4XX)
+            error = (info.get("exc") or info.get("msg")) if isinstance(info, dict) else str(info)
+            state = self.outbox.mark_failed(msg, str(error), _retry_after(info), permanent)
+        for a in alerts:
+            emit("notify", route=a.get("id"), to=msg["recipient"], price=a.get("price"), ok=bool(ok),
+                 status=status_code, outbox=state, attempt=msg["attempts"] + 1, digest=len(alerts))
+        return state
+
+    def drain(self, deadline: Optional[float] = None, batch: int = 50) -> Dict[str, int]:
+        """Send due messages until none is left (or time.time() > deadline). Returns counts per outcome."""
+        report = {"sent": 0, "pending": 0, "dead": 0, "deferred": 0}
+        with ThreadPoolExecutor(max(self.workers, 1), thread_name_prefix="outbox") as pool:
+            while deadline is None or time.time() < deadline:
+                msgs = self.outbox.claim(batch)
+                if not msgs:
+                    break
+                for state in pool.map(self._deliver, msgs):
+                    report[state] += 1
+                if report["deferred"]:
+                    # breaker open: the rest waits for the next drain
+                    break
+        return report
+
+    # -------------------------
+    # Background thread (track.py --daemon)
+    # -------------------------
+    def _loop(self, poll: float):
+        while not self._stop.is_set():
+            try:
+                self.drain()
+            except Exception as e:
+                emit("log", msg=f"outbox worker error: {e}")
+            self._stop.wait(poll)
+
+    def start(self, poll: float = POLL_SECONDS):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, args=(poll,), name="outbox", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Vide la file d'envoi des emails (outbox).")
+    ap.add_argument("--loop", action="store_true", help=f"reste actif (toutes les {POLL_SECONDS:g}s)")
+    ap.add_argument("--stats", action="store_true", help="affiche l'état de la file et quitte")
+    args = ap.parse_args()
+    outbox = Outbox()
+    if args.stats:
+        print(outbox.stats())
+        return
+    from .email_utils import send_email
+    worker = OutboxWorker(send_email, outbox)
+    if args.loop:
+        worker.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            worker.stop()
+    else:
+        print(worker.drain())
+    outbox.save_snapshot()
+    print(outbox.stats())
+
+
+if __name__ == "__main__":
+    main()
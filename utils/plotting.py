@@ -1,12 +1,30 @@
 # utils/plotting.py
 import matplotlib.pyplot as plt
 from datetime import datetime
+from utils.history import to_datetime64
 
-def plot_price_history(history):
-    dates = [datetime.fromisoformat(h["date"]) for h in history]
-    prices = [h["price"] for h in history]
+def plot_price_history(history, rollups=None):
+    """
+    history: list of {"date", "price"} dicts, or a (timestamps, prices) pair of
+    arrays as returned by utils.storage.get_history_arrays (epoch seconds).
+    rollups: roll-up points drawn as a min/max band (utils.storage.get_history_rollups);
+    taken from the list itself when omitted.
+    """
+    if isinstance(history, tuple):
+        ts, prices = history
+        dates = to_datetime64(ts)
+    else:
+        dates = [datetime.fromisoformat(h["date"]) for h in history]
+        prices = [h["price"] for h in history]
     fig, ax = plt.subplots(figsize=(8,3))
     ax.plot(dates, prices, marker='o')
+    if rollups is None:
+        rollups = [h for h in history if h.get("agg")] if isinstance(history, list) else []
+    if rollups:
+        # min/max range of the rolled-up (hourly/daily) points
+        ax.fill_between([datetime.fromisoformat(h["date"]) for h in rollups],
+                        [h.get("min") or h["price"] for h in rollups],
+                        [h.get("max") or h["price"] for h in rollups], alpha=0.2)
     ax.set_title("Historique des prix")
     ax.set_xlabel("Date")
     ax.set_ylabel("Prix (€)")
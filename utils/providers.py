@@ -0,0 +1,297 @@
+# utils/providers.py
+"""
+Price providers used by the tracking pipeline (utils/tracking.py).
+
+A provider answers a search query (see ``search_query``) with a list of
+compact ``utils.offers.Offer`` records (price, carriers, stops, bags, cabin,
+segment times) projected from Amadeus flight-offers.
+
+Implementations:
+  sim      SimulatedProvider: offline offers around utils.simulation prices,
+           with an optional artificial latency (benchmarks)
+  amadeus  AmadeusProvider: amadeus_client.AmadeusClient run in worker threads
+  replay   ReplayProvider: answers from a recordings file written by
+           RecordingProvider (track.py --record [FICHIER]), for offline load tests
+
+PRICE_PROVIDER selects the default (sim).
+"""
+import asyncio
+import json
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+from .simulation import simulate_price
+from .offers import Offer, parse_offers
+
+PROVIDER = os.environ.get("PRICE_PROVIDER", "sim").strip().lower()
+# blocking HTTP calls in flight at once (AmadeusProvider worker threads)
+PROVIDER_THREADS = int(os.environ.get("PROVIDER_THREADS", "16"))
+RECORDINGS_FILE = os.environ.get("PROVIDER_RECORDINGS", os.path.join(".", "recordings.jsonl"))
+
+CABINS = {"economy": "ECONOMY", "premium economy": "PREMIUM_ECONOMY", "premium": "PREMIUM_ECONOMY",
+          "business": "BUSINESS", "first": "FIRST"}
+
+
+class ProviderError(Exception):
+    pass
+
+
+def search_query(route: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalized provider query of a route (what is sent to search_flights)."""
+    return {
+        "origin": str(route.get("origin") or "").strip().upper(),
+        "destination": str(route.get("destination") or "").strip().upper(),
+        "departure": str(route.get("departure") or "")[:10] or None,
+        "return": str(route.get("return") or "")[:10] or None,
+        "adults": int(route.get("adults", 1) or 1),
+        "cabin": CABINS.get(str(route.get("cabin_class") or "economy").strip().lower(), "ECONOMY"),
+    }
+
+
+def search_key(query: Dict[str, Any]) -> tuple:
+    """Hashable identity of a query: routes with equal keys can share one request."""
+    return tuple(sorted(query.items()))
+
+
+class PriceProvider:
+    """Base class: ``search`` returns the offers for one query."""
+
+    name = "base"
+    # {search key: last stored price} filled by the tracking pipeline before each search, for
+    # providers whose prices walk from the previous one (simulated); None: not used
+    last_prices: Optional[Dict[tuple, float]] = None
+
+    async def search(self, query: Dict[str, Any]) -> List[Offer]:
+        """Current offers: the tracker records them as an observation made now."""
+        raise NotImplementedError
+
+    async def browse(self, query: Dict[str, Any]) -> List[Offer]:
+        """Offers for display (search tab); may be a recent cached answer."""
+        return await self.search(query)
+
+    async def close(self):
+        pass
+
+
+# -------------------------
+# Simulated
+# -------------------------
+_AIRLINES = ("AF", "KL", "LH", "BA", "IB", "TK", "EK", "QR", "UA", "DL")
+
+
+def _segments(carrier: str, stops: int, day: Optional[str], hour: int) -> List[Dict[str, Any]]:
+    segs = []
+    for i in range(stops + 1):
+        dep, arr = hour + 3 * i, hour + 3 * i + 2
+        segs.append({"carrierCode": carrier, "number": str(100 + i),
+                     "departure": {"at": f"{day}T{dep:02d}:00:00"} if day else {},
+                     "arrival": {"at": f"{day}T{arr:02d}:00:00"} if day else {}})
+    return segs
+
+
+def _offer(i: int, price: float, carrier: str, stops: int, bags: int, query: Dict[str, Any],
+           hour: int) -> Dict[str, Any]:
+    itineraries = [{"segments": _segments(carrier, stops, query.get("departure"), hour)}]
+    if query.get("return"):
+        itineraries.append({"segments": _segments(carrier, stops, query.get("return"), hour)})
+    fare = {"cabin": query.get("cabin") or "ECONOMY", "includedCheckedBags": {"quantity": bags}}
+    return {
+        "id": str(i),
+        "price": {"total": f"{price:.2f}", "currency": "EUR"},
+        "validatingAirlineCodes": [carrier],
+        "itineraries": itineraries,
+        "travelerPricings": [{"fareDetailsBySegment": [fare] * sum(len(it["segments"]) for it in itineraries)}],
+    }
+
+
+def simulated_offers(query: Dict[str, Any], n: int = 4, last: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Raw Amadeus-format offers for a query (deterministic per query and hour),
+    around a price walking from ``last`` (last stored price, if known).
+    """
+    key = f"{query.get('origin')}-{query.get('destination')}-{query.get('departure')}-{query.get('return')}"
+    base = simulate_price({"id": key, "origin": query.get("origin"), "destination": query.get("destination"),
+                           "departure": query.get("departure")}, last=last)
+    rnd = random.Random(key)
+    out = []
+    for i in range(n):
+        stops = i % 3
+        # direct flights cost more, connections less
+        price = base * (1.15 - 0.12 * stops) * rnd.uniform(0.95, 1.1)
+        out.append(_offer(i + 1, price, rnd.choice(_AIRLINES), stops, rnd.randint(0, 2), query,
+                          rnd.randint(6, 14)))
+    return out
+
+
+class SimulatedProvider(PriceProvider):
+    """
+    Offline provider: a handful of offers (direct / 1 stop / 2 stops, various
+    airlines and bag allowances) around simulate_price(). ``latency`` seconds
+    (plus up to ``jitter``) are awaited per call to mimic a remote API.
+    """
+
+    name = "sim"
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, offers: int = 4):
+        self.latency = latency
+        self.jitter = jitter
+        self.offers = offers
+        self.calls = 0
+        self.last_prices = {}
+
+    async def search(self, query: Dict[str, Any]) -> List[Offer]:
+        self.calls += 1
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + random.random() * self.jitter)
+        return list(parse_offers(simulated_offers(query, self.offers, self.last_prices.get(search_key(query)))))
+
+
+# -------------------------
+# Amadeus
+# -------------------------
+class AmadeusProvider(PriceProvider):
+    """
+    amadeus_client.AmadeusClient (blocking, pooled, rate-limited, retrying)
+    run in a pool of ``threads`` workers (PROVIDER_THREADS, default 16; the
+    asyncio default executor is too small to keep many requests in flight).
+    The client's token bucket enforces the API quota whatever
+    TRACK_CONCURRENCY is. ``search`` always calls the API and refreshes
+    utils.search_cache; only ``browse`` may answer from it.
+    """
+
+    name = "amadeus"
+
+    def __init__(self, client=None, threads: int = PROVIDER_THREADS):
+        # imported lazily: credentials are only needed for real searches
+        from amadeus_client import get_client
+        self.client = client or get_client()
+        self.executor = ThreadPoolExecutor(max(threads, 1), thread_name_prefix="amadeus")
+
+    async def _fetch(self, query: Dict[str, Any], through) -> List[Offer]:
+        from amadeus_client import AmadeusError
+
+        def fetch():
+            # the cache keeps the compact projection, not the raw response
+            offers = self.client.search_offers(query["origin"], query["destination"], query["departure"],
+                                               query.get("return"), query.get("adults", 1), query.get("cabin"))
+            return [o.to_dict() for o in offers]
+
+        try:
+            res = await asyncio.get_running_loop().run_in_executor(self.executor, through, query, fetch)
+        except AmadeusError as e:
+            raise ProviderError(str(e))
+        return [Offer.from_dict(d) for d in res or []]
+
+    async def search(self, query: Dict[str, Any]) -> List[Offer]:
+        from .search_cache import fresh_search
+        return await self._fetch(query, fresh_search)
+
+    async def browse(self, query: Dict[str, Any]) -> List[Offer]:
+        from .search_cache import cached_search
+        return await self._fetch(query, cached_search)
+
+    async def close(self):
+        self.executor.shutdown(wait=False)
+
+
+# -------------------------
+# Record / replay
+# -------------------------
+def _key_str(query: Dict[str, Any]) -> str:
+    return json.dumps(search_key(query), separators=(",", ":"))
+
+
+class RecordingProvider(PriceProvider):
+    """
+    Wraps a provider and appends every answer to a JSON-lines file:
+    {"key", "query", "ts", "offers": [Offer.to_dict(), ...]}. Errors are not recorded.
+    """
+
+    def __init__(self, inner: PriceProvider, path: str = RECORDINGS_FILE):
+        self.inner = inner
+        self.path = path
+        self.name = f"record:{inner.name}"
+        self.last_prices = inner.last_prices
+        self.recorded = 0
+        self._lock = threading.Lock()
+
+    async def search(self, query: Dict[str, Any]) -> List[Offer]:
+        offers = await self.inner.search(query)
+        line = json.dumps({"key": _key_str(query), "query": query, "ts": datetime.now().isoformat(),
+                           "offers": [o.to_dict() for o in offers]}, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            self.recorded += 1
+        return offers
+
+    async def close(self):
+        await self.inner.close()
+
+
+def load_recordings(path: str = RECORDINGS_FILE) -> Dict[str, List[Dict[str, Any]]]:
+    """{search key: offers} of a recordings file (the latest recording of a key wins)."""
+    out = {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    # torn last line of an interrupted recording
+                    continue
+                out[rec["key"]] = rec["offers"]
+    except FileNotFoundError:
+        pass
+    return out
+
+
+class ReplayProvider(PriceProvider):
+    """
+    Serves recorded answers. ``latency`` (+ up to ``jitter``) seconds are
+    awaited per call. Unknown queries raise ProviderError, or get simulated
+    offers with ``miss="sim"`` (PROVIDER_REPLAY_MISS).
+    """
+
+    name = "replay"
+
+    def __init__(self, path: str = RECORDINGS_FILE, latency: float = 0.0, jitter: float = 0.0,
+                 miss: Optional[str] = None):
+        self.recordings = load_recordings(path)
+        self.latency = latency
+        self.jitter = jitter
+        self.miss = (miss or os.environ.get("PROVIDER_REPLAY_MISS", "error")).strip().lower()
+        self.hits = 0
+        self.misses = 0
+        self.last_prices = {}
+
+    async def search(self, query: Dict[str, Any]) -> List[Offer]:
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + random.random() * self.jitter)
+        offers = self.recordings.get(_key_str(query))
+        if offers is None:
+            self.misses += 1
+            if self.miss == "sim":
+                return list(parse_offers(simulated_offers(query, last=self.last_prices.get(search_key(query)))))
+            raise ProviderError(f"no recording for {query.get('origin')}-{query.get('destination')} "
+                                f"{query.get('departure')}/{query.get('return')}")
+        self.hits += 1
+        return [Offer.from_dict(d) for d in offers]
+
+
+PROVIDERS = {
+    "sim": SimulatedProvider,
+    "amadeus": AmadeusProvider,
+    "replay": ReplayProvider,
+}
+
+
+def get_provider(name: Optional[str] = None, **kwargs) -> PriceProvider:
+    name = (name or PROVIDER).strip().lower()
+    if name not in PROVIDERS:
+        raise ValueError(f"unknown PRICE_PROVIDER {name!r} (expected one of {', '.join(PROVIDERS)})")
+    return PROVIDERS[name](**kwargs)
@@ -0,0 +1,34 @@
+# utils/ratelimit.py
+"""
+Token bucket shared by the outbound clients (amadeus_client, utils/notify.py).
+"""
+import threading
+import time
+
+
+class TokenBucket:
+    """`rate` tokens per second, at most `capacity` stored; acquire() blocks until one is available."""
+
+    def __init__(self, rate, capacity=1.0):
+        self.rate = float(rate)
+        self.capacity = max(float(capacity), 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token; returns the seconds spent waiting (0 when rate <= 0, i.e. unlimited)."""
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
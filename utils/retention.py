@@ -0,0 +1,161 @@
+# utils/retention.py
+"""
+Retention / downsampling of price histories.
+
+Policy (env vars or CLI flags):
+
+- points younger than RETENTION_RAW_DAYS (default 30) are kept as is
+- older points, up to RETENTION_HOURLY_DAYS (default 180), are rolled up per hour
+- anything older is rolled up per day
+
+A roll-up point keeps the usual ``date``/``price`` keys (``price`` is the last
+price of the bucket, ``date`` the bucket start) so charts and exports read it
+like a raw point, plus ``min``, ``max``, ``n`` and ``agg`` ("1h" / "1d").
+Compacting twice is a no-op: existing hourly roll-ups are merged into daily
+ones once they get old enough.
+
+    python -m utils.retention                 # compact every route
+    python -m utils.retention --dry-run       # only report
+    python -m utils.retention --raw-days 7 --hourly-days 60
+"""
+import argparse
+import os
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional
+
+from .route_store import get_store
+from .storage import append_log
+
+RAW_DAYS = int(os.environ.get("RETENTION_RAW_DAYS", "30"))
+HOURLY_DAYS = int(os.environ.get("RETENTION_HOURLY_DAYS", "180"))
+
+_AGG_RANK = {None: 0, "1h": 1, "1d": 2}
+
+
+def _parse(d: Any) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(str(d))
+    except Exception:
+        return None
+
+
+def _bucket(dt: datetime, agg: str) -> datetime:
+    if agg == "1d":
+        return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+
+def compact_points(points: List[Dict[str, Any]], now: Optional[datetime] = None,
+                   raw_days: int = RAW_DAYS, hourly_days: int = HOURLY_DAYS) -> List[Dict[str, Any]]:
+    """Apply the retention policy to one history. Returns the new list, sorted by date."""
+    now = now or datetime.now()
+    raw_limit = now - timedelta(days=raw_days)
+    hourly_limit = now - timedelta(days=max(hourly_days, raw_days))
+
+    kept: List[Any] = []
+    buckets: Dict[Any, Dict[str, Any]] = {}
+    for p in points:
+        dt = _parse(p.get("date"))
+        try:
+            price = int(p.get("price"))
+        except Exception:
+            continue
+        if dt is None:
+            continue
+        if dt >= raw_limit and not p.get("agg"):
+            kept.append((dt, p))
+            continue
+        agg = "1h" if dt >= hourly_limit else "1d"
+        if _AGG_RANK[p.get("agg")] > _AGG_RANK[agg]:
+            agg = p.get("agg")
+        start = _bucket(dt, agg)
+        key = (agg, start)
+        n = int(p.get("n", 1))
+        lo, hi = int(p.get("min", price)), int(p.get("max", price))
+        b = buckets.get(key)
+        if b is None:
+            buckets[key] = {"date": start.isoformat(), "price": price, "min": lo, "max": hi,
+                            "n": n, "agg": agg, "_last": dt}
+            continue
+        b["min"] = min(b["min"], lo)
+        b["max"] = max(b["max"], hi)
+        b["n"] += n
+        if dt >= b["_last"]:
+            b["price"], b["_last"] = price, dt
+
+    rolled = []
+    for (_, start), b in buckets.items():
+        b.pop("_last")
+        rolled.append((start, b))
+    out = sorted(rolled, key=lambda x: x[0]) + sorted(kept, key=lambda x: x[0])
+    return [p for _, p in out]
+
+
+def compact_routes(routes: Optional[List[Dict[str, Any]]] = None, now: Optional[datetime] = None,
+                   raw_days: int = RAW_DAYS, hourly_days: int = HOURLY_DAYS,
+                   dry_run: bool = False, store=None) -> Dict[str, Any]:
+    """
+    Run the compaction pass over every route of the store.
+    Routes passed in with an in-memory history get it replaced by the compacted one,
+    so a later save_routes() does not re-append the removed points.
+
+    Bytes are summed per route segment (JSON stores). SQLite has no per-route
+    size: the live pages of the whole database are compared before and after
+    instead, which only counts pages the deleted rows freed entirely.
+    """
+    store = store or get_store()
+    if routes is None:
+        routes = store.load_routes(with_history=False)
+    used_before = store.used_bytes()
+    report = {"routes": 0, "compacted": 0, "points_before": 0, "points_after": 0,
+              "bytes_before": 0, "bytes_after": 0}
+    for r in routes:
+        rid = r.get("id")
+        if not rid:
+            continue
+        report["routes"] += 1
+        points = store.get_history(rid)
+        new = compact_points(points, now=now, raw_days=raw_days, hourly_days=hourly_days)
+        report["points_before"] += len(points)
+        report["points_after"] += len(new)
+        before = store.history_bytes(rid) or 0
+        report["bytes_before"] += before
+        if len(new) == len(points):
+            report["bytes_after"] += before
+            continue
+        report["compacted"] += 1
+        if dry_run:
+            continue
+        store.replace_history(rid, new)
+        if isinstance(r.get("history"), list):
+            r["history"] = new
+        report["bytes_after"] += store.history_bytes(rid) or 0
+    if used_before is not None:
+        # no per-route size (SQLite): whole-store figures
+        report["bytes_before"] = used_before
+        report["bytes_after"] = used_before if dry_run else store.used_bytes()
+    report["bytes_reclaimed"] = report["bytes_before"] - report["bytes_after"]
+    if not dry_run:
+        append_log(f"{datetime.now().isoformat()} - COMPACT routes={report['compacted']}/{report['routes']} "
+                   f"points={report['points_before']}->{report['points_after']} "
+                   f"bytes_reclaimed={report['bytes_reclaimed']}")
+    return report
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--raw-days", type=int, default=RAW_DAYS)
+    ap.add_argument("--hourly-days", type=int, default=HOURLY_DAYS)
+    ap.add_argument("--dry-run", action="store_true")
+    args = ap.parse_args()
+    rep = compact_routes(raw_days=args.raw_days, hourly_days=args.hourly_days, dry_run=args.dry_run)
+    print(f"routes compactées : {rep['compacted']}/{rep['routes']}")
+    print(f"points            : {rep['points_before']} -> {rep['points_after']}")
+    if args.dry_run:
+        print("(dry-run : rien n'a été écrit)")
+    else:
+        print(f"octets récupérés  : {rep['bytes_reclaimed']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,428 @@
+# utils/route_store.py
+"""
+Pluggable persistence for routes.
+
+All callers go through utils/storage.py, which delegates to the store returned
+by ``get_store()``. The backend is selected with the ROUTE_STORE env var:
+
+- ``json``    (default) : routes.json + append-only history segments
+- ``sharded``           : routes/<id>.json + routes/_manifest.json + history segments
+- ``sqlite``            : data.db (see utils/db.py)
+"""
+import hashlib
+import json
+import os
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+from . import db
+from .fileio import atomic_write
+from .history import (
+    HISTORY_DIR, attach_history, persist_new_points, strip_history,
+    append_point, read_history, read_history_arrays, delete_history, points_to_arrays,
+    write_history, segment_bytes, note_appended, read_rollups,
+)
+
+DEFAULT_BACKEND = "json"
+
+
+def _filter_since(points: List[Dict[str, Any]], since: Optional[str]) -> List[Dict[str, Any]]:
+    if not since:
+        return points
+    return [p for p in points if str(p.get("date", "")) >= str(since)]
+
+
+def _safe_name(route_id: str) -> str:
+    return str(route_id).replace(os.sep, "_").replace("/", "_")
+
+
+class RouteStore:
+    """Interface shared by every backend."""
+
+    name = "base"
+    recovered: Optional[str] = None
+
+    def load_routes(self, with_history: bool = True) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def save_routes(self, routes: List[Dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    def update_route(self, route: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def delete_route(self, route_id: str) -> None:
+        raise NotImplementedError
+
+    def get_history(self, route_id: str, since: Optional[str] = None) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def get_history_arrays(self, route_id: str):
+        """(epoch seconds, prices) arrays for a route, without building per-point dicts where possible."""
+        return points_to_arrays(self.get_history(route_id))
+
+    def replace_history(self, route_id: str, points: List[Dict[str, Any]]) -> None:
+        """Atomically replace the whole history of a route (raw + roll-up points)."""
+        raise NotImplementedError
+
+    def get_rollups(self, route_id: str) -> List[Dict[str, Any]]:
+        """Roll-up points of a route (``agg``, ``min``, ``max``, ``n``), oldest first."""
+        return [p for p in self.get_history(route_id) if p.get("agg")]
+
+    def history_bytes(self, route_id: str) -> Optional[int]:
+        """On-disk size of a route's history, if the backend can tell."""
+        return None
+
+    def used_bytes(self) -> Optional[int]:
+        """Space used by the whole store, for backends without a per-route size."""
+        return None
+
+    def append_price(self, route: Dict[str, Any], price: int, ts: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Record a price point in the store and last_tracked. The point is also
+        added to route['history'] when that list is attached; a route loaded
+        without history does not grow a partial list.
+        """
+        point = {"date": ts or datetime.now().isoformat(), "price": price}
+        hist = route.get("history")
+        if isinstance(hist, list):
+            hist.append(point)
+        route["last_tracked"] = point["date"]
+        if route.get("id"):
+            self._append_point(route["id"], point)
+            note_appended(route)
+        return point
+
+    def _append_point(self, route_id: str, point: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def paths(self) -> List[str]:
+        """Files/directories holding the data (what gets committed when pushing)."""
+        return []
+
+
+# -------------------------
+# routes.json
+# -------------------------
+class JsonRouteStore(RouteStore):
+    """
+    routes.json snapshot. The snapshot it replaces is kept as routes.json.prev
+    (a hard link, not a copy) so a malformed file can be recovered from it.
+    """
+
+    name = "json"
+
+    def __init__(self, path: str = os.path.join(".", "routes.json")):
+        self.path = path
+        self.prev_path = f"{path}.prev"
+        # ids present in the snapshot last read/written (to drop history of deleted routes)
+        self._known_ids: Optional[set] = None
+        # set by the last load: None, "prev" (recovered from previous snapshot) or "empty"
+        self.recovered: Optional[str] = None
+
+    @staticmethod
+    def _parse(path: str) -> List[Dict[str, Any]]:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, list):
+            raise ValueError(f"{path}: expected a JSON list")
+        return data
+
+    def _read_raw(self) -> List[Dict[str, Any]]:
+        self.recovered = None
+        try:
+            return self._parse(self.path)
+        except FileNotFoundError:
+            if not os.path.exists(self.prev_path):
+                return []
+            # crash between the two renames of a checkpoint
+        except Exception:
+            # malformed: keep the file aside for inspection, then fall back to the previous snapshot
+            try:
+                ts = datetime.now().strftime("%Y%m%d%H%M%S")
+                os.replace(self.path, f"{self.path}.broken.{ts}")
+            except Exception:
+                pass
+        try:
+            routes = self._parse(self.prev_path)
+            self.recovered = "prev"
+            return routes
+        except Exception:
+            self.recovered = "empty"
+            return []
+
+    def _write_raw(self, routes: List[Dict[str, Any]]) -> None:
+        b = json.dumps([strip_history(r) for r in routes], ensure_ascii=False, indent=2).encode("utf-8")
+        if os.path.exists(self.path):
+            # hard link keeps the old inode as .prev while atomic_write swaps in the new one
+            try:
+                if os.path.exists(self.prev_path):
+                    os.remove(self.prev_path)
+                os.link(self.path, self.prev_path)
+            except Exception:
+                try:
+                    os.replace(self.path, self.prev_path)
+                except Exception:
+                    pass
+        atomic_write(self.path, b)
+
+    def load_routes(self, with_history: bool = True) -> List[Dict[str, Any]]:
+        routes = self._read_raw()
+        self._known_ids = {r.get("id") for r in routes}
+        if with_history:
+            attach_history(routes)
+        return routes
+
+    def save_routes(self, routes: List[Dict[str, Any]]) -> None:
+        persist_new_points(routes)
+        self._write_raw(routes)
+        ids = {r.get("id") for r in routes}
+        for rid in (self._known_ids or set()) - ids:
+            if rid:
+                delete_history(rid)
+        self._known_ids = ids
+
+    def update_route(self, route: Dict[str, Any]) -> None:
+        routes = self._read_raw()
+        for i, r in enumerate(routes):
+            if r.get("id") == route.get("id"):
+                routes[i] = route
+                break
+        else:
+            routes.append(route)
+        self._write_raw(routes)
+
+    def delete_route(self, route_id: str) -> None:
+        self._write_raw([r for r in self._read_raw() if r.get("id") != route_id])
+        delete_history(route_id)
+
+    def get_history(self, route_id: str, since: Optional[str] = None) -> List[Dict[str, Any]]:
+        return _filter_since(read_history(route_id), since)
+
+    def get_history_arrays(self, route_id: str):
+        return read_history_arrays(route_id)
+
+    def get_rollups(self, route_id: str) -> List[Dict[str, Any]]:
+        return read_rollups(route_id)
+
+    def replace_history(self, route_id: str, points: List[Dict[str, Any]]) -> None:
+        write_history(route_id, points)
+
+    def history_bytes(self, route_id: str) -> Optional[int]:
+        return segment_bytes(route_id)
+
+    def _append_point(self, route_id: str, point: Dict[str, Any]) -> None:
+        append_point(route_id, point)
+
+    def paths(self) -> List[str]:
+        return [self.path, HISTORY_DIR]
+
+
+# -------------------------
+# routes/<id>.json + manifest
+# -------------------------
+class ShardedJsonRouteStore(RouteStore):
+    """
+    One file per route plus a small manifest holding the route order.
+
+    The store remembers a digest of every shard it loaded or wrote, so
+    save_routes() only rewrites (and fsyncs) the routes whose configuration
+    changed; the manifest is rewritten only when routes are added, removed or
+    reordered. Every file is still replaced through atomic_write.
+    """
+
+    name = "sharded"
+
+    def __init__(self, root: str = os.path.join(".", "routes")):
+        self.root = root
+        self.manifest_path = os.path.join(root, "_manifest.json")
+        # route id -> digest of the shard bytes last read/written by this process
+        self._fingerprints: Dict[str, str] = {}
+        self._order: Optional[List[str]] = None
+
+    def _shard_path(self, route_id: str) -> str:
+        return os.path.join(self.root, f"{_safe_name(route_id)}.json")
+
+    @staticmethod
+    def _encode(route: Dict[str, Any]) -> bytes:
+        return json.dumps(strip_history(route), ensure_ascii=False, indent=2).encode("utf-8")
+
+    @staticmethod
+    def _fingerprint(route: Dict[str, Any]) -> str:
+        # compact encoding goes through the C encoder (indent=2 does not), ~10x cheaper per route
+        b = json.dumps(strip_history(route), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return hashlib.sha1(b).hexdigest()
+
+    def _read_manifest(self) -> List[str]:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                doc = json.load(f)
+            order = doc.get("order", []) if isinstance(doc, dict) else []
+            return [str(i) for i in order]
+        except FileNotFoundError:
+            return []
+        except Exception:
+            # manifest unreadable: fall back to whatever shards exist
+            try:
+                return sorted(fn[:-5] for fn in os.listdir(self.root)
+                              if fn.endswith(".json") and not fn.startswith("_"))
+            except FileNotFoundError:
+                return []
+
+    def _write_manifest(self, order: List[str]) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        atomic_write(self.manifest_path, json.dumps({"order": order}).encode("utf-8"))
+        self._order = list(order)
+
+    def _write_shard(self, route: Dict[str, Any], fingerprint: Optional[str] = None) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        atomic_write(self._shard_path(route["id"]), self._encode(route))
+        self._fingerprints[str(route["id"])] = fingerprint or self._fingerprint(route)
+
+    def _read_shard(self, route_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._shard_path(route_id), "rb") as f:
+                b = f.read()
+            r = json.loads(b.decode("utf-8"))
+        except Exception:
+            return None
+        if not isinstance(r, dict):
+            return None
+        self._fingerprints[route_id] = self._fingerprint(r)
+        return r
+
+    def is_dirty(self, route: Dict[str, Any]) -> bool:
+        """True if the route differs from what this store last read or wrote."""
+        return self._fingerprints.get(str(route.get("id"))) != self._fingerprint(route)
+
+    def load_routes(self, with_history: bool = True) -> List[Dict[str, Any]]:
+        order = self._read_manifest()
+        self._order = order
+        routes = [r for r in (self._read_shard(i) for i in order) if r is not None]
+        if with_history:
+            attach_history(routes)
+        return routes
+
+    def save_routes(self, routes: List[Dict[str, Any]]) -> None:
+        persist_new_points(routes)
+        order = []
+        for r in routes:
+            if not r.get("id"):
+                continue
+            rid = str(r["id"])
+            order.append(rid)
+            fp = self._fingerprint(r)
+            if self._fingerprints.get(rid) != fp:
+                self._write_shard(r, fp)
+        old = self._order if self._order is not None else self._read_manifest()
+        if order != old:
+            self._write_manifest(order)
+            keep = set(order)
+            for rid in old:
+                if rid not in keep:
+                    try:
+                        os.remove(self._shard_path(rid))
+                    except FileNotFoundError:
+                        pass
+                    self._fingerprints.pop(rid, None)
+                    delete_history(rid)
+
+    def update_route(self, route: Dict[str, Any]) -> None:
+        if self.is_dirty(route):
+            self._write_shard(route)
+        order = self._read_manifest()
+        if str(route["id"]) not in order:
+            order.append(str(route["id"]))
+            self._write_manifest(order)
+
+    def delete_route(self, route_id: str) -> None:
+        order = self._read_manifest()
+        if route_id in order:
+            order.remove(route_id)
+            self._write_manifest(order)
+        try:
+            os.remove(self._shard_path(route_id))
+        except FileNotFoundError:
+            pass
+        self._fingerprints.pop(route_id, None)
+        delete_history(route_id)
+
+    def get_history(self, route_id: str, since: Optional[str] = None) -> List[Dict[str, Any]]:
+        return _filter_since(read_history(route_id), since)
+
+    def get_history_arrays(self, route_id: str):
+        return read_history_arrays(route_id)
+
+    def get_rollups(self, route_id: str) -> List[Dict[str, Any]]:
+        return read_rollups(route_id)
+
+    def replace_history(self, route_id: str, points: List[Dict[str, Any]]) -> None:
+        write_history(route_id, points)
+
+    def history_bytes(self, route_id: str) -> Optional[int]:
+        return segment_bytes(route_id)
+
+    def _append_point(self, route_id: str, point: Dict[str, Any]) -> None:
+        append_point(route_id, point)
+
+    def paths(self) -> List[str]:
+        return [self.root, HISTORY_DIR]
+
+
+# -------------------------
+# SQLite (utils/db.py)
+# -------------------------
+class SqliteRouteStore(RouteStore):
+    name = "sqlite"
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or db.DB_FILE
+
+    def load_routes(self, with_history: bool = True) -> List[Dict[str, Any]]:
+        return db.load_db(with_history=with_history, path=self.path)["routes"]
+
+    def save_routes(self, routes: List[Dict[str, Any]]) -> None:
+        db.save_db({"routes": routes}, path=self.path)
+
+    def update_route(self, route: Dict[str, Any]) -> None:
+        db.update_route(route, path=self.path)
+
+    def delete_route(self, route_id: str) -> None:
+        db.delete_route(route_id, path=self.path)
+
+    def get_history(self, route_id: str, since: Optional[str] = None) -> List[Dict[str, Any]]:
+        return db.get_history(route_id, since=since, path=self.path)
+
+    def get_rollups(self, route_id: str) -> List[Dict[str, Any]]:
+        return db.get_rollups(route_id, path=self.path)
+
+    def replace_history(self, route_id: str, points: List[Dict[str, Any]]) -> None:
+        db.replace_history(route_id, points, path=self.path)
+
+    def used_bytes(self) -> Optional[int]:
+        return db.used_bytes(self.path)
+
+    def _append_point(self, route_id: str, point: Dict[str, Any]) -> None:
+        db.append_price(route_id, point["price"], point["date"], path=self.path)
+
+    def paths(self) -> List[str]:
+        return [self.path]
+
+
+BACKENDS = {
+    JsonRouteStore.name: JsonRouteStore,
+    ShardedJsonRouteStore.name: ShardedJsonRouteStore,
+    SqliteRouteStore.name: SqliteRouteStore,
+}
+
+_stores: Dict[str, RouteStore] = {}
+
+
+def get_store(backend: Optional[str] = None) -> RouteStore:
+    """Return the (cached) store for the configured backend (ROUTE_STORE env, default json)."""
+    name = (backend or os.environ.get("ROUTE_STORE") or DEFAULT_BACKEND).strip().lower()
+    if name not in BACKENDS:
+        raise ValueError(f"unknown ROUTE_STORE backend: {name} (expected one of {', '.join(BACKENDS)})")
+    if name not in _stores:
+        _stores[name] = BACKENDS[name]()
+    return _stores[name]
@@ -0,0 +1,184 @@
+# utils/scheduler.py
+"""
+Long-running tracking scheduler (``python track.py --daemon``).
+
+Each route is tracked every 24h / tracking_per_day. Instead of a cron run
+that re-reads every history to decide what is due, the daemon keeps a
+min-heap of (next_due, route id) and sleeps until the head is due.
+
+To avoid bursts, every route gets a stable phase inside its interval
+(derived from a hash of its id): its due times are phase + k * interval,
+the first slot at least half an interval after last_tracked. Routes with
+the same frequency are thus spread evenly over the day, and a restart does
+not move them.
+
+Route additions / edits are picked up without restart: the heap is rebuilt
+whenever utils.storage.data_version() changes (checked at least every
+SCHEDULER_RELOAD_SECONDS, default 30).
+
+The daemon never attaches price history: routes are loaded with
+with_history=False, due checks read the store, and every new point is
+written by append_price. Checkpoints therefore only write the route
+configuration and never rewrite a history segment (json stores) or the
+history table (sqlite).
+
+Every change the daemon makes to a route (last_tracked, stats, alert state)
+is also in the WAL. Before a checkpoint the daemon compares data_version()
+with the version it loaded: if the app saved meanwhile, its cached list is
+stale and writing it would drop the app's additions / edits / deletions, so
+the routes are reloaded first (the reload replays the daemon's WAL records).
+"""
+import hashlib
+import heapq
+import os
+import signal
+import time
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+
+from .storage import load_routes, data_version, checkpoint_if_due, append_log, ensure_route_fields
+from .tracking import run, CONCURRENCY
+
+RELOAD_SECONDS = float(os.environ.get("SCHEDULER_RELOAD_SECONDS", "30"))
+DAY = 24 * 3600
+
+
+def interval_seconds(route: Dict[str, Any]) -> float:
+    try:
+        per_day = max(int(route.get("tracking_per_day", 1)), 1)
+    except (TypeError, ValueError):
+        per_day = 1
+    return DAY / per_day
+
+
+def _phase(route_id: str) -> float:
+    """Stable fraction in [0, 1) for a route id."""
+    h = hashlib.blake2b(str(route_id).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(h, "big") / 2 ** 64
+
+
+def _epoch(d: Any) -> Optional[float]:
+    if not d:
+        return None
+    try:
+        return datetime.fromisoformat(str(d)).timestamp()
+    except Exception:
+        return None
+
+
+def next_due(route: Dict[str, Any], now: float) -> float:
+    """Next slot (epoch seconds) of the route: phase + k * interval, >= last_tracked + interval / 2."""
+    interval = interval_seconds(route)
+    phase = _phase(route.get("id", "")) * interval
+    last = _epoch(route.get("last_tracked"))
+    earliest = now if last is None else max(last + interval / 2, min(now, last + interval))
+    k = -(-(earliest - phase) // interval)  # ceil
+    return phase + k * interval
+
+
+def build_heap(routes: List[Dict[str, Any]], now: float) -> List[Tuple[float, str]]:
+    heap = [(next_due(r, now), r["id"]) for r in routes if r.get("id")]
+    heapq.heapify(heap)
+    return heap
+
+
+class Scheduler:
+    def __init__(self, provider, concurrency: int = CONCURRENCY, reload_seconds: float = RELOAD_SECONDS,
+                 email_cfg: Optional[Dict[str, Any]] = None, send_email=None, loader=None, checkpoint=None,
+                 outbox=None, heartbeat=None):
+        self.provider = provider
+        self.concurrency = concurrency
+        self.reload_seconds = reload_seconds
+        self.email_cfg = email_cfg
+        self.send_email = send_email
+        self.outbox = outbox
+        # called every step (sharded daemon: lease renewal); False stops the daemon
+        self.heartbeat = heartbeat
+        self.loader = loader or (lambda: load_routes(with_history=False))
+        self.checkpoint = checkpoint or checkpoint_if_due
+        self.routes: List[Dict[str, Any]] = []
+        self.by_id: Dict[str, Dict[str, Any]] = {}
+        self.heap: List[Tuple[float, str]] = []
+        self.version = None
+        self.last_check = 0.0
+        self.stopped = False
+        self.runs = 0
+
+    def reload(self, now: Optional[float] = None):
+        now = now if now is not None else time.time()
+        self.version = data_version()
+        # loaders return routes without history (see module docstring);
+        # ensure_route_fields does not add an empty list either
+        self.routes = self.loader()
+        for r in self.routes:
+            ensure_route_fields(r)
+        self.by_id = {r["id"]: r for r in self.routes if r.get("id")}
+        self.heap = build_heap(self.routes, now)
+        self.last_check = now
+        append_log(f"{datetime.now().isoformat()} - scheduler: loaded {len(self.by_id)} route(s) version={self.version}")
+
+    def _maybe_reload(self, now: float):
+        if now - self.last_check < self.reload_seconds:
+            return
+        self.last_check = now
+        if data_version() != self.version:
+            self.reload(now)
+
+    def pop_due(self, now: float) -> List[Dict[str, Any]]:
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            _, rid = heapq.heappop(self.heap)
+            r = self.by_id.get(rid)
+            if r is not None:
+                due.append(r)
+        return due
+
+    def step(self, now: Optional[float] = None) -> float:
+        """Track what is due now. Returns the number of seconds to sleep."""
+        now = now if now is not None else time.time()
+        if self.heartbeat is not None and not self.heartbeat():
+            append_log(f"{datetime.now().isoformat()} - scheduler: heartbeat failed (lease lost), stopping")
+            self.stopped = True
+            return 0.0
+        self._maybe_reload(now)
+        if self.outbox is not None:
+            # delivered by the outbox worker thread since the last step
+            self.outbox.apply_deliveries(self.routes)
+        due = self.pop_due(now)
+        if due:
+            run(due, self.provider, concurrency=self.concurrency, email_cfg=self.email_cfg,
+                send_email=self.send_email, check_due=False, outbox=self.outbox)
+            self.runs += 1
+            done = time.time()
+            for r in due:
+                heapq.heappush(self.heap, (next_due(r, done), r["id"]))
+            self.save()
+        now = time.time()
+        wake = self.heap[0][0] if self.heap else now + self.reload_seconds
+        return max(0.0, min(wake - now, self.last_check + self.reload_seconds - now))
+
+    def save(self, force: bool = False) -> bool:
+        """Checkpoint the routes, reloaded first if another process saved since our load."""
+        if data_version() != self.version:
+            self.reload()
+        if self.checkpoint(self.routes, force=force):
+            # our own snapshot: not an external change
+            self.version = data_version()
+            return True
+        return False
+
+    def stop(self, *_):
+        self.stopped = True
+
+    def run_forever(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.reload()
+        while not self.stopped:
+            delay = self.step()
+            # sleep in short slices so a signal stops the daemon promptly
+            end = time.time() + delay
+            while not self.stopped and time.time() < end:
+                time.sleep(min(1.0, end - time.time()))
+        self.save(force=True)
+        append_log(f"{datetime.now().isoformat()} - scheduler: stopped after {self.runs} run(s)")
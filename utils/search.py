@@ -0,0 +1,66 @@
+# utils/search.py
+"""
+Grid search behind the "Recherche/Simulation" tab.
+
+origins x destinations x (start date ± window days) become provider queries
+(return = departure + stay, or a fixed return date), which are deduped and
+fetched with bounded concurrency. Each answer gives one row with the
+cheapest offer. Used by the app when PRICE_PROVIDER is not "sim", and by
+benchmarks/bench_replay.py.
+"""
+import asyncio
+import time
+from datetime import date, timedelta
+from typing import List, Dict, Any, Optional
+
+from .providers import PriceProvider, search_key
+from .tracking import CONCURRENCY
+
+
+def grid_queries(origins: List[str], destinations: List[str], start: date, window_days: int,
+                 stay_days: int, return_date: Optional[date] = None, adults: int = 1,
+                 cabin: str = "ECONOMY") -> List[Dict[str, Any]]:
+    queries = {}
+    for o in origins:
+        for d in destinations:
+            for delta in range(-window_days, window_days + 1):
+                dep = start + timedelta(days=delta)
+                ret = return_date or dep + timedelta(days=stay_days)
+                if ret <= dep:
+                    continue
+                q = {"origin": o.strip().upper(), "destination": d.strip().upper(),
+                     "departure": dep.isoformat(), "return": ret.isoformat(), "adults": adults, "cabin": cabin}
+                queries.setdefault(search_key(q), q)
+    return list(queries.values())
+
+
+async def search_grid(provider: PriceProvider, queries: List[Dict[str, Any]],
+                      concurrency: int = CONCURRENCY) -> Dict[str, Any]:
+    """Cheapest offer per query. Returns {"rows": [...], "errors": n, "elapsed": s}."""
+    t0 = time.perf_counter()
+    sem = asyncio.Semaphore(max(concurrency, 1))
+    rows, errors = [], 0
+
+    async def one(q):
+        nonlocal errors
+        async with sem:
+            try:
+                offers = await provider.browse(q)
+            except Exception:
+                errors += 1
+                return
+        priced = [o for o in offers if o.price is not None]
+        if not priced:
+            return
+        best = min(priced, key=lambda o: o.price)
+        rows.append({"origin": q["origin"], "destination": q["destination"], "departure": q["departure"],
+                     "return": q["return"],
+                     "stay_days": (date.fromisoformat(q["return"]) - date.fromisoformat(q["departure"])).days,
+                     "price": int(round(best.price)), "airline": "/".join(best.carriers), "stops": best.stops})
+
+    await asyncio.gather(*(one(q) for q in queries))
+    return {"rows": rows, "errors": errors, "elapsed": time.perf_counter() - t0}
+
+
+def run_search(provider: PriceProvider, queries: List[Dict[str, Any]], **kwargs) -> Dict[str, Any]:
+    return asyncio.run(search_grid(provider, queries, **kwargs))
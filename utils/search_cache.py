@@ -0,0 +1,238 @@
+# utils/search_cache.py
+"""
+Two-level cache for flight searches (amadeus_client.search_flights and the
+amadeus provider of utils/providers.py).
+
+- level 1: in-process LRU (SEARCH_CACHE_SIZE entries, default 512)
+- level 2: SQLite file shared by the app, track.py and workers
+           (SEARCH_CACHE_DB, default ./search_cache.db)
+
+Keys are the normalized query (utils.providers.search_key: upper-cased IATA
+codes, ISO dates, adults, cabin), so equivalent calls share an entry.
+
+An entry is fresh for SEARCH_CACHE_TTL seconds (default 900). After that it
+may still be served for SEARCH_CACHE_STALE more seconds (default 3600,
+stale-while-revalidate) while one background thread refreshes it; older
+entries are refetched synchronously, once for concurrent callers. Failed
+fetches are never cached.
+
+Only reads for display go through ``cached_search`` (search tab,
+amadeus_client.search_flights). The tracker records each answer as an
+observation stamped with the current time, so it uses ``fresh_search``:
+always a real request, whose result then refreshes the cache.
+
+SEARCH_CACHE=0 disables the cache. ``stats()`` returns hit/miss counters.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from .providers import search_key
+
+ENABLED = os.environ.get("SEARCH_CACHE", "1").strip().lower() not in ("0", "false", "no")
+CACHE_DB = os.environ.get("SEARCH_CACHE_DB", os.path.join(".", "search_cache.db"))
+TTL = float(os.environ.get("SEARCH_CACHE_TTL", "900"))
+STALE = float(os.environ.get("SEARCH_CACHE_STALE", "3600"))
+SIZE = int(os.environ.get("SEARCH_CACHE_SIZE", "512"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS searches (
+    key     TEXT PRIMARY KEY,
+    ts      REAL NOT NULL,
+    payload TEXT NOT NULL
+);
+"""
+
+
+def cache_key(query: Dict[str, Any]) -> str:
+    return json.dumps(search_key(query), separators=(",", ":"))
+
+
+class SearchCache:
+    """LRU in front of a SQLite table; see the module docstring."""
+
+    def __init__(self, path: Optional[str] = CACHE_DB, ttl: float = TTL, stale: float = STALE, size: int = SIZE):
+        self.path = path
+        self.ttl = ttl
+        self.stale = stale
+        self.size = size
+        self._lru: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._inflight: Dict[str, threading.Event] = {}
+        self.counters = {"hits": 0, "disk_hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "errors": 0}
+        if self.path:
+            with self._connect() as conn:
+                conn.executescript(SCHEMA)
+
+    # -------------------------
+    # Storage
+    # -------------------------
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _remember(self, key: str, ts: float, value: Any):
+        with self._lock:
+            self._lru[key] = (ts, value)
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.size:
+                self._lru.popitem(last=False)
+
+    def _lookup(self, key: str):
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                self._lru.move_to_end(key)
+                return entry, False
+        if not self.path:
+            return None, False
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute("SELECT ts, payload FROM searches WHERE key = ?", (key,)).fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return None, False
+        if row is None:
+            return None, False
+        entry = (row[0], json.loads(row[1]))
+        self._remember(key, *entry)
+        return entry, True
+
+    def put(self, query: Dict[str, Any], value: Any, ts: Optional[float] = None):
+        key = cache_key(query)
+        ts = time.time() if ts is None else ts
+        self._remember(key, ts, value)
+        if not self.path:
+            return
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute("INSERT OR REPLACE INTO searches (key, ts, payload) VALUES (?, ?, ?)",
+                                 (key, ts, json.dumps(value, separators=(",", ":"))))
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            pass
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    # -------------------------
+    # Lookup
+    # -------------------------
+    def _refresh(self, key: str, query: Dict[str, Any], fetch: Callable[[], Any]):
+        try:
+            self.put(query, fetch())
+            self._count("refreshes")
+        except Exception:
+            self._count("errors")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get_or_fetch(self, query: Dict[str, Any], fetch: Callable[[], Any]) -> Any:
+        """Cached result of ``query``; ``fetch()`` is called on a miss (its exceptions propagate)."""
+        key = cache_key(query)
+        entry, from_disk = self._lookup(key)
+        now = time.time()
+        if entry is not None:
+            ts, value = entry
+            age = now - ts
+            if age <= self.ttl:
+                self._count("disk_hits" if from_disk else "hits")
+                return value
+            if age <= self.ttl + self.stale:
+                self._count("stale_hits")
+                with self._lock:
+                    start = key not in self._refreshing
+                    self._refreshing.add(key)
+                if start:
+                    threading.Thread(target=self._refresh, args=(key, query, fetch), daemon=True).start()
+                return value
+        # concurrent misses on one key wait for the first fetch instead of repeating it
+        with self._lock:
+            pending = self._inflight.get(key)
+            if pending is None:
+                self._inflight[key] = threading.Event()
+        if pending is not None:
+            pending.wait()
+            entry, _ = self._lookup(key)
+            if entry is not None and time.time() - entry[0] <= self.ttl:
+                self._count("hits")
+                return entry[1]
+            self._count("misses")
+            return fetch()
+        self._count("misses")
+        try:
+            value = fetch()
+            self.put(query, value, now)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key).set()
+
+    def purge(self, older_than: Optional[float] = None) -> int:
+        """Drop entries past ttl + stale (or older than ``older_than`` seconds). Returns rows deleted."""
+        limit = time.time() - (self.ttl + self.stale if older_than is None else older_than)
+        with self._lock:
+            for k in [k for k, (ts, _) in self._lru.items() if ts < limit]:
+                del self._lru[k]
+        if not self.path:
+            return 0
+        conn = self._connect()
+        try:
+            with conn:
+                return conn.execute("DELETE FROM searches WHERE ts < ?", (limit,)).rowcount
+        finally:
+            conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self.counters, entries=len(self._lru))
+        served = out["hits"] + out["disk_hits"] + out["stale_hits"]
+        total = served + out["misses"]
+        out["hit_ratio"] = served / total if total else None
+        return out
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> Optional[SearchCache]:
+    """Process-wide cache, None when SEARCH_CACHE=0."""
+    global _cache
+    if not ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = SearchCache()
+        return _cache
+
+
+def cached_search(query: Dict[str, Any], fetch: Callable[[], Any]) -> Any:
+    cache = get_cache()
+    return cache.get_or_fetch(query, fetch) if cache is not None else fetch()
+
+
+def fresh_search(query: Dict[str, Any], fetch: Callable[[], Any]) -> Any:
+    """Always ``fetch()`` (price observations must not be old answers), then keep the result for readers."""
+    value = fetch()
+    cache = get_cache()
+    if cache is not None:
+        cache.put(query, value)
+    return value
+
+
+def stats() -> Optional[Dict[str, Any]]:
+    return _cache.stats() if _cache is not None else None
@@ -0,0 +1,226 @@
+# utils/sharding.py
+"""
+Split the routes between several track.py workers (``--shard i/N``).
+
+- partition : route i belongs to shard blake2b(id) mod N, stable across
+  processes, hosts and Python versions (unlike hash())
+- lease     : ``leases/shard-<i>-of-<N>.lease`` is created exclusively by
+  the worker of that shard and renewed while it runs (every scheduler step
+  in daemon mode); another worker started with the same shard refuses to
+  run until the lease expired (LEASE_TTL seconds, default 600) or its owner
+  process is gone. Taking over an expired lease and renewing one both hold
+  ``<lease>.takeover`` (created with O_EXCL), so two workers cannot both win.
+  A worker that lost its lease stops writing and exits
+- writes    : a worker only appends to the history segments of its routes
+  and to its own log ``routes.wal.<i>-of-<N>`` (see utils/wal.py); it never
+  rewrites routes.json, so workers cannot clobber each other
+
+All workers of a deployment must use the same N.
+"""
+import hashlib
+import json
+import os
+import socket
+import time
+from datetime import datetime
+from typing import List, Dict, Any, Tuple, Optional
+
+from .fileio import atomic_write
+from .storage import append_log
+from . import wal
+
+LEASE_DIR = os.path.join(".", "leases")
+LEASE_TTL = float(os.environ.get("LEASE_TTL", "600"))
+
+
+class LeaseError(Exception):
+    pass
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """'i/N' -> (i, N), with 0 <= i < N."""
+    try:
+        i, n = (int(x) for x in str(spec).split("/", 1))
+    except Exception:
+        raise ValueError(f"invalid shard {spec!r} (expected i/N, e.g. 0/4)")
+    if n < 1 or not 0 <= i < n:
+        raise ValueError(f"invalid shard {spec!r}: need 0 <= i < N")
+    return i, n
+
+
+def shard_of(route_id: str, n: int) -> int:
+    h = hashlib.blake2b(str(route_id).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(h, "big") % n
+
+
+def partition(routes: List[Dict[str, Any]], i: int, n: int) -> List[Dict[str, Any]]:
+    return [r for r in routes if r.get("id") and shard_of(r["id"], n) == i]
+
+
+def wal_file(i: int, n: int) -> str:
+    return f"{wal.MAIN_WAL_FILE}.{i}-of-{n}"
+
+
+# -------------------------
+# Lease
+# -------------------------
+def _owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _alive(owner: str) -> bool:
+    """False only if the owner is a process of this host that no longer exists."""
+    host, _, pid = str(owner).rpartition(":")
+    if host != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except Exception:
+        pass
+    return True
+
+
+class Lease:
+    def __init__(self, name: str, ttl: float = LEASE_TTL, lease_dir: str = LEASE_DIR):
+        self.path = os.path.join(lease_dir, f"{name}.lease")
+        self.ttl = ttl
+        self.owner = _owner()
+        self.held = False
+
+    def _payload(self) -> bytes:
+        return json.dumps({"owner": self.owner, "expires": time.time() + self.ttl}).encode("utf-8")
+
+    def read(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return None
+
+    def _lock(self) -> int:
+        """Exclusive right to rewrite an existing lease file (O_EXCL lock file)."""
+        lock = f"{self.path}.takeover"
+        try:
+            return os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            # left behind by a worker that crashed mid-takeover
+            try:
+                if time.time() - os.path.getmtime(lock) > self.ttl:
+                    os.remove(lock)
+            except OSError:
+                pass
+            raise LeaseError(f"{self.path} is being taken over by another worker")
+
+    def _unlock(self, fd: int):
+        os.close(fd)
+        try:
+            os.remove(f"{self.path}.takeover")
+        except FileNotFoundError:
+            pass
+
+    def acquire(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            lock = self._lock()
+            try:
+                # re-read under the lock: another worker may have just taken it over
+                cur = self.read() or {}
+                if cur.get("owner") != self.owner and float(cur.get("expires", 0)) > time.time() \
+                        and _alive(cur.get("owner", "")):
+                    raise LeaseError(f"{self.path} held by {cur.get('owner')} until "
+                                     f"{time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(float(cur['expires'])))}")
+                # expired or dead owner
+                atomic_write(self.path, self._payload())
+            finally:
+                self._unlock(lock)
+        else:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self._payload())
+        self.held = True
+        return self
+
+    def renew(self):
+        """Extend the lease. Raises LeaseError (and drops it) if another worker owns it now."""
+        if not self.held:
+            return
+        try:
+            lock = self._lock()
+        except LeaseError:
+            # a takeover is running: only possible once our lease expired
+            cur = self.read() or {}
+            if cur.get("owner") == self.owner and float(cur.get("expires", 0)) > time.time():
+                return
+            self.held = False
+            raise
+        try:
+            cur = self.read() or {}
+            if cur.get("owner") != self.owner:
+                self.held = False
+                raise LeaseError(f"lost lease {self.path} to {cur.get('owner')}")
+            atomic_write(self.path, self._payload())
+        finally:
+            self._unlock(lock)
+
+    def release(self):
+        if self.held and (self.read() or {}).get("owner") == self.owner:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+        self.held = False
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+# -------------------------
+# Worker
+# -------------------------
+class ShardWorker:
+    """Lease + partition log of one shard; checkpoint() replaces the snapshot checkpoint."""
+
+    def __init__(self, i: int, n: int, ttl: float = LEASE_TTL):
+        self.i, self.n = i, n
+        self.lease = Lease(f"shard-{i}-of-{n}", ttl=ttl)
+
+    def start(self):
+        self.lease.acquire()
+        wal.use_file(wal_file(self.i, self.n))
+        return self
+
+    def select(self, routes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return partition(routes, self.i, self.n)
+
+    def heartbeat(self) -> bool:
+        """Renew the lease. False (logged) once it was lost: the caller must stop."""
+        if not self.lease.held:
+            return False
+        try:
+            self.lease.renew()
+            return True
+        except LeaseError as e:
+            append_log(f"{datetime.now().isoformat()} - shard {self.i}/{self.n}: {e}")
+            return False
+
+    def checkpoint(self, routes: List[Dict[str, Any]] = None, force: bool = False) -> bool:
+        """Renew the lease; compact the partition log when due. Never writes routes.json."""
+        if not self.heartbeat():
+            # lease lost: the points already logged stay, no compaction
+            wal.sync()
+            return False
+        if force or wal.checkpoint_due():
+            wal.compact()
+            return True
+        wal.sync()
+        return False
+
+    def stop(self):
+        wal.sync()
+        self.lease.release()
@@ -1,46 +1,197 @@
 # utils/simulation.py
-import random
+"""
+Simulated prices for the "simu" paths: SimulatedProvider (track.py, search
+tab), the app / dashboard update buttons and actions.bulk_update_sim.
+
+``simulate_prices(routes, ts)`` prices a whole batch at once. Per route:
+
+- a base price drawn from the origin/destination pair (150..1200 €);
+- seasonality on the departure date (summer peak, Christmas bump);
+- a days-to-departure curve (cheapest 1-3 months ahead, steep in the last
+  two weeks);
+- an hourly log-normal step: a random walk from the last known price,
+  pulled back towards the model price (SIM_REVERT), or around the model
+  price when the route has no history.
+
+The last known price is the last point of an attached ``route["history"]``.
+Routes loaded without their history (the app, the scheduler) and provider
+queries have none, so their callers pass ``last`` explicitly (e.g.
+storage.history_summary(route)["last"]); otherwise the walk never starts.
+
+Seeds come from blake2b of the route identity plus the hour of ``ts``, mixed
+with splitmix64, so a price is the same in every process for a given route
+and hour (the builtin ``hash()`` is salted per process). With NumPy the
+batch is evaluated as arrays; without it the same formulas run per route.
+"""
+import hashlib
 import math
-from datetime import datetime
+import os
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+SIM_VOLATILITY = float(os.environ.get("SIM_VOLATILITY", "0.05"))
+SIM_REVERT = float(os.environ.get("SIM_REVERT", "0.2"))
+MIN_PRICE, MAX_PRICE = 20, 5000
+# departure assumed for routes without a parseable one
+DEFAULT_LEAD_DAYS = 60
+
+_MASK = (1 << 64) - 1
+_GOLDEN = 0x9E3779B97F4A7C15
+_UNIX_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+_seed_cache: Dict[str, tuple] = {}
+_SEED_CACHE_SIZE = 1 << 18
+
+
+def _seeds(route: Dict[str, Any]) -> tuple:
+    """(noise seed, base price) of a route, stable across processes."""
+    origin, destination = route.get("origin", ""), route.get("destination", "")
+    ident = f"{route.get('id', '')}|{origin}|{destination}"
+    hit = _seed_cache.get(ident)
+    if hit is not None:
+        return hit
+    pair = hashlib.blake2b(f"{origin}-{destination}".encode("utf-8"), digest_size=8).digest()
+    noise = hashlib.blake2b(ident.encode("utf-8"), digest_size=8).digest()
+    base = 150 + 1050 * (int.from_bytes(pair, "little") >> 11) * 2.0 ** -53
+    if len(_seed_cache) >= _SEED_CACHE_SIZE:
+        _seed_cache.clear()
+    hit = _seed_cache[ident] = (int.from_bytes(noise, "little"), base)
+    return hit
+
+
+def _splitmix(x):
+    """splitmix64 finalizer on a uint64 array (wrapping arithmetic)."""
+    x = x + np.uint64(_GOLDEN)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _splitmix_int(x: int) -> int:
+    x = (x + _GOLDEN) & _MASK
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK
+    return x ^ (x >> 31)
+
+
+def _season(doy, xp):
+    """Multiplier for the departure day of year: summer peak, Christmas bump."""
+    return (1 + 0.18 * xp.cos(2 * math.pi * (doy - 196) / 365.25)
+            + 0.12 * xp.exp(-((doy - 358) / 6.0) ** 2))
+
+
+def _lead(days, xp):
+    """Multiplier for the days left before departure."""
+    return 1 + 0.55 * xp.exp(-days / 12.0) + 0.08 * days / 330.0
 
-def _seed_from_route(route: dict) -> int:
-    """Produce a stable-ish seed from route id/origin/destination to get reproducible simulation across runs."""
-    s = f"{route.get('id','')}-{route.get('origin','')}-{route.get('destination','')}"
-    return abs(hash(s)) % (2**31)
 
-def simulate_price(route: dict) -> int:
+def _epoch(ts: Union[None, float, datetime]) -> float:
+    if ts is None:
+        return datetime.now().timestamp()
+    if isinstance(ts, datetime):
+        return ts.timestamp()
+    return float(ts)
+
+
+def _departure_ordinal(route: Dict[str, Any], today: int) -> int:
+    try:
+        return date.fromisoformat(str(route.get("departure"))[:10]).toordinal()
+    except (TypeError, ValueError):
+        return today + DEFAULT_LEAD_DAYS
+
+
+def _as_price(value: Any) -> float:
+    try:
+        price = float(value)
+    except (TypeError, ValueError):
+        return math.nan
+    return price if price > 0 else math.nan
+
+
+def _last_price(route: Dict[str, Any]) -> float:
+    history = route.get("history") or []
+    if history and isinstance(history[-1], dict):
+        return _as_price(history[-1].get("price"))
+    return math.nan
+
+
+def simulate_prices(routes: Sequence[Dict[str, Any]], ts: Union[None, float, datetime] = None,
+                    last: Optional[Sequence[Optional[float]]] = None):
     """
-    Simulate a price (int, €) for the given route.
-    - If route has history, vary around the last price.
-    - Otherwise produce a base price depending on pseudo-distance (origin/destination hash).
+    Simulated prices (int €) of routes at time ts (epoch seconds or datetime,
+    default now): a NumPy int64 array, or a list without NumPy. ``last`` gives
+    the last known price of each route (None: no history); by default it is
+    read from the attached history.
     """
-    # Try to base on last price if available
-    history = route.get("history", [])
-    if history:
-        try:
-            last = int(history[-1].get("price"))
-        except Exception:
-            last = None
+    epoch = _epoch(ts)
+    hour = int(epoch // 3600)
+    today = datetime.fromtimestamp(epoch).date().toordinal()
+    keys = [_seeds(r) for r in routes]
+    if last is None:
+        lasts = [_last_price(r) for r in routes]
     else:
-        last = None
+        lasts = [_as_price(p) for p in last]
+        if len(lasts) != len(routes):
+            raise ValueError(f"last: {len(lasts)} prices for {len(routes)} routes")
+    if np is None:
+        return [_simulate_one(seed, base, _departure_ordinal(r, today), last, hour, today)
+                for r, (seed, base), last in zip(routes, keys, lasts)]
 
-    # seed randomness for reproducibility per route + day
-    seed = _seed_from_route(route) + int(datetime.now().timestamp() // 3600)  # changes every hour
-    rnd = random.Random(seed)
+    n = len(routes)
+    seed = np.fromiter((k[0] for k in keys), dtype=np.uint64, count=n)
+    base = np.fromiter((k[1] for k in keys), dtype=np.float64, count=n)
+    last = np.asarray(lasts, dtype=np.float64)
+    try:
+        # ISO dates parsed in one go; per route only if one is malformed
+        dep = np.array([r.get("departure") or "NaT" for r in routes], dtype="datetime64[D]")
+        dep = np.where(np.isnat(dep), today + DEFAULT_LEAD_DAYS, dep.astype(np.int64) + _UNIX_ORDINAL)
+    except (TypeError, ValueError):
+        dep = np.asarray([_departure_ordinal(r, today) for r in routes], dtype=np.int64)
 
-    if last and isinstance(last, int):
-        # small percent change ±0-12%
-        pct = rnd.uniform(-0.12, 0.12)
-        new_price = max(30, int(round(last * (1 + pct))))
-    else:
-        # generate a base price using hashed pseudo-distance
-        h = _seed_from_route(route)
-        # normalized pseudo-distance factor
-        factor = (h % 5000) / 5000  # 0..1
-        base = 200 + int(factor * 1000)  # 200..1200
-        # add some noise
-        new_price = base + rnd.randint(-50, 120)
-
-    # clamp to reasonable range
-    new_price = max(20, min(new_price, 5000))
-    return int(new_price)
+    doy = (dep - _UNIX_ORDINAL).astype("datetime64[D]")
+    doy = (doy - doy.astype("datetime64[Y]")).astype(np.int64) + 1
+    days = np.maximum(dep - today, 0).astype(np.float64)
+    model = base * _season(doy, np) * _lead(days, np)
+
+    h = np.uint64((hour * _GOLDEN) & _MASK)
+    u1 = ((_splitmix(seed ^ h) >> np.uint64(11)).astype(np.float64) + 1) * 2.0 ** -53
+    u2 = (_splitmix(seed + h) >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+    z = np.sqrt(-2 * np.log(u1)) * np.cos(2 * math.pi * u2)
+
+    anchor = np.where(np.isnan(last), model, last + SIM_REVERT * (model - last))
+    price = anchor * np.exp(SIM_VOLATILITY * z)
+    return np.clip(np.rint(price), MIN_PRICE, MAX_PRICE).astype(np.int64)
+
+
+def _simulate_one(seed: int, base: float, dep: int, last: float, hour: int, today: int) -> int:
+    doy = dep - date(date.fromordinal(dep).year, 1, 1).toordinal() + 1
+    days = float(max(dep - today, 0))
+    model = base * _season(doy, math) * _lead(days, math)
+    h = (hour * _GOLDEN) & _MASK
+    u1 = ((_splitmix_int(seed ^ h) >> 11) + 1) * 2.0 ** -53
+    u2 = (_splitmix_int((seed + h) & _MASK) >> 11) * 2.0 ** -53
+    z = math.sqrt(-2 * math.log(u1)) * math.cos(2 * math.pi * u2)
+    anchor = model if math.isnan(last) else last + SIM_REVERT * (model - last)
+    return int(min(max(round(anchor * math.exp(SIM_VOLATILITY * z)), MIN_PRICE), MAX_PRICE))
+
+
+def simulate_price(route: Dict[str, Any], ts: Union[None, float, datetime] = None,
+                   last: Optional[float] = None) -> int:
+    """Simulated price (int €) of one route; see simulate_prices."""
+    return int(simulate_prices([route], ts, None if last is None else [last])[0])
+
+
+def simulate_grid(cells: List[Dict[str, Any]], ts: Union[None, float, datetime] = None) -> List[int]:
+    """
+    Prices of search-tab cells ({origin, destination, departure, return, ...});
+    ``sample`` (optional) tells repeated samples of the same cell apart.
+    """
+    routes = [dict(c, id=f"{c.get('origin')}-{c.get('destination')}-{c.get('departure')}-{c.get('return')}"
+                         f"#{c.get('sample', 0)}") for c in cells]
+    return [int(p) for p in simulate_prices(routes, ts)]
@@ -1,12 +1,17 @@
 # utils/storage.py
+import hashlib
 import json
 import os
-import subprocess
-import shlex
 import time
 from datetime import datetime, timedelta, date
 from typing import List, Dict, Any, Optional
 
+from .fileio import atomic_write
+from .route_store import get_store
+from .history import points_to_arrays, strip_history
+from .outbox import OUTBOX_SNAPSHOT
+from . import wal, git_push, events
+
 # Optional imports used by JSON sanitizer helpers
 try:
     import numpy as np
@@ -24,31 +29,23 @@ except Exception:
 DATA_DIR = "."
 ROUTES_FILE = os.path.join(DATA_DIR, "routes.json")
 EMAIL_CFG_FILE = os.path.join(DATA_DIR, "email_config.json")
-LOG_FILE = os.path.join(DATA_DIR, "last_updates.log")
+LOG_FILE = events.EVENTS_FILE  # structured JSONL event log (utils/events.py)
+VERSION_FILE = os.path.join(DATA_DIR, "routes.version")
+
+# content hash of the state last loaded from / written to each store (id(store) -> sha1)
+_persisted_hash: Dict[int, Optional[str]] = {}
 
 
 # -------------------------
 # Low-level helpers
 # -------------------------
-def _atomic_write(path: str, data_bytes: bytes):
-    """Write bytes to a temp file and atomically replace target."""
-    tmp = f"{path}.tmp"
-    with open(tmp, "wb") as f:
-        f.write(data_bytes)
-        f.flush()
-        try:
-            os.fsync(f.fileno())
-        except Exception:
-            # os.fsync may not be available in some environments, ignore if it fails
-            pass
-    os.replace(tmp, path)
+_atomic_write = atomic_write
 
 
 def append_log(line: str):
-    """Append a single line to the log file (with newline)."""
+    """Record a free-text line as a buffered "log" event."""
     try:
-        with open(LOG_FILE, "a", encoding="utf-8") as f:
-            f.write(line.rstrip("\n") + "\n")
+        events.emit("log", msg=line.rstrip("\n"))
     except Exception:
         # avoid raising from logging
         pass
@@ -70,23 +67,88 @@ def ensure_data_file():
 # -------------------------
 # Load / Save
 # -------------------------
-def load_routes() -> List[Dict[str, Any]]:
-    """Load list of routes from JSON, return [] on parse error but avoid crash."""
-    try:
-        with open(ROUTES_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            return data if isinstance(data, list) else []
-    except FileNotFoundError:
-        return []
-    except Exception:
-        # if malformed, rotate the file and return empty list
-        try:
-            ts = datetime.now().strftime("%Y%m%d%H%M%S")
-            bad = f"{ROUTES_FILE}.broken.{ts}"
-            os.replace(ROUTES_FILE, bad)
-        except Exception:
-            pass
+def load_routes(with_history: bool = True) -> List[Dict[str, Any]]:
+    """
+    Load list of routes from the configured store (see utils/route_store.py),
+    then replay the write-ahead log (utils/wal.py) on top of the snapshot.
+    Price history is attached to each route unless with_history is False.
+    If the snapshot is malformed it is kept aside as .broken.<ts> and the
+    previous snapshot + logs are used instead.
+    """
+    store = get_store()
+    routes = store.load_routes(with_history=with_history)
+    recovered = getattr(store, "recovered", None)
+    # hash of the snapshot itself, before the WAL is replayed on top of it
+    _persisted_hash[id(store)] = None if recovered else state_hash(routes)
+    wal.replay(routes, include_prev=(recovered == "prev"))
+    if recovered == "prev":
+        append_log(f"{datetime.now().isoformat()} - load_routes: ERROR snapshot unreadable, recovered {len(routes)} route(s) from previous snapshot + WAL")
+    elif recovered == "empty":
+        append_log(f"{datetime.now().isoformat()} - load_routes: ERROR snapshot unreadable and no previous snapshot, starting empty (broken file kept)")
+    return routes
+
+
+def get_history(route: Any, since: Optional[str] = None) -> List[Dict[str, Any]]:
+    """History of a route (dict or id): the attached list if loaded, otherwise read from the store."""
+    if isinstance(route, dict):
+        hist = route.get("history")
+        if isinstance(hist, list):
+            if not since:
+                return hist
+            return [h for h in hist if str(h.get("date", "")) >= str(since)]
+        route = route.get("id")
+    return get_store().get_history(route, since=since) if route else []
+
+
+def get_history_arrays(route: Any):
+    """
+    (epoch seconds, prices) arrays for a route (dict or id). Uses the attached
+    history if present, otherwise reads the store directly (memory-mapped with
+    HISTORY_FORMAT=bin), so charts/exports/summaries do not need per-point dicts.
+    """
+    if isinstance(route, dict):
+        hist = route.get("history")
+        if isinstance(hist, list):
+            return points_to_arrays(hist)
+        route = route.get("id")
+    if not route:
+        return points_to_arrays([])
+    return get_store().get_history_arrays(route)
+
+
+def get_history_rollups(route: Any) -> List[Dict[str, Any]]:
+    """Roll-up points (min/max band of the charts) of a route (dict or id), attached history first."""
+    if isinstance(route, dict):
+        hist = route.get("history")
+        if isinstance(hist, list):
+            return [h for h in hist if h.get("agg")]
+        route = route.get("id")
+    if not route:
         return []
+    return get_store().get_rollups(route)
+
+
+def history_summary(route: Any) -> Dict[str, Any]:
+    """
+    last / min price, number of points and points in the last 24h, computed on
+    arrays. The min also covers the ``min`` of roll-up points (the arrays only
+    hold their bucket's last price).
+    """
+    ts, prices = get_history_arrays(route)
+    n = len(prices)
+    if n == 0:
+        return {"last": None, "min": None, "count": 0, "last_24h": 0}
+    cutoff = int(time.time()) - 24 * 3600
+    if np is not None:
+        last_24h = int(np.count_nonzero(np.asarray(ts) >= cutoff))
+        low = int(np.min(prices))
+    else:
+        last_24h = sum(1 for t in ts if t >= cutoff)
+        low = int(min(prices))
+    rolled = [int(p["min"]) for p in get_history_rollups(route) if p.get("min") is not None]
+    if rolled:
+        low = min(low, min(rolled))
+    return {"last": int(prices[-1]), "min": low, "count": n, "last_24h": last_24h}
 
 
 def load_email_config() -> Dict[str, Any]:
@@ -105,142 +167,121 @@ def save_email_config(cfg: Dict[str, Any]):
     _atomic_write(EMAIL_CFG_FILE, b)
 
 
-# -------------------------
-# Git commit & push helper
-# -------------------------
-def _git_commit_and_push_if_enabled(path: str = ROUTES_FILE, commit_msg: Optional[str] = None) -> Dict[str, Any]:
-    """
-    Attempt to commit the given file and push using GIT_PUSH_TOKEN / GITHUB_TOKEN if env enabled.
-    Returns a dict with keys: ok (bool), msg (str), detail (optional).
-    Also appends a human-readable single-line log to LOG_FILE.
-    """
-    timestamp = datetime.now().isoformat()
-    try:
-        git_push_flag = os.environ.get("GIT_PUSH", "").lower() in ("1", "true", "yes")
-        token = os.environ.get("GIT_PUSH_TOKEN") or os.environ.get("GITHUB_TOKEN")
-        repo = os.environ.get("GITHUB_REPOSITORY")  # expected "owner/repo"
-
-        if not git_push_flag or not token:
-            msg = "git push not enabled or no token"
-            append_log(f"{timestamp} - save_routes commit_and_push: ok=False msg={msg}")
-            return {"ok": False, "msg": msg, "detail": None}
-
-        # try to determine repo if not provided
-        if not repo:
-            try:
-                p = subprocess.run(shlex.split("git remote get-url origin"), capture_output=True, text=True, check=True)
-                url = p.stdout.strip()
-                if url:
-                    if url.startswith("git@"):
-                        # git@github.com:owner/repo.git
-                        repo = url.split(":", 1)[1].rstrip(".git")
-                    else:
-                        # https://github.com/owner/repo.git
-                        parts = url.rstrip(".git").split("/")
-                        if len(parts) >= 2:
-                            repo = parts[-2] + "/" + parts[-1]
-            except Exception:
-                repo = None
-
-        if not repo:
-            msg = "could not determine repository (set GITHUB_REPOSITORY env)"
-            append_log(f"{timestamp} - save_routes commit_and_push: ok=False msg={msg}")
-            return {"ok": False, "msg": msg, "detail": None}
-
-        # ensure git available
-        try:
-            subprocess.run(shlex.split("git status --porcelain"), capture_output=True, text=True, check=True)
-        except Exception as e:
-            msg = f"git not available or not a repo: {str(e)}"
-            append_log(f"{timestamp} - save_routes commit_and_push: ok=False msg={msg}")
-            return {"ok": False, "msg": msg, "detail": None}
-
-        # Stage the file
-        try:
-            subprocess.run(["git", "add", path], check=True, capture_output=True, text=True)
-        except subprocess.CalledProcessError as e:
-            detail = (e.stderr or e.stdout or str(e)).strip()
-            msg = "git add failed"
-            append_log(f"{timestamp} - save_routes commit_and_push: ok=False msg={msg} detail={detail}")
-            return {"ok": False, "msg": msg, "detail": detail}
-
-        # Commit if changes exist
-        if not commit_msg:
-            commit_msg = f"Auto update {os.path.basename(path)} via app at {datetime.now().isoformat()}"
-        try:
-            subprocess.run(["git", "commit", "-m", commit_msg], check=True, capture_output=True, text=True)
-        except subprocess.CalledProcessError as e:
-            out = (e.stdout or "") + (e.stderr or "")
-            if "nothing to commit" in out.lower():
-                append_log(f"{timestamp} - save_routes commit_and_push: ok=True msg=no_changes")
-                return {"ok": True, "msg": "no_changes", "detail": out}
-            detail = out.strip() or str(e)
-            append_log(f"{timestamp} - save_routes commit_and_push: ok=False msg=git commit failed detail={detail}")
-            return {"ok": False, "msg": "git commit failed", "detail": detail}
-
-        # Add temporary remote with token and push
-        owner_repo = repo
-        remote_name = f"autopush-{int(time.time())}"
-        remote_url = f"https://{token}@github.com/{owner_repo}.git"
-        try:
-            subprocess.run(["git", "remote", "add", remote_name, remote_url], check=True, capture_output=True, text=True)
-        except subprocess.CalledProcessError as e:
-            detail = (e.stderr or e.stdout or str(e)).strip()
-            append_log(f"{timestamp} - save_routes commit_and_push: ok=False msg=git remote add failed detail={detail}")
-            return {"ok": False, "msg": "git remote add failed", "detail": detail}
-
-        try:
-            p = subprocess.run(["git", "push", remote_name, "HEAD"], check=True, capture_output=True, text=True)
-            detail = (p.stdout or p.stderr or "").strip()
-            append_log(f"{timestamp} - save_routes commit_and_push: ok=True msg=pushed detail={detail}")
-            return {"ok": True, "msg": "pushed", "detail": detail}
-        except subprocess.CalledProcessError as e:
-            detail = (e.stderr or e.stdout or str(e)).strip()
-            append_log(f"{timestamp} - save_routes commit_and_push: ok=False msg=git push failed detail={detail}")
-            return {"ok": False, "msg": "git push failed", "detail": detail}
-        finally:
-            # remove remote (best-effort)
-            try:
-                subprocess.run(["git", "remote", "remove", remote_name], capture_output=True, text=True)
-            except Exception:
-                pass
-
-    except Exception as e:
-        detail = str(e)
-        append_log(f"{timestamp} - save_routes commit_and_push: ok=False msg=exception detail={detail}")
-        return {"ok": False, "msg": "exception", "detail": detail}
-
-
 # -------------------------
 # save_routes (with optional commit+push)
 # -------------------------
 def save_routes(routes: List[Dict[str, Any]], commit_and_push: bool = False, commit_msg: Optional[str] = None):
     """
-    Save routes to JSON atomically.
-    If commit_and_push True, attempt to commit & push (logs result).
-    Returns None. Logs push outcome in last_updates.log.
+    Save routes through the configured store (atomic writes; new history
+    points are appended, the route configuration is written separately).
+    This is also the WAL checkpoint: pending log records are merged in, the
+    snapshot is written, then the log is rotated.
+    If commit_and_push True, the files are queued for the background git push
+    worker (utils/git_push.py), which coalesces saves into one commit + push.
+    Returns None. Push outcome: git_push.push_status() / last "push" event.
+    A save whose content hash matches the last loaded/written state is a no-op
+    (nothing written, no git); otherwise routes.version is incremented.
     """
+    store = get_store()
     try:
-        b = json.dumps(routes, ensure_ascii=False, indent=2).encode("utf-8")
-        _atomic_write(ROUTES_FILE, b)
+        replayed_at = time.time()
+        wal.replay(routes)
+        digest = state_hash(routes)
+        if digest == _persisted_hash.get(id(store)):
+            # byte-identical to what is on disk: no write, no fsync, no git
+            if commit_and_push and git_push.push_status().get("ok") is False:
+                # ... unless the last push failed and must be retried
+                git_push.request_push(_push_paths(store), commit_msg)
+            return
+        store.save_routes(routes)
+        wal.rotate(since=replayed_at)
+        wal.mark_absorbed()
+        _persisted_hash[id(store)] = digest
+        _bump_version(digest)
     except Exception as e:
         append_log(f"{datetime.now().isoformat()} - save_routes: write error: {e}")
         # still attempt commit_and_push? usually skip
         if not commit_and_push:
             return
 
-    # If requested, attempt git commit & push (function handles its own logging)
+    # If requested, queue a git commit & push (the worker handles its own logging)
     if commit_and_push:
-        _git_commit_and_push_if_enabled(path=ROUTES_FILE, commit_msg=commit_msg)
+        git_push.request_push(_push_paths(store), commit_msg)
     else:
         append_log(f"{datetime.now().isoformat()} - save_routes: saved without push")
 
 
+def _push_paths(store) -> List[str]:
+    return ((store.paths() or [ROUTES_FILE]) + [wal.MAIN_WAL_FILE, wal.MARK_FILE, VERSION_FILE]
+            + wal.partition_files() + ([OUTBOX_SNAPSHOT] if OUTBOX_SNAPSHOT else []))
+
+
+def state_hash(routes: List[Dict[str, Any]]) -> str:
+    """
+    sha1 of the route configuration plus the length of each history (the
+    points themselves are append-only in the history store).
+    """
+    state = [dict(strip_history(r), _n=len(r.get("history") or [])) for r in routes]
+    blob = json.dumps(state, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()
+
+
+def _read_version() -> Dict[str, Any]:
+    try:
+        with open(VERSION_FILE, "r", encoding="utf-8") as f:
+            v = json.load(f)
+        return v if isinstance(v, dict) else {}
+    except Exception:
+        return {}
+
+
+def _bump_version(digest: str):
+    v = int(_read_version().get("version", 0)) + 1
+    _atomic_write(VERSION_FILE, json.dumps({"version": v, "hash": digest,
+                                            "ts": datetime.now().isoformat()}).encode("utf-8"))
+
+
+def data_version() -> int:
+    """
+    Counter incremented by every save that actually changed the routes
+    (one tiny file read). Readers reload only when it moved. Prices logged
+    in the WAL between checkpoints do not bump it.
+    """
+    return int(_read_version().get("version", 0))
+
+
+def append_price(r: Dict[str, Any], price: int, ts: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Record a new price observation for a route: appended in memory and
+    immediately to the store's history (O(1), no routes.json rewrite).
+    last_tracked is recorded in the write-ahead log.
+    """
+    point = get_store().append_price(r, price, ts)
+    if r.get("id"):
+        wal.log_price(r["id"], point)
+    return point
+
+
+def checkpoint_if_due(routes: List[Dict[str, Any]], force: bool = False, commit_and_push: bool = False) -> bool:
+    """
+    Write a snapshot (save_routes) only when the WAL holds enough records or is
+    old enough; otherwise just fsync the log. Returns True if a checkpoint ran.
+    """
+    if force or wal.checkpoint_due():
+        save_routes(routes, commit_and_push=commit_and_push)
+        return True
+    wal.sync()
+    return False
+
+
 # -------------------------
 # Other utils
 # -------------------------
 def count_updates_last_24h(route: Dict[str, Any]) -> int:
     """Return number of history entries in the last 24 hours (robust to formats)."""
+    if not isinstance(route.get("history"), list):
+        # history not attached: count on the store arrays instead
+        return history_summary(route)["last_24h"]
     now = datetime.now()
     cutoff = now - timedelta(hours=24)
     cnt = 0
@@ -282,7 +323,8 @@ def ensure_route_fields(r: Dict[str, Any]):
     r.setdefault("max_stops", "any")
     r.setdefault("avoid_airlines", [])
     r.setdefault("preferred_airlines", [])
-    r.setdefault("history", [])
+    # no default "history": a missing list means "not loaded" (read from the
+    # store on demand), an empty list means "no points"
     r.setdefault("last_tracked", None)
     r.setdefault("stats", {})
 
@@ -290,6 +332,7 @@ def ensure_route_fields(r: Dict[str, Any]):
 def increment_route_stat(r: Dict[str, Any], key: str, amount: int = 1):
     """
     Increment a numeric stat inside route['stats'] safely.
+    The new value is recorded in the write-ahead log.
     """
     try:
         if r is None:
@@ -301,6 +344,20 @@ def increment_route_stat(r: Dict[str, Any], key: str, amount: int = 1):
         except Exception:
             cur_val = 0
         stats[key] = cur_val + int(amount)
+        if r.get("id"):
+            wal.log_stat(r["id"], key, stats[key])
+    except Exception:
+        pass
+
+
+def set_route_fields(r: Dict[str, Any], **fields):
+    """Set top-level route fields; the new values are recorded in the write-ahead log."""
+    try:
+        if r is None:
+            return
+        r.update(fields)
+        if r.get("id"):
+            wal.log_set(r["id"], fields)
     except Exception:
         pass
 
@@ -0,0 +1,182 @@
+# utils/tracking.py
+"""
+Asynchronous tracking pipeline used by track.py.
+
+    due routes -> group by search key -> fetch (N concurrent provider calls)
+               -> filter (per route) -> persist -> notify (digests)
+
+- group   : routes with the same query (origin, destination, dates, cabin...)
+            share one provider request
+- fetch   : TRACK_CONCURRENCY workers (default 8) call provider.search()
+- filter  : matches the group's offers against every route of the group at
+            once (utils/offer_filter.py: avoid / preferred airlines,
+            max_stops / direct_only, min_bags, cabin) and keeps the
+            cheapest eligible offer per route
+- persist : single consumer; appends the price, updates stats, queues the
+            alert of routes under their target, subject to the per-route
+            hysteresis (utils/notify.py)
+- notify  : after the run, one digest per recipient, queued in the outbox
+            (utils/outbox.py) or sent directly
+
+Stages are connected by bounded asyncio queues, so a slow persist stage
+applies back-pressure instead of buffering every result in memory.
+"""
+import asyncio
+import os
+import time
+from typing import List, Dict, Any, Optional, Tuple
+
+from .providers import PriceProvider, search_query, search_key
+from .offers import Offer
+from .offer_filter import eligible, best_offer, best_offers  # noqa: F401 (re-exported)
+from .storage import count_updates_last_24h, ensure_route_fields, increment_route_stat, append_price, \
+    history_summary
+from .notify import Digest
+from .events import emit
+
+CONCURRENCY = int(os.environ.get("TRACK_CONCURRENCY", "8"))
+
+_DONE = object()
+
+
+# -------------------------
+# Due / filter
+# -------------------------
+def due_routes(routes: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+    """Routes that have not reached tracking_per_day updates in the last 24h (+ number skipped)."""
+    due, skipped = [], 0
+    for r in routes:
+        ensure_route_fields(r)
+        per_day = int(r.get("tracking_per_day", 1))
+        already_today = count_updates_last_24h(r)
+        if already_today >= per_day:
+            emit("skip", route=r.get("id"), already_today=already_today, per_day=per_day)
+            skipped += 1
+            continue
+        due.append(r)
+    return due, skipped
+
+
+def offer_price(offer: Offer) -> Optional[float]:
+    return offer.price
+
+
+def group_by_search(routes: List[Dict[str, Any]]) -> Dict[tuple, Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+    """
+    Routes sharing the same provider query (origin, destination, dates,
+    passengers, cabin) -> one request: {search key: (query, [routes])}.
+    """
+    groups: Dict[tuple, Tuple[Dict[str, Any], List[Dict[str, Any]]]] = {}
+    for r in routes:
+        query = search_query(r)
+        groups.setdefault(search_key(query), (query, []))[1].append(r)
+    return groups
+
+
+def _last_known(group: List[Dict[str, Any]]) -> Optional[int]:
+    """Last stored price of the first route of a group that has one."""
+    for r in group:
+        last = history_summary(r)["last"]
+        if last is not None:
+            return last
+    return None
+
+
+# -------------------------
+# Pipeline
+# -------------------------
+async def run_pipeline(routes: List[Dict[str, Any]], provider: PriceProvider,
+                       concurrency: int = CONCURRENCY, email_cfg: Optional[Dict[str, Any]] = None,
+                       send_email=None, check_due: bool = True, outbox=None) -> Dict[str, Any]:
+    """
+    Track every due route once (every route if check_due is False: the
+    caller, e.g. the scheduler, already decided). Alerts are queued in
+    ``outbox`` when given, else sent with ``send_email``. Returns a run
+    report: routes, due, requests, dedup_ratio (due routes per provider
+    request), skipped, updated, no_offer, errors, digests, queued (new
+    outbox messages), notified (routes covered by a digest delivered during
+    the run), elapsed (s).
+    """
+    t0 = time.perf_counter()
+    email_cfg = email_cfg or {}
+    due, skipped = due_routes(routes) if check_due else (list(routes), 0)
+    groups = group_by_search(due)
+    report = {"routes": len(routes), "due": len(due), "requests": len(groups),
+              "dedup_ratio": len(due) / len(groups) if groups else 1.0, "skipped": skipped,
+              "updated": 0, "no_offer": 0, "errors": 0, "digests": 0, "queued": 0, "notified": 0}
+    digest = Digest(email_cfg)
+
+    todo: asyncio.Queue = asyncio.Queue()
+    for query, group in groups.values():
+        todo.put_nowait((query, group))
+    fetched: asyncio.Queue = asyncio.Queue(maxsize=max(2 * concurrency, 1))
+    priced: asyncio.Queue = asyncio.Queue(maxsize=max(2 * concurrency, 1))
+
+    async def fetch_worker():
+        while True:
+            try:
+                query, group = todo.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            if provider.last_prices is not None:
+                # the simulated market walks from the group's last stored price
+                last = _last_known(group)
+                if last is not None:
+                    provider.last_prices[search_key(query)] = last
+            try:
+                offers = await provider.search(query)
+            except Exception as e:
+                report["errors"] += len(group)
+                for r in group:
+                    emit("skip", route=r.get("id"), reason="provider_error", error=str(e))
+                continue
+            await fetched.put((group, offers))
+
+    async def filter_stage():
+        while True:
+            item = await fetched.get()
+            if item is _DONE:
+                await priced.put(_DONE)
+                return
+            group, offers = item
+            # one answer, fanned out: each route applies its own constraints
+            for r, offer in zip(group, best_offers(group, offers)):
+                if offer is None:
+                    report["no_offer"] += 1
+                    emit("skip", route=r.get("id"), reason="no_eligible_offer", offers=len(offers))
+                    continue
+                await priced.put((r, int(round(offer_price(offer)))))
+
+    async def persist_stage():
+        while True:
+            item = await priced.get()
+            if item is _DONE:
+                return
+            r, price = item
+            append_price(r, price)
+            increment_route_stat(r, "updates_total")
+            increment_route_stat(r, "updates_today")
+            report["updated"] += 1
+            emit("update", route=r.get("id"), price=price)
+            if send_email is not None or outbox is not None:
+                digest.add(r, price)
+
+    async def fetch_stage():
+        await asyncio.gather(*(fetch_worker() for _ in range(max(1, min(concurrency, len(groups))))))
+        await fetched.put(_DONE)
+
+    await asyncio.gather(fetch_stage(), filter_stage(), persist_stage())
+    if len(digest) and outbox is not None:
+        queued = await asyncio.to_thread(digest.enqueue, outbox)
+        report["digests"], report["queued"] = queued["digests"], queued["queued"]
+    elif len(digest):
+        # blocking mail client + thread pool: off the event loop
+        sent = await asyncio.to_thread(digest.send, send_email)
+        report["digests"], report["notified"] = sent["digests"], sent["notified"]
+    report["elapsed"] = time.perf_counter() - t0
+    return report
+
+
+def run(routes: List[Dict[str, Any]], provider: PriceProvider, **kwargs) -> Dict[str, Any]:
+    """Synchronous entry point (asyncio.run)."""
+    return asyncio.run(run_pipeline(routes, provider, **kwargs))
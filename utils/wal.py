@@ -0,0 +1,300 @@
+# utils/wal.py
+"""
+Write-ahead log for route updates made by track.py.
+
+Small JSONL records are appended to ``routes.wal`` instead of rewriting the
+route snapshot on every run; the snapshot is checkpointed only every
+WAL_CHECKPOINT_RECORDS records or WAL_CHECKPOINT_SECONDS seconds.
+
+Records hold absolute values so replaying them is idempotent:
+
+- ``{"op": "price", "id": ..., "date": ..., "price": ...}`` -> last_tracked (the point
+  itself is already in the history store)
+- ``{"op": "stat", "id": ..., "key": ..., "value": ...}``   -> route['stats'][key]
+- ``{"op": "set", "id": ..., "fields": {...}}``             -> top-level route fields
+
+At checkpoint the current log becomes ``routes.wal.prev`` so that the previous
+snapshot plus ``.prev`` plus the current log can rebuild the state if the
+latest snapshot turns out to be unreadable. Any process may checkpoint (the
+app, track.py, the daemon): a writer whose open log was rotated away by
+another process notices it (inode changed) and reopens ``routes.wal``
+before its next append, and records that reached the old log after the
+checkpointing process replayed it are carried over into the new one.
+
+Sharded workers (``track.py --shard i/N``, utils/sharding.py) never write the
+snapshot: each one logs into its own ``routes.wal.<i>-of-<N>`` and compacts
+it in place (last record per key). Readers replay every partition log, in
+timestamp order, after the main one.
+
+A snapshot absorbs the partition records it replayed: ``routes.wal.mark``
+then holds the timestamp of the newest one, replay skips partition records
+at or before it (so they cannot revert newer snapshot values) and worker
+compaction drops them.
+"""
+import json
+import os
+import re
+import time
+from typing import List, Dict, Any, Optional
+
+from .fileio import atomic_write
+
+MAIN_WAL_FILE = os.path.join(".", "routes.wal")
+WAL_FILE = MAIN_WAL_FILE
+WAL_PREV_FILE = f"{WAL_FILE}.prev"
+MARK_FILE = f"{MAIN_WAL_FILE}.mark"
+_PARTITION_RE = re.compile(r"^routes\.wal\.\d+-of-\d+$")
+CHECKPOINT_RECORDS = int(os.environ.get("WAL_CHECKPOINT_RECORDS", "500"))
+CHECKPOINT_SECONDS = float(os.environ.get("WAL_CHECKPOINT_SECONDS", "3600"))
+
+_fh = None
+_records = None          # records in the current log (lazy count)
+_first_ts = None         # epoch of the first record in the current log
+_seen_partition_ts = 0.0  # newest partition record applied by the last replay
+
+
+def _rotated_away() -> bool:
+    """True when another process renamed our open log (checkpoint) or removed it."""
+    try:
+        return os.fstat(_fh.fileno()).st_ino != os.stat(WAL_FILE).st_ino
+    except OSError:
+        return True
+
+
+def _open():
+    global _fh, _records, _first_ts
+    if _fh is not None and not _fh.closed and _rotated_away():
+        _fh.close()
+        # the new log's counters are re-read from it
+        _records, _first_ts = None, None
+    if _fh is None or _fh.closed:
+        _fh = open(WAL_FILE, "a", encoding="utf-8")
+    return _fh
+
+
+def _scan(path: str) -> List[Dict[str, Any]]:
+    out: List[Dict[str, Any]] = []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rec = json.loads(line)
+                except Exception:
+                    # torn tail after a crash: everything before it is still valid
+                    continue
+                if isinstance(rec, dict):
+                    out.append(rec)
+    except FileNotFoundError:
+        pass
+    return out
+
+
+def _stats():
+    global _records, _first_ts
+    if _records is None:
+        recs = _scan(WAL_FILE)
+        _records = len(recs)
+        _first_ts = recs[0].get("ts") if recs else None
+    return _records, _first_ts
+
+
+# -------------------------
+# Logging
+# -------------------------
+def log(rec: Dict[str, Any]):
+    """Append one record (flushed to the OS; fsync happens in sync()/checkpoint)."""
+    global _records, _first_ts
+    rec = dict(rec)
+    rec.setdefault("ts", time.time())
+    f = _open()
+    _stats()
+    f.write(json.dumps(rec, ensure_ascii=False, separators=(",", ":")) + "\n")
+    f.flush()
+    _records += 1
+    if _first_ts is None:
+        _first_ts = rec["ts"]
+
+
+def log_price(route_id: str, point: Dict[str, Any]):
+    log({"op": "price", "id": route_id, "date": point.get("date"), "price": point.get("price")})
+
+
+def log_stat(route_id: str, key: str, value: int):
+    log({"op": "stat", "id": route_id, "key": key, "value": value})
+
+
+def log_set(route_id: str, fields: Dict[str, Any]):
+    log({"op": "set", "id": route_id, "fields": fields})
+
+
+def sync():
+    if _fh is not None and not _fh.closed:
+        _fh.flush()
+        try:
+            os.fsync(_fh.fileno())
+        except Exception:
+            pass
+
+
+# -------------------------
+# Replay / checkpoint
+# -------------------------
+def apply(routes: List[Dict[str, Any]], records: List[Dict[str, Any]]) -> int:
+    """Apply records onto routes (in place). Returns the number of records applied."""
+    by_id = {r.get("id"): r for r in routes}
+    n = 0
+    for rec in records:
+        r = by_id.get(rec.get("id"))
+        if r is None:
+            continue
+        op = rec.get("op")
+        if op == "price":
+            d = rec.get("date")
+            if d and (not r.get("last_tracked") or str(d) > str(r.get("last_tracked"))):
+                r["last_tracked"] = d
+        elif op == "stat":
+            r.setdefault("stats", {})[rec.get("key")] = rec.get("value")
+        elif op == "set":
+            r.update(rec.get("fields") or {})
+        else:
+            continue
+        n += 1
+    return n
+
+
+def partition_files() -> List[str]:
+    """Logs written by sharded workers (routes.wal.<i>-of-<N>)."""
+    d = os.path.dirname(MAIN_WAL_FILE) or "."
+    try:
+        names = sorted(n for n in os.listdir(d) if _PARTITION_RE.match(n))
+    except OSError:
+        return []
+    return [os.path.join(d, n) for n in names]
+
+
+def absorbed_ts() -> float:
+    """Timestamp of the newest partition record already in the snapshot."""
+    try:
+        with open(MARK_FILE, "r", encoding="utf-8") as f:
+            return float(json.load(f).get("partition_ts") or 0)
+    except Exception:
+        return 0.0
+
+
+def mark_absorbed():
+    """Called right after a snapshot was written: its partition records are absorbed."""
+    if _seen_partition_ts > absorbed_ts():
+        atomic_write(MARK_FILE, json.dumps({"partition_ts": _seen_partition_ts}).encode("utf-8"))
+
+
+def replay(routes: List[Dict[str, Any]], include_prev: bool = False) -> int:
+    """
+    Replay the log (plus the partition records not yet absorbed by the
+    snapshot) on top of a freshly loaded snapshot.
+    """
+    global _seen_partition_ts
+    records = (_scan(f"{MAIN_WAL_FILE}.prev") if include_prev else []) + _scan(MAIN_WAL_FILE)
+    mark = absorbed_ts()
+    parts = []
+    for path in partition_files():
+        parts.extend(rec for rec in _scan(path) if float(rec.get("ts") or 0) > mark)
+    _seen_partition_ts = max([mark] + [float(rec.get("ts") or 0) for rec in parts])
+    if parts:
+        # stable: records of one log keep their order
+        records = sorted(records + parts, key=lambda rec: float(rec.get("ts") or 0))
+    return apply(routes, records)
+
+
+def checkpoint_due(now: Optional[float] = None) -> bool:
+    count, first_ts = _stats()
+    if count == 0:
+        return False
+    if count >= CHECKPOINT_RECORDS:
+        return True
+    now = now if now is not None else time.time()
+    return first_ts is not None and now - float(first_ts) >= CHECKPOINT_SECONDS
+
+
+def rotate(since: Optional[float] = None):
+    """
+    Called right after a snapshot was written: the current log becomes .prev.
+    ``since`` is when the caller replayed the log into that snapshot: records
+    other processes appended after it are not in the snapshot and are copied
+    into the new log.
+    """
+    global _fh, _records, _first_ts
+    if _fh is not None and not _fh.closed:
+        sync()
+        _fh.close()
+    _fh = None
+    _records, _first_ts = 0, None
+    if os.path.exists(WAL_FILE):
+        os.replace(WAL_FILE, WAL_PREV_FILE)
+        if since is not None:
+            for rec in _scan(WAL_PREV_FILE):
+                if float(rec.get("ts") or 0) > since:
+                    log(rec)
+            sync()
+
+
+def _key(rec: Dict[str, Any]):
+    op = rec.get("op")
+    if op == "stat":
+        return (op, rec.get("id"), rec.get("key"))
+    if op == "set":
+        return (op, rec.get("id"), tuple(sorted((rec.get("fields") or {}).keys())))
+    return (op, rec.get("id"))
+
+
+def compact():
+    """
+    Rewrite the current log keeping only the last record per (op, id, key):
+    used by sharded workers, which do not checkpoint into the snapshot.
+    """
+    global _fh, _records, _first_ts
+    if _fh is not None and not _fh.closed:
+        _fh.close()
+    _fh = None
+    last: Dict[Any, Dict[str, Any]] = {}
+    # records already absorbed by the main snapshot are dropped
+    mark = absorbed_ts() if WAL_FILE != MAIN_WAL_FILE else 0.0
+    for rec in _scan(WAL_FILE):
+        if float(rec.get("ts") or 0) <= mark:
+            continue
+        last.pop(_key(rec), None)
+        last[_key(rec)] = rec
+    recs = list(last.values())
+    atomic_write(WAL_FILE, "".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n"
+                                   for r in recs).encode("utf-8"))
+    # the compacted log no longer counts toward the next compaction
+    _records, _first_ts = 0, None
+    return len(recs)
+
+
+def use_file(path: str):
+    """Log into another file from now on (sharded workers: routes.wal.<i>-of-<N>)."""
+    global WAL_FILE, WAL_PREV_FILE, _fh, _records, _first_ts
+    if _fh is not None and not _fh.closed:
+        sync()
+        _fh.close()
+    _fh = None
+    WAL_FILE, WAL_PREV_FILE = path, f"{path}.prev"
+    _records, _first_ts = None, None
+
+
+def paths() -> List[str]:
+    return [WAL_FILE, WAL_PREV_FILE, MARK_FILE]
+
+
+def size() -> int:
+    """Size in bytes of the main + partition logs (cheap change marker for readers)."""
+    total = 0
+    for path in [MAIN_WAL_FILE] + partition_files():
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            pass
+    return total